@@ -1,28 +1,21 @@
 import pandas as pd
-from indicate import transliterate
-from tqdm import tqdm
 import warnings
-import sys
 warnings.filterwarnings('ignore')
 
-INPUT_FILE = '../data/hindi_names_religion.csv.gz'
+from utilities.translit import transliterate_names
 
-print(f"Loading data from {INPUT_FILE}...")
-df = pd.read_csv(INPUT_FILE, compression='gzip')
-print(f"Loaded {len(df)} rows")
+INPUT_FILE = '../data/hindi_names_religion.csv.gz'
 
-cache = {}
-def hin_to_eng(name):
-    words = []
-    for word in str(name).split():
-        if word not in cache:
-            cache[word] = transliterate.hindi2english(word)
-        words.append(cache[word])
-    return ' '.join(words).strip()
+# Guarded: the transliteration process pool may re-import this module
+if __name__ == "__main__":
+    print(f"Loading data from {INPUT_FILE}...")
+    df = pd.read_csv(INPUT_FILE, compression='gzip')
+    print(f"Loaded {len(df)} rows")
 
-print("Starting transliteration...")
-tqdm.pandas()
-df['eng_name'] = df['name'].progress_apply(hin_to_eng)
+    # Unique tokens are transliterated in a process pool and cached on disk
+    # (utilities.translit.TOKEN_CACHE), so re-runs only do new tokens
+    print("Starting transliteration...")
+    df['eng_name'] = transliterate_names(df['name'])
 
-print("Saving results...")
-df.to_parquet("../data/hindi_names_religion_translated.parquet", index=False)
+    print("Saving results...")
+    df.to_parquet("../data/hindi_names_religion_translated.parquet", index=False)
@@ -1,22 +1,34 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
+import hashlib
 import json
 import random
+import sys
 import time
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import pandas as pd
 import pyarrow as pa
 import pyarrow.compute as pc
+import pyarrow.json as pa_json
 import pyarrow.parquet as pq
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from pydantic import ValidationError
 from tqdm import tqdm
 
-from prompt import SYSTEM_PROMPT
-from schema import BatchAnnotationResponse, IndexedNameAnnotationResponse, NameAnnotationRecord
+# scripts/ (for the utilities package), whichever module is imported first
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cache import AnnotationCache, normalize_name  # noqa: E402
+from prompt import SYSTEM_PROMPT  # noqa: E402
+from rules import split_by_rules  # noqa: E402
+from sinks import ANNOTATION_SCHEMA, ArrowSink, JsonlSink, TeeSink, read_arrow_annotations  # noqa: E402
+from schema import BatchAnnotationResponse, IndexedNameAnnotationResponse, NameAnnotationRecord  # noqa: E402
+from utilities import profiling  # noqa: E402
 
 
 # ============================================================
@@ -26,9 +38,28 @@ from schema import BatchAnnotationResponse, IndexedNameAnnotationResponse, NameA
 # - Logs missing items to a separate JSONL (for optional later repair).
 # - Resume works by skipping names already in output JSONL.
 # - Optional final "left-merge" back to original names to produce a parquet.
+# - Optional async mode (--concurrency N): N requests in flight under a
+#   requests/min + tokens/min token bucket, results written in input order.
+# - Failed/partial batches are retried (bisected) up to --max-retries times;
+#   --adaptive sizes batches from the token budget; --repair re-submits the
+#   names logged to --missing-output.
+# - Optional SQLite cache (--cache): names are keyed by normalize_name, so
+#   variants share one API call and results are reused across runs.
+# - --output-format arrow: output is a directory of Arrow IPC parts plus a
+#   manifest (sinks.py), read columnar for resume/merge; --audit-jsonl keeps
+#   a text copy.
+# - Optional rule-based pre-classifier (--rules): names with unambiguous
+#   markers (rules.py) are written without an API call.
+# - Run statistics (requests/s, tokens/s, transient retries, missing rate)
+#   are printed at the end; --report also writes them, with the stage
+#   timings and memory of utilities/profiling.py, to JSON.
 # ============================================================
 
 
+# Cached annotations are only reused for the exact same system prompt
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
 # --------- Rate limiting + retries ----------
 @dataclass
 class Throttle:
@@ -46,20 +77,102 @@ class Throttle:
         self.last_t = time.time()
 
 
-def retry_with_backoff(fn, *, max_attempts: int = 8, base_delay: float = 1.0) -> Any:
+def _is_transient(e: Exception) -> bool:
+    msg = str(e).lower()
+    transient = ("rate limit", "429", "timeout", "connection", "temporarily", "overloaded")
+    return any(sig in msg for sig in transient)
+
+
+def retry_with_backoff(
+    fn, *, max_attempts: int = 8, base_delay: float = 1.0, on_retry: Optional[Callable[[Exception], None]] = None
+) -> Any:
     delay = base_delay
     for attempt in range(max_attempts):
         try:
             return fn()
         except Exception as e:
-            msg = str(e).lower()
-            transient = ("rate limit", "429", "timeout", "connection", "temporarily", "overloaded")
-            if not any(sig in msg for sig in transient) or attempt == max_attempts - 1:
+            if not _is_transient(e) or attempt == max_attempts - 1:
                 raise
+            if on_retry is not None:
+                on_retry(e)
             time.sleep(delay + random.uniform(0, 0.2 * delay))
             delay *= 2
 
 
+async def retry_with_backoff_async(
+    fn, *, max_attempts: int = 8, base_delay: float = 1.0, on_retry: Optional[Callable[[Exception], None]] = None
+) -> Any:
+    """Same policy as retry_with_backoff, for a coroutine function."""
+    delay = base_delay
+    for attempt in range(max_attempts):
+        try:
+            return await fn()
+        except Exception as e:
+            if not _is_transient(e) or attempt == max_attempts - 1:
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            await asyncio.sleep(delay + random.uniform(0, 0.2 * delay))
+            delay *= 2
+
+
+@dataclass
+class TokenBucket:
+    """
+    Async limiter for both requests/min and tokens/min (0 = unlimited).
+
+    Each bucket holds up to one minute of budget and refills continuously.
+    Requests reserve an estimated token count up front; settle() corrects the
+    token bucket with the usage the API actually reported.
+    """
+
+    rpm: float
+    tpm: float
+    _requests: float = field(init=False, repr=False)
+    _tokens: float = field(init=False, repr=False)
+    _last_t: float = field(init=False, repr=False)
+    _lock: asyncio.Lock = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._requests = self.rpm
+        self._tokens = self.tpm
+        self._last_t = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_t
+        self._last_t = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    async def acquire(self, tokens: int) -> int:
+        """Wait for one request and `tokens` of budget; returns the tokens reserved."""
+        # A request larger than the whole per-minute budget waits for a full bucket
+        tokens = min(tokens, self.tpm) if self.tpm > 0 else 0
+        async with self._lock:
+            while True:
+                self._refill()
+                need_req = 1 - self._requests if self.rpm > 0 else 0.0
+                need_tok = tokens - self._tokens if self.tpm > 0 else 0.0
+                if need_req <= 0 and need_tok <= 0:
+                    if self.rpm > 0:
+                        self._requests -= 1
+                    if self.tpm > 0:
+                        self._tokens -= tokens
+                    return tokens
+                wait = max(
+                    need_req * 60.0 / self.rpm if self.rpm > 0 else 0.0,
+                    need_tok * 60.0 / self.tpm if self.tpm > 0 else 0.0,
+                )
+                await asyncio.sleep(wait + random.uniform(0, 0.05))
+
+    def settle(self, reserved: int, actual: int) -> None:
+        """Return over-reserved tokens (or charge the shortfall) after a call; `reserved` is what acquire() returned."""
+        if self.tpm > 0:
+            self._tokens = min(self.tpm, self._tokens + reserved - actual)
+
+
 def _format_user_input(items: List[Tuple[int, str]]) -> str:
     """User message pins (idx,name) pairs and asks the model to echo idx."""
     n = len(items)
@@ -75,14 +188,138 @@ def _format_user_input(items: List[Tuple[int, str]]) -> str:
     )
 
 
+@dataclass
+class RunStats:
+    """API throughput, retries and outcomes of one run (see summary())."""
+
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    retries: int = 0  # transient errors retried by retry_with_backoff
+    written: int = 0  # names annotated through the API
+    missing: int = 0  # names still missing after --max-retries
+    started: float = field(default_factory=time.perf_counter, repr=False)
+
+    def on_usage(self, usage: Any, n_returned: int) -> None:
+        self.requests += 1
+        self.input_tokens += getattr(usage, "input_tokens", None) or 0
+        self.output_tokens += getattr(usage, "output_tokens", None) or 0
+
+    def on_retry(self, e: Exception) -> None:
+        self.retries += 1
+
+    def summary(self) -> Dict[str, Any]:
+        seconds = max(time.perf_counter() - self.started, 1e-9)
+        tokens = self.input_tokens + self.output_tokens
+        attempted = self.written + self.missing
+        return {
+            "seconds": round(seconds, 3),
+            "requests": self.requests,
+            "requests_per_s": round(self.requests / seconds, 3),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "tokens_per_s": round(tokens / seconds, 1),
+            "retries": self.retries,
+            "written": self.written,
+            "missing": self.missing,
+            "missing_rate": round(self.missing / attempted, 5) if attempted else 0.0,
+        }
+
+
+def _usage_hooks(*hooks: Optional[Callable[[Any, int], None]]) -> Callable[[Any, int], None]:
+    def on_usage(usage: Any, n_returned: int) -> None:
+        for hook in hooks:
+            if hook is not None:
+                hook(usage, n_returned)
+
+    return on_usage
+
+
+# Rough sizes for the tokens/min limiter: ~4 UTF-8 bytes per token (Devanagari
+# is 3 bytes per character), and ~80 output tokens per annotation object.
+BYTES_PER_TOKEN = 4
+OUTPUT_TOKENS_PER_ITEM = 80
+SYSTEM_PROMPT_TOKENS = len(SYSTEM_PROMPT.encode("utf-8")) // BYTES_PER_TOKEN
+
+
+def estimate_request_tokens(items: List[Tuple[int, str]], max_output_tokens: int) -> int:
+    """Estimated prompt + completion tokens of one annotate_items_once call."""
+    prompt = SYSTEM_PROMPT_TOKENS + len(_format_user_input(items).encode("utf-8")) // BYTES_PER_TOKEN
+    return prompt + min(max_output_tokens, OUTPUT_TOKENS_PER_ITEM * len(items))
+
+
+def _parsed_annotations(resp: Any, on_usage: Optional[Callable[[Any, int], None]]) -> List[IndexedNameAnnotationResponse]:
+    # A response cut off by max_output_tokens may carry no parsed output at all
+    parsed: Optional[BatchAnnotationResponse] = resp.output_parsed
+    anns = parsed.annotations if parsed is not None else []
+    if on_usage is not None:
+        on_usage(getattr(resp, "usage", None), len(anns))
+    return anns
+
+
+@dataclass
+class AdaptiveChunker:
+    """
+    Sizes batches so the expected output fits in max_output_tokens (with a
+    safety margin) and, if set, the whole request fits in max_request_tokens.
+
+    Output tokens per item start at OUTPUT_TOKENS_PER_ITEM and follow the
+    usage observed per returned annotation (moving average); a response that
+    hits max_output_tokens raises the estimate by 25%.
+    """
+
+    max_output_tokens: int
+    max_chunk_size: int = 200
+    max_request_tokens: int = 0
+    safety: float = 0.8
+    tokens_per_item: float = OUTPUT_TOKENS_PER_ITEM
+
+    def size(self) -> int:
+        n = int(self.safety * self.max_output_tokens / self.tokens_per_item)
+        return max(1, min(self.max_chunk_size, n))
+
+    def observe(self, usage: Any, n_returned: int) -> None:
+        output_tokens = getattr(usage, "output_tokens", None)
+        if output_tokens is None:
+            return
+        if output_tokens >= 0.95 * self.max_output_tokens:
+            self.tokens_per_item *= 1.25
+        elif n_returned:
+            self.tokens_per_item = 0.8 * self.tokens_per_item + 0.2 * output_tokens / n_returned
+
+    def chunks(self, names: Iterable[str]) -> Iterator[List[str]]:
+        buffer: List[str] = []
+        prompt_tokens = SYSTEM_PROMPT_TOKENS
+        for name in names:
+            # ~10 tokens of JSON around each name in ITEMS_JSON
+            name_tokens = len(name.encode("utf-8")) // BYTES_PER_TOKEN + 10
+            request_tokens = prompt_tokens + name_tokens + self.tokens_per_item * (len(buffer) + 1)
+            if buffer and self.max_request_tokens > 0 and request_tokens > self.max_request_tokens:
+                yield buffer
+                buffer, prompt_tokens = [], SYSTEM_PROMPT_TOKENS
+            buffer.append(name)
+            prompt_tokens += name_tokens
+            if len(buffer) >= self.size():
+                yield buffer
+                buffer, prompt_tokens = [], SYSTEM_PROMPT_TOKENS
+        if buffer:
+            yield buffer
+
+
 def annotate_items_once(
     client: OpenAI,
     model: str,
     items: List[Tuple[int, str]],
     max_output_tokens: int,
     throttle: Throttle,
+    on_usage: Optional[Callable[[Any, int], None]] = None,
+    on_retry: Optional[Callable[[Exception], None]] = None,
 ) -> List[IndexedNameAnnotationResponse]:
-    """Single attempt: may return fewer items; caller decides what to do."""
+    """
+    Single attempt: may return fewer items; caller decides what to do.
+    on_usage(usage, n_returned) is called with the response's token usage,
+    on_retry(error) for every transient error retried.
+    """
 
     def _call():
         throttle.wait()
@@ -94,15 +331,47 @@ def annotate_items_once(
             max_output_tokens=max_output_tokens,
         )
 
-    resp = retry_with_backoff(_call)
-    parsed: BatchAnnotationResponse = resp.output_parsed
-    return parsed.annotations
+    resp = retry_with_backoff(_call, on_retry=on_retry)
+    return _parsed_annotations(resp, on_usage)
+
+
+async def annotate_items_once_async(
+    client: AsyncOpenAI,
+    model: str,
+    items: List[Tuple[int, str]],
+    max_output_tokens: int,
+    limiter: TokenBucket,
+    on_usage: Optional[Callable[[Any, int], None]] = None,
+    on_retry: Optional[Callable[[Exception], None]] = None,
+) -> List[IndexedNameAnnotationResponse]:
+    """Async counterpart of annotate_items_once, rate limited by `limiter`."""
+    estimated = estimate_request_tokens(items, max_output_tokens)
+    reserved = 0
+
+    async def _call():
+        nonlocal reserved
+        reserved = await limiter.acquire(estimated)
+        return await client.responses.parse(
+            model=model,
+            instructions=SYSTEM_PROMPT,
+            input=[{"role": "user", "content": _format_user_input(items)}],
+            text_format=BatchAnnotationResponse,
+            max_output_tokens=max_output_tokens,
+        )
+
+    resp = await retry_with_backoff_async(_call, on_retry=on_retry)
+    usage = getattr(resp, "usage", None)
+    if usage is not None and getattr(usage, "total_tokens", None) is not None:
+        limiter.settle(reserved, usage.total_tokens)
+    return _parsed_annotations(resp, on_usage)
 
 
 def load_done_names(path: Path) -> set[str]:
     """Load names already written to output (for resume only)."""
     if not path.exists():
         return set()
+    if path.is_dir():
+        return set(read_arrow_annotations(path, columns=["name"])["name"].drop_null().to_pylist())
     names: set[str] = set()
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
@@ -123,65 +392,537 @@ def write_missing(missing_path: Path, names: List[str], reason: str) -> None:
             f.write(json.dumps({"name": nm, "reason": reason}, ensure_ascii=False) + "\n")
 
 
+def load_missing_names(path: Path) -> List[str]:
+    """Unique names logged by write_missing, in first-logged order (for --repair)."""
+    names: Dict[str, None] = {}
+    if not path.exists():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                nm = json.loads(line).get("name")
+            except json.JSONDecodeError:
+                continue
+            if nm:
+                names[nm] = None
+    return list(names)
+
+
+def iter_new_names(pf: pq.ParquetFile, column: str, done_names: set[str], max_rows: int) -> Iterator[str]:
+    """Stripped, non-empty names from the input not yet in `done_names`."""
+    seen = 0
+    for batch in pf.iter_batches(batch_size=50_000, columns=[column]):
+        for raw in batch.column(0).to_pylist():
+            if raw is None:
+                continue
+
+            name = str(raw).strip()
+            if not name:
+                continue
+
+            seen += 1
+            if max_rows > 0 and seen > max_rows:
+                return
+
+            if name in done_names:
+                continue
+
+            yield name
+
+
+def iter_chunks(names: Iterable[str], chunk_size: int) -> Iterator[List[str]]:
+    buffer: List[str] = []
+    for name in names:
+        buffer.append(name)
+        if len(buffer) >= chunk_size:
+            yield buffer
+            buffer = []
+    if buffer:
+        yield buffer
+
+
+@dataclass
+class BatchResult:
+    """Annotations of one input batch after retries, and what is still missing."""
+
+    records: List[NameAnnotationRecord] = field(default_factory=list)
+    missing: Dict[str, str] = field(default_factory=dict)  # name -> reason
+
+
+def _collect(names: List[str], anns: List[IndexedNameAnnotationResponse], result: BatchResult) -> List[str]:
+    """Add the validated annotations to `result`; return the names without one."""
+    # Build idx->ann map, accept only sane idxs
+    ann_map: Dict[int, IndexedNameAnnotationResponse] = {}
+    for ann in anns:
+        if 0 <= ann.idx < len(names):
+            ann_map[ann.idx] = ann
+
+    missing: List[str] = []
+    for idx, nm in enumerate(names):
+        ann = ann_map.get(idx)
+        if ann is None:
+            missing.append(nm)
+            continue
+        result.records.append(NameAnnotationRecord.from_idx_and_ann(name=nm, idx=idx, ann=ann))
+    return missing
+
+
+def _retry_batches(names: List[str], missing: List[str]) -> List[List[str]]:
+    """A wholly failed batch is bisected; the missing part of a partial batch is resubmitted."""
+    if len(missing) == len(names) and len(missing) > 1:
+        mid = len(missing) // 2
+        return [missing[:mid], missing[mid:]]
+    return [missing]
+
+
+def annotate_with_retries(
+    annotate_fn: Callable[[List[Tuple[int, str]]], List[IndexedNameAnnotationResponse]],
+    names: List[str],
+    max_retries: int,
+    result: Optional[BatchResult] = None,
+    attempt: int = 0,
+) -> BatchResult:
+    result = result if result is not None else BatchResult()
+    try:
+        anns = annotate_fn(list(enumerate(names)))
+        reason = "missing_output_in_batch"
+    except ValidationError as e:
+        tqdm.write(f"⚠️  Schema validation error for batch size {len(names)}: {e}")
+        anns, reason = [], "schema_validation_error"
+
+    missing = _collect(names, anns, result)
+    if missing and attempt >= max_retries:
+        result.missing.update(dict.fromkeys(missing, reason))
+    elif missing:
+        for retry in _retry_batches(names, missing):
+            annotate_with_retries(annotate_fn, retry, max_retries, result, attempt + 1)
+    return result
+
+
+async def annotate_with_retries_async(
+    annotate_fn: Callable[[List[Tuple[int, str]]], Any],
+    names: List[str],
+    max_retries: int,
+    result: Optional[BatchResult] = None,
+    attempt: int = 0,
+) -> BatchResult:
+    """Async counterpart of annotate_with_retries (retries run within the caller's slot)."""
+    result = result if result is not None else BatchResult()
+    try:
+        anns = await annotate_fn(list(enumerate(names)))
+        reason = "missing_output_in_batch"
+    except ValidationError as e:
+        tqdm.write(f"⚠️  Schema validation error for batch size {len(names)}: {e}")
+        anns, reason = [], "schema_validation_error"
+
+    missing = _collect(names, anns, result)
+    if missing and attempt >= max_retries:
+        result.missing.update(dict.fromkeys(missing, reason))
+    elif missing:
+        for retry in _retry_batches(names, missing):
+            await annotate_with_retries_async(annotate_fn, retry, max_retries, result, attempt + 1)
+    return result
+
+
+def write_batch(
+    sink,
+    result: BatchResult,
+    done_names: set[str],
+    missing_path: Optional[Path],
+    fsync: bool = False,
+    stats: Optional[RunStats] = None,
+) -> int:
+    """Write the annotations of one batch; log missing items. Returns #written."""
+    if stats is not None:
+        stats.written += len(result.records)
+        stats.missing += len(result.missing)
+    sink.write(result.records)
+    sink.flush(fsync)
+    for rec in result.records:
+        done_names.add(rec.name)
+
+    if result.missing:
+        tqdm.write(
+            f"⚠️  {len(result.missing)} item(s) still missing after retries "
+            f"({len(result.records)} written; continuing)."
+        )
+        if missing_path:
+            for reason in sorted(set(result.missing.values())):
+                write_missing(
+                    missing_path,
+                    [nm for nm, r in result.missing.items() if r == reason],
+                    reason=reason,
+                )
+
+    return len(result.records)
+
+
+class RulesFrontend:
+    """Writes the names rules.classify can decide (idx=-1); yields the rest for the API."""
+
+    def __init__(self, sink, done_names, pbar) -> None:
+        self.sink = sink
+        self.done_names = done_names
+        self.pbar = pbar
+        self.hits = 0
+
+    def filter(self, names: Iterable[str]) -> Iterator[str]:
+        for name, rec in split_by_rules(names):
+            if rec is None:
+                yield name
+                continue
+            self.sink.write([rec])
+            self.done_names.add(name)
+            self.pbar.update(1)
+            self.hits += 1
+
+
+class CacheFrontend:
+    """
+    Sits between the input names and the API when --cache is given.
+
+    Cache hits are written straight to the output (idx=-1). Of the uncached
+    names, only the first with a given normalized key is sent to the API;
+    later variants wait on it and are filled in by resolve().
+    """
+
+    def __init__(self, cache: AnnotationCache, sink, done_names, pbar) -> None:
+        self.cache = cache
+        self.sink = sink
+        self.done_names = done_names
+        self.pbar = pbar
+        self.pending: Dict[Tuple[str, str], List[str]] = {}
+        self.hits = 0
+
+    def filter(self, names: Iterable[str]) -> Iterator[str]:
+        for name in names:
+            key = normalize_name(name)
+            cached = self.cache.lookup(key)
+            if cached is not None:
+                rec = NameAnnotationRecord(idx=-1, name=name, **cached)
+                self.sink.write([rec])
+                self.done_names.add(name)
+                self.pbar.update(1)
+                self.hits += 1
+                if self.hits % 1000 == 0:
+                    self.sync()
+                continue
+            if key in self.pending:
+                self.pending[key].append(name)
+                continue
+            self.pending[key] = []
+            yield name
+
+    def resolve(self, result: BatchResult) -> None:
+        """Cache the batch's annotations and extend them to waiting variants."""
+        for rec in list(result.records):
+            key = normalize_name(rec.name)
+            self.cache.store(key, rec.model_dump(exclude={"idx", "name"}))
+            for variant in self.pending.pop(key, []):
+                result.records.append(rec.model_copy(update={"name": variant}))
+        for name, reason in list(result.missing.items()):
+            for variant in self.pending.pop(normalize_name(name), []):
+                result.missing[variant] = reason
+
+    def sync(self) -> None:
+        # Output lines must be on disk before the cache records them as emitted
+        self.sink.flush(fsync=True)
+        self.cache.commit()
+
+
+def _chunker(args) -> Tuple[Optional[AdaptiveChunker], Callable[[Iterable[str]], Iterator[List[str]]]]:
+    if not args.adaptive:
+        return None, lambda names: iter_chunks(names, args.chunk_size)
+    chunker = AdaptiveChunker(
+        max_output_tokens=args.max_output_tokens,
+        max_chunk_size=args.max_chunk_size,
+        max_request_tokens=int(args.tpm),
+    )
+    return chunker, chunker.chunks
+
+
+def run_sync(
+    args,
+    names: Iterable[str],
+    sink,
+    done_names: set[str],
+    missing_path: Optional[Path],
+    pbar,
+    frontend: Optional[CacheFrontend] = None,
+    stats: Optional[RunStats] = None,
+) -> None:
+    stats = stats if stats is not None else RunStats()
+    client = OpenAI(base_url=args.base_url or None)
+    throttle = Throttle(rpm=args.rpm)
+    chunker, chunks = _chunker(args)
+
+    def annotate_fn(items: List[Tuple[int, str]]) -> List[IndexedNameAnnotationResponse]:
+        return annotate_items_once(
+            client=client,
+            model=args.model,
+            items=items,
+            max_output_tokens=args.max_output_tokens,
+            throttle=throttle,
+            on_usage=_usage_hooks(stats.on_usage, chunker.observe if chunker else None),
+            on_retry=stats.on_retry,
+        )
+
+    if frontend is not None:
+        names = frontend.filter(names)
+
+    for chunk in chunks(names):
+        result = annotate_with_retries(annotate_fn, chunk, args.max_retries)
+        if frontend is not None:
+            frontend.resolve(result)
+        successes = write_batch(sink, result, done_names, missing_path, stats=stats)
+        if frontend is not None:
+            frontend.sync()
+        if successes:
+            pbar.update(successes)
+
+
+async def run_async(
+    args,
+    names: Iterable[str],
+    sink,
+    done_names: set[str],
+    missing_path: Optional[Path],
+    pbar,
+    frontend: Optional[CacheFrontend] = None,
+    stats: Optional[RunStats] = None,
+) -> None:
+    """
+    Keep up to args.concurrency requests in flight. Results are written in
+    input order (fsync'd per batch), so after a crash the output is a clean
+    prefix of the work plus whatever load_done_names picks up on resume.
+    """
+    stats = stats if stats is not None else RunStats()
+    client = AsyncOpenAI(base_url=args.base_url or None)
+    limiter = TokenBucket(rpm=args.rpm, tpm=args.tpm)
+    in_flight = asyncio.Semaphore(args.concurrency)
+    # Bounds the completed-but-unwritten results waiting behind a slow batch
+    window = asyncio.Semaphore(4 * args.concurrency)
+    chunker, chunks = _chunker(args)
+
+    async def annotate_fn(items: List[Tuple[int, str]]) -> List[IndexedNameAnnotationResponse]:
+        return await annotate_items_once_async(
+            client=client,
+            model=args.model,
+            items=items,
+            max_output_tokens=args.max_output_tokens,
+            limiter=limiter,
+            on_usage=_usage_hooks(stats.on_usage, chunker.observe if chunker else None),
+            on_retry=stats.on_retry,
+        )
+
+    results: Dict[int, BatchResult] = {}
+    failures: List[Exception] = []
+    next_seq = 0
+
+    def flush_ready() -> None:
+        nonlocal next_seq
+        while next_seq in results:
+            result = results.pop(next_seq)
+            next_seq += 1
+            window.release()
+            if frontend is not None:
+                frontend.resolve(result)
+            successes = write_batch(sink, result, done_names, missing_path, fsync=True, stats=stats)
+            if frontend is not None:
+                frontend.cache.commit()
+            if successes:
+                pbar.update(successes)
+
+    async def annotate(seq: int, chunk: List[str]) -> None:
+        try:
+            result = await annotate_with_retries_async(annotate_fn, chunk, args.max_retries)
+        except Exception as e:
+            # Non-transient API error: stop submitting; later batches stay
+            # unwritten so the output remains an in-order prefix
+            failures.append(e)
+            window.release()
+            return
+        finally:
+            in_flight.release()
+        results[seq] = result
+        flush_ready()
+
+    if frontend is not None:
+        names = frontend.filter(names)
+
+    tasks: set = set()
+    try:
+        for seq, chunk in enumerate(chunks(names)):
+            await window.acquire()
+            await in_flight.acquire()
+            if failures:
+                break
+            task = asyncio.create_task(annotate(seq, chunk))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await client.close()
+
+    if failures:
+        raise failures[0]
+
+
+def _read_annotations_jsonl(annotations_jsonl: Path, block_rows: int) -> pa.Table:
+    try:
+        return pa_json.read_json(
+            annotations_jsonl,
+            parse_options=pa_json.ParseOptions(
+                explicit_schema=ANNOTATION_SCHEMA, unexpected_field_behavior="ignore"
+            ),
+        )
+    except pa.ArrowInvalid:
+        blocks, rows = [], []
+        with open(annotations_jsonl, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+                if len(rows) >= block_rows:
+                    blocks.append(pa.Table.from_pylist(rows, schema=ANNOTATION_SCHEMA))
+                    rows = []
+        blocks.append(pa.Table.from_pylist(rows, schema=ANNOTATION_SCHEMA))
+        return pa.concat_tables(blocks)
+
+
+def read_annotations(annotations: Path, block_rows: int = 100_000) -> pa.Table:
+    """
+    Annotation output (JSONL file or ArrowSink directory) as an Arrow table,
+    one row per name (first occurrence).
+
+    JSONL is parsed with pyarrow's JSON reader; if that fails (e.g. a line
+    torn by an interrupted run) falls back to skipping undecodable lines,
+    converting `block_rows` lines at a time.
+    """
+    if annotations.is_dir():
+        table = read_arrow_annotations(annotations)
+    else:
+        table = _read_annotations_jsonl(annotations, block_rows)
+
+    table = table.filter(pc.is_valid(table["name"]))
+    first = (
+        table.append_column("_row", pa.array(range(table.num_rows), pa.int64()))
+        .group_by("name", use_threads=False)
+        .aggregate([("_row", "min")])["_row_min"]
+    )
+    return table.take(pc.take(first, pc.sort_indices(first)))
+
+
 def merge_left_to_parquet(
     input_parquet: str,
     column: str,
-    annotations_jsonl: Path,
+    annotations: Path,
     merged_parquet: Path,
+    batch_size: int = 1 << 20,
 ) -> None:
     """
     Left-merge annotations back onto the original parquet (by exact name string).
     Output is a parquet with original columns plus annotation fields where available.
-    """
-    # Read original table (could be large; for unique names parquet it's usually manageable).
-    left = pq.read_table(input_parquet)
 
-    # Read annotations jsonl
-    rows = []
-    with open(annotations_jsonl, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                rows.append(json.loads(line))
-            except json.JSONDecodeError:
-                continue
-
-    if not rows:
+    Streams the input `batch_size` rows at a time (row order is kept); only
+    the columnar annotation table is held in memory.
+    """
+    right = read_annotations(annotations)
+    if right.num_rows == 0:
         raise RuntimeError("No annotations found; nothing to merge.")
 
-    right = pa.Table.from_pylist(rows)
-
-    # Ensure join key exists on both sides.
-    if column not in left.column_names:
+    pf = pq.ParquetFile(input_parquet)
+    left_schema = pf.schema_arrow
+    if column not in left_schema.names:
         raise KeyError(f"Column '{column}' not found in input parquet.")
 
-    if "name" not in right.column_names:
-        raise KeyError("Field 'name' not found in annotations JSONL.")
-
-    # Left join: left[column] == right['name']
-    # Use pyarrow join (requires same type)
-    left_key = pc.cast(left[column], pa.string())
-    right_key = pc.cast(right["name"], pa.string())
-
-    left2 = left.set_column(left.schema.get_field_index(column), column, left_key)
-    right2 = right.set_column(right.schema.get_field_index("name"), "name", right_key)
-
-    merged = left2.join(right2, keys=[column], right_keys=["name"], join_type="left outer")
+    # Join key is compared as string, as in the annotation output
+    key_index = left_schema.get_field_index(column)
+    left_schema = left_schema.set(key_index, pa.field(column, pa.string()))
+    # Hash index of the annotated names, built once for all batches
+    # (pc.index_in would rebuild it per batch)
+    right_index = pd.Index(right["name"].to_pandas())
+    right_values = right.drop_columns(["name"])
+    schema = pa.schema(list(left_schema) + list(right_values.schema))
 
     merged_parquet.parent.mkdir(parents=True, exist_ok=True)
-    pq.write_table(merged, merged_parquet)
+    with pq.ParquetWriter(merged_parquet, schema) as writer:
+        for batch in pf.iter_batches(batch_size=batch_size):
+            key = pc.cast(batch.column(key_index), pa.string())
+            # Row of each name in `right` (null where not annotated)
+            pos = right_index.get_indexer(key.to_pandas())
+            pos = pa.array(pos, mask=pos < 0)
+            columns = list(batch.columns)
+            columns[key_index] = key
+            columns += right_values.take(pos).columns
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
 
 
 def main() -> None:
     ap = argparse.ArgumentParser(description="Annotate Bihar land record names (tolerant, resumable)")
     ap.add_argument("--input", required=True, help="Input parquet path (should contain unique names)")
     ap.add_argument("--column", required=True, help="Column with name strings")
-    ap.add_argument("--output", required=True, help="Output JSONL path for annotations")
+    ap.add_argument(
+        "--output",
+        required=True,
+        help="Output path for annotations: a JSONL file, or a directory with --output-format arrow",
+    )
+    ap.add_argument(
+        "--output-format",
+        choices=["jsonl", "arrow"],
+        default="jsonl",
+        help="jsonl: one line per record; arrow: Arrow IPC part files plus a manifest",
+    )
+    ap.add_argument("--part-rows", type=int, default=1_000_000, help="Rows per Arrow part file")
+    ap.add_argument("--audit-jsonl", default="", help="Optional JSONL copy of the records (with --output-format arrow)")
     ap.add_argument("--missing-output", default="", help="Optional JSONL path to log missing items")
     ap.add_argument("--model", default="gpt-4o-mini")
     ap.add_argument("--chunk-size", type=int, default=25)
+    ap.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Size batches from the output token budget (up to --max-chunk-size) instead of --chunk-size",
+    )
+    ap.add_argument("--max-chunk-size", type=int, default=200, help="Upper bound on adaptive batch size")
+    ap.add_argument(
+        "--max-retries",
+        type=int,
+        default=2,
+        help="Times a failed/partial batch is retried (bisected) before items are logged as missing",
+    )
+    ap.add_argument(
+        "--repair",
+        action="store_true",
+        help="Re-submit only the names logged to --missing-output (instead of reading --input)",
+    )
     ap.add_argument("--max-rows", type=int, default=0, help="Cap for testing (0=all)")
     ap.add_argument("--rpm", type=float, default=60.0, help="Requests per minute (0=unlimited)")
     ap.add_argument("--max-output-tokens", type=int, default=16000)
+    ap.add_argument(
+        "--concurrency",
+        type=int,
+        default=0,
+        help="Requests in flight in async mode (0=sequential, one request at a time)",
+    )
+    ap.add_argument("--tpm", type=float, default=0.0, help="Tokens per minute in async mode (0=unlimited)")
+    ap.add_argument("--base-url", default="", help="Optional API base URL (e.g. a local stub server)")
+    ap.add_argument(
+        "--rules",
+        action="store_true",
+        help="Annotate names with unambiguous markers (rules.py) without an API call",
+    )
+    ap.add_argument(
+        "--cache",
+        default="",
+        help="Optional SQLite annotation cache keyed by normalized name, prompt version and model",
+    )
+
+    ap.add_argument("--report", default="", help="Optional JSON run report (API stats, stage timings and memory)")
+    ap.add_argument("--cprofile", default="", help="Optional cProfile stats output (for snakeviz / flameprof)")
 
     ap.add_argument(
         "--merged-parquet",
@@ -190,150 +931,91 @@ def main() -> None:
     )
 
     args = ap.parse_args()
+    if args.report or args.cprofile:
+        profiling.start(cprofile=bool(args.cprofile))
 
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
     missing_path = Path(args.missing_output) if args.missing_output else None
-
-    done_names = load_done_names(output_path)
-    if done_names:
+    if args.repair and missing_path is None:
+        ap.error("--repair needs --missing-output")
+
+    cache = AnnotationCache(Path(args.cache), args.model, PROMPT_VERSION) if args.cache else None
+    if cache is not None:
+        # Indexed lookups instead of re-reading the output JSONL on every start
+        done_names = cache.emitted(output_path)
+        if not len(done_names) and output_path.exists():
+            for nm in load_done_names(output_path):
+                done_names.add(nm)
+            cache.commit()
+    else:
+        done_names = load_done_names(output_path)
+    if len(done_names):
         print(f"Resuming: {len(done_names):,} names already annotated")
 
-    pf = pq.ParquetFile(args.input)
-    total_rows = pf.metadata.num_rows
-    if args.max_rows > 0:
-        total_rows = min(total_rows, args.max_rows)
-
-    # Progress tracks *newly written* annotations; start at existing count.
-    pbar = tqdm(total=total_rows, initial=len(done_names), desc="Names", unit="name")
-
-    client = OpenAI()
-    throttle = Throttle(rpm=args.rpm)
-
-    buffer: List[str] = []
-    seen = 0
-
-    with open(output_path, "a", encoding="utf-8") as out_f:
-        for batch in pf.iter_batches(batch_size=50_000, columns=[args.column]):
-            for raw in batch.column(0).to_pylist():
-                if raw is None:
-                    continue
-
-                name = str(raw).strip()
-                if not name:
-                    continue
-
-                seen += 1
-                if args.max_rows > 0 and seen > args.max_rows:
-                    break
-
-                if name in done_names:
-                    continue
-
-                buffer.append(name)
-
-                if len(buffer) >= args.chunk_size:
-                    items = list(enumerate(buffer))
-                    try:
-                        anns = annotate_items_once(
-                            client=client,
-                            model=args.model,
-                            items=items,
-                            max_output_tokens=args.max_output_tokens,
-                            throttle=throttle,
-                        )
-                    except ValidationError as e:
-                        tqdm.write(f"⚠️  Schema validation error for batch size {len(items)}: {e}")
-                        if missing_path:
-                            write_missing(missing_path, buffer, reason="schema_validation_error")
-                        buffer.clear()
-                        continue
-
-                    # Build idx->ann map, accept only sane idxs
-                    ann_map: Dict[int, IndexedNameAnnotationResponse] = {}
-                    for ann in anns:
-                        if 0 <= ann.idx < len(items):
-                            ann_map[ann.idx] = ann
-
-                    # Write successes; log missing; do not crash
-                    successes = 0
-                    missing_names: List[str] = []
-
-                    for idx, nm in items:
-                        ann = ann_map.get(idx)
-                        if ann is None:
-                            missing_names.append(nm)
-                            continue
-                        rec = NameAnnotationRecord.from_idx_and_ann(name=nm, idx=idx, ann=ann)
-                        out_f.write(json.dumps(rec.model_dump(), ensure_ascii=False) + "\n")
-                        done_names.add(nm)
-                        successes += 1
-
-                    out_f.flush()
-
-                    if missing_names:
-                        tqdm.write(
-                            f"⚠️  Batch returned {len(ann_map)}/{len(items)} annotations; "
-                            f"{len(missing_names)} missing (continuing)."
-                        )
-                        if missing_path:
-                            write_missing(missing_path, missing_names, reason="missing_output_in_batch")
-
-                    if successes:
-                        pbar.update(successes)
-                    buffer.clear()
-
-            if args.max_rows > 0 and seen > args.max_rows:
-                break
-
-        # Flush remaining
-        if buffer:
-            items = list(enumerate(buffer))
-            try:
-                anns = annotate_items_once(
-                    client=client,
-                    model=args.model,
-                    items=items,
-                    max_output_tokens=args.max_output_tokens,
-                    throttle=throttle,
-                )
-            except ValidationError as e:
-                tqdm.write(f"⚠️  Schema validation error for final batch size {len(items)}: {e}")
-                if missing_path:
-                    write_missing(missing_path, buffer, reason="schema_validation_error")
-                buffer.clear()
+    if args.repair:
+        # Set the current missing log aside (appending to one left by an
+        # interrupted repair); names that fail again are logged afresh.
+        repairing = missing_path.with_name(missing_path.name + ".repairing")
+        if missing_path.exists():
+            with open(repairing, "a", encoding="utf-8") as f:
+                f.write(missing_path.read_text(encoding="utf-8"))
+            missing_path.unlink()
+        names = [nm for nm in load_missing_names(repairing) if nm not in done_names]
+        print(f"Repairing: {len(names):,} missing names")
+        pbar = tqdm(total=len(names), desc="Names", unit="name")
+    else:
+        pf = pq.ParquetFile(args.input)
+        total_rows = pf.metadata.num_rows
+        if args.max_rows > 0:
+            total_rows = min(total_rows, args.max_rows)
+
+        # Progress tracks *newly written* annotations; start at existing count.
+        pbar = tqdm(total=total_rows, initial=len(done_names), desc="Names", unit="name")
+
+        names = iter_new_names(pf, args.column, done_names, args.max_rows)
+
+    if args.output_format == "arrow":
+        sink = ArrowSink(output_path, part_rows=args.part_rows)
+    else:
+        sink = JsonlSink(output_path)
+    if args.audit_jsonl:
+        sink = TeeSink(sink, JsonlSink(Path(args.audit_jsonl)))
+
+    stats = RunStats()
+    try:
+        rules = RulesFrontend(sink, done_names, pbar) if args.rules else None
+        if rules is not None:
+            names = rules.filter(names)
+        frontend = CacheFrontend(cache, sink, done_names, pbar) if cache is not None else None
+        with profiling.stage("annotate") as record:
+            if args.concurrency > 0:
+                asyncio.run(run_async(args, names, sink, done_names, missing_path, pbar, frontend, stats))
             else:
-                ann_map: Dict[int, IndexedNameAnnotationResponse] = {}
-                for ann in anns:
-                    if 0 <= ann.idx < len(items):
-                        ann_map[ann.idx] = ann
-
-                successes = 0
-                missing_names: List[str] = []
-                for idx, nm in items:
-                    ann = ann_map.get(idx)
-                    if ann is None:
-                        missing_names.append(nm)
-                        continue
-                    rec = NameAnnotationRecord.from_idx_and_ann(name=nm, idx=idx, ann=ann)
-                    out_f.write(json.dumps(rec.model_dump(), ensure_ascii=False) + "\n")
-                    done_names.add(nm)
-                    successes += 1
-                out_f.flush()
-
-                if missing_names:
-                    tqdm.write(
-                        f"⚠️  Final batch returned {len(ann_map)}/{len(items)} annotations; "
-                        f"{len(missing_names)} missing."
-                    )
-                    if missing_path:
-                        write_missing(missing_path, missing_names, reason="missing_output_in_batch")
-
-                if successes:
-                    pbar.update(successes)
+                run_sync(args, names, sink, done_names, missing_path, pbar, frontend, stats)
+            record["rows_out"] = stats.written
+        if frontend is not None:
+            frontend.sync()
+            print(f"Cache hits: {frontend.hits:,}")
+        if rules is not None:
+            print(f"Decided by rules: {rules.hits:,}")
+    finally:
+        sink.close()
+
+    if cache is not None:
+        cache.close()
+
+    if args.repair:
+        repairing.unlink(missing_ok=True)
 
     pbar.close()
+    summary = stats.summary()
+    print(
+        f"API: {summary['requests']:,} requests ({summary['requests_per_s']:.2f}/s), "
+        f"{summary['input_tokens'] + summary['output_tokens']:,} tokens ({summary['tokens_per_s']:,.0f}/s), "
+        f"{summary['retries']:,} retries, {summary['missing']:,} missing ({summary['missing_rate']:.2%})"
+    )
     print(f"Done. Output: {output_path}")
 
     if args.missing_output:
@@ -342,14 +1024,17 @@ def main() -> None:
     if args.merged_parquet:
         merged_path = Path(args.merged_parquet)
         print("Merging annotations back onto input parquet (left join)...")
-        merge_left_to_parquet(
-            input_parquet=args.input,
-            column=args.column,
-            annotations_jsonl=output_path,
-            merged_parquet=merged_path,
-        )
+        with profiling.stage("merge_left_to_parquet"):
+            merge_left_to_parquet(
+                input_parquet=args.input,
+                column=args.column,
+                annotations=output_path,
+                merged_parquet=merged_path,
+            )
         print(f"Merged parquet: {merged_path}")
 
+    profiling.stop(args.report or None, args.cprofile or None, extra={"api": summary, "args": vars(args)})
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
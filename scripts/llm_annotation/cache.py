@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import json
+import re
+import sqlite3
+import sys
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# The name cleaner is shared with the data pipeline (scripts/utilities)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utilities.clean import clean_name  # noqa: E402
+
+# ============================================================
+# PERSISTENT ANNOTATION CACHE (SQLite):
+# - Keyed by a normalized name so spelling/punctuation variants of one name
+#   share a single API call, per prompt version and model.
+# - Also records which raw names were emitted to which output file, so resume
+#   is an indexed lookup instead of re-reading the output JSONL.
+# ============================================================
+
+# Leading honorifics, mapped to one canonical spelling. Abbreviations (मो०,
+# स्व०, डॉ०) need their mark so that e.g. मोहन is not read as मो + हन.
+HONORIFICS: Dict[str, str] = {
+    "श्रीमती": "श्रीमती",
+    "श्रीमति": "श्रीमती",
+    "सुश्री": "सुश्री",
+    "श्री": "श्री",
+    "कुमारी": "कुमारी",
+    "मो०": "मो०",
+    "मो0": "मो०",
+    "मो.": "मो०",
+    "स्व०": "स्व०",
+    "स्व0": "स्व०",
+    "स्व.": "स्व०",
+    "डॉ०": "डॉ",
+    "डॉ.": "डॉ",
+    "डॉ": "डॉ",
+}
+_ABBREVIATION_MARKS = ("०", "0", ".")
+_HONORIFIC_RE = re.compile(
+    r"^\s*("
+    + "|".join(
+        re.escape(h) + (r"\s*" if h.endswith(_ABBREVIATION_MARKS) else r"(?:\s+|$)")
+        for h in sorted(HONORIFICS, key=len, reverse=True)
+    )
+    + ")"
+)
+
+
+def normalize_name(name: str) -> Tuple[str, str]:
+    """
+    (core, honorific) cache key of a raw name.
+
+    Leading honorifics are stripped (repeatedly, e.g. "स्व० श्री") into a
+    canonical honorific feature; the rest is cleaned with
+    utilities.clean.clean_name (the clean_hindi_names rules). The honorific stays part
+    of the key because it carries gender/religion signal (श्रीमती vs श्री).
+    """
+    rest = unicodedata.normalize("NFC", name)
+    honorifics: List[str] = []
+    while True:
+        m = _HONORIFIC_RE.match(rest)
+        if not m:
+            break
+        honorifics.append(HONORIFICS[m.group(1).strip()])
+        rest = rest[m.end() :]
+    core = clean_name(rest)
+    return core, " ".join(honorifics)
+
+
+class AnnotationCache:
+    """Annotation results per (normalized name, prompt version, model)."""
+
+    def __init__(self, path: Path, model: str, prompt_version: str) -> None:
+        self.model = model
+        self.prompt_version = prompt_version
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS annotations (
+                core TEXT NOT NULL,
+                honorific TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                model TEXT NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (core, honorific, prompt_version, model)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS emitted (
+                output TEXT NOT NULL,
+                name TEXT NOT NULL,
+                PRIMARY KEY (output, name)
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def lookup(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT result FROM annotations WHERE core=? AND honorific=? AND prompt_version=? AND model=?",
+            (*key, self.prompt_version, self.model),
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def store(self, key: Tuple[str, str], result: Dict[str, Any]) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?)",
+            (*key, self.prompt_version, self.model, json.dumps(result, ensure_ascii=False)),
+        )
+
+    def emitted(self, output: Path) -> "EmittedNames":
+        return EmittedNames(self.conn, output)
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+
+class EmittedNames:
+    """
+    Set-like view of the raw names already written to `output` (drop-in for
+    the set from load_done_names). Forgotten if the output file is gone.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, output: Path) -> None:
+        self.conn = conn
+        self.output = str(output.resolve())
+        if not output.exists():
+            self.conn.execute("DELETE FROM emitted WHERE output=?", (self.output,))
+            self.conn.commit()
+
+    def __contains__(self, name: object) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM emitted WHERE output=? AND name=?", (self.output, name)
+        ).fetchone()
+        return row is not None
+
+    def add(self, name: str) -> None:
+        self.conn.execute("INSERT OR IGNORE INTO emitted VALUES (?, ?)", (self.output, name))
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM emitted WHERE output=?", (self.output,)).fetchone()[0]
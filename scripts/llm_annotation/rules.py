@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from schema import NameAnnotationRecord
+
+# ============================================================
+# RULE-BASED PRE-CLASSIFIER:
+# - One compiled alternation of the deterministic markers listed in
+#   prompt.py, scanned once per name.
+# - Non-human: an institution / land-category marker and no human
+#   relationship marker -> organization type (and religion where the
+#   institution implies one).
+# - Human: a gender marker AND a religion marker -> both labels.
+# - Anything else (or conflicting markers) is left to the LLM.
+# Records use the calibration of the prompt's worked examples.
+# ============================================================
+
+# A marker that must stand alone: not preceded/followed by Devanagari or
+# Latin letters (so शेख does not fire inside शेखर, श्री not inside श्रीदेवी).
+_DEV = r"ऀ-ॿa-zA-Z"
+
+
+def _token(*words: str) -> str:
+    return "|".join(rf"(?<![{_DEV}]){re.escape(w)}(?![{_DEV}])" for w in words)
+
+
+def _prefix(*words: str) -> str:
+    """Abbreviations ending in a mark (मो०) may be glued to the next word."""
+    return "|".join(rf"(?<![{_DEV}]){re.escape(w)}" for w in words)
+
+
+def _substring(*words: str) -> str:
+    return "|".join(re.escape(w) for w in words)
+
+
+# Group name -> pattern. Order matters only for overlaps at one position.
+MARKERS: Dict[str, str] = {
+    # Non-human institutions / land categories
+    "state": _substring(
+        "बिहार सरकार", "भारत सरकार", "गैरमजरूआ", "गैर मजरूआ", "शिक्षा विभाग", "वन विभाग",
+        "जिला परिषद", "ग्राम पंचायत", "रेलवे",
+    ),
+    "cooperative": _substring("सहकारी", "सहकारिता", "कोऑपरेटिव", "पैक्स") + "|" + _token("PACS"),
+    "commercial": _substring("प्रा. लि.", "प्रा० लि०", "कंपनी", "एंटरप्राइजेज", "इंडस्ट्रीज", "फैक्ट्री")
+    + "|"
+    + _token("बैंक", "Pvt", "Ltd"),
+    "educational": _substring("विद्यालय", "पाठशाला", "स्कूल", "कॉलेज"),
+    "religious_hindu": _substring("मंदिर", "ठाकुरबाड़ी", "देवस्थान", "धर्मशाला"),
+    "religious_muslim": _substring(
+        "मस्जिद", "मसजिद", "मस्जीद", "ईदगाह", "दरगाह", "कब्रिस्तान", "खानकाह"
+    )
+    + "|"
+    + _token("वक्फ", "वकफ"),
+    "religious_other": _substring("गुरुद्वारा", "गिरजाघर") + "|" + _token("चर्च"),
+    "trust_ngo": _substring("ट्रस्ट", "सोसाइटी", "फाउंडेशन") + "|" + _token("समिति", "न्यास"),
+    # Human markers implying both gender and religion
+    "muslim_man": _prefix("मो०", "मो0", "मो.") + "|" + _token("मोहम्मद", "मोहमद", "मौलाना"),
+    "muslim_woman": _token("बीबी", "बेगम", "खातुन", "खातून", "मुसम्मत", "मुस्समत"),
+    # Human gender markers (woman first: श्रीमती before श्री)
+    "woman": _token("श्रीमती", "श्रीमति", "सुश्री", "कुमारी", "पत्नी", "पुत्री", "W/O", "D/O"),
+    "man": _token("श्री", "पुत्र", "बेटा", "S/O", "Mr"),
+    # Human religion markers
+    "muslim": _token("शेख", "अंसारी", "हाजी", "हाफिज"),
+    "hindu": _token("पंडित", "ठाकुर"),
+}
+MARKER_RE = re.compile("|".join(f"(?P<{g}>{p})" for g, p in MARKERS.items()), re.IGNORECASE)
+
+_ORGANIZATIONS = {
+    "state": ("state", "cannot decide"),
+    "cooperative": ("cooperative", "cannot decide"),
+    "commercial": ("commercial", "cannot decide"),
+    "educational": ("educational", "cannot decide"),
+    "religious_hindu": ("religious", "hindu"),
+    "religious_muslim": ("religious", "muslim"),
+    "religious_other": ("religious", "other religion"),
+    "trust_ngo": ("trust_ngo", "cannot decide"),
+}
+# Human marker group -> (gender, religion) it implies
+_HUMAN = {
+    "muslim_man": ("man", "muslim"),
+    "muslim_woman": ("woman", "muslim"),
+    "woman": ("woman", None),
+    "man": ("man", None),
+    "muslim": (None, "muslim"),
+    "hindu": (None, "hindu"),
+}
+_PROPS = {
+    "hindu": (0.94, 0.04),
+    "muslim": (0.02, 0.96),
+    "other religion": (0.02, 0.02),
+    "cannot decide": (0.5, 0.5),
+}
+
+
+def _markers(name: str) -> List[str]:
+    """Marker groups found in `name`, in order of appearance."""
+    return [m.lastgroup for m in MARKER_RE.finditer(name)]
+
+
+def classify(name: str) -> Optional[Dict[str, Any]]:
+    """
+    Annotation fields (as in NameAnnotationRecord, without idx/name) for a
+    name the rules can decide with high confidence, else None.
+    """
+    found = _markers(name)
+    if not found:
+        return None
+
+    orgs = {g for g in found if g in _ORGANIZATIONS}
+    genders = [_HUMAN[g][0] for g in found if g in _HUMAN and _HUMAN[g][0]]
+    religions = {_HUMAN[g][1] for g in found if g in _HUMAN and _HUMAN[g][1]}
+    if orgs:
+        # "X पुत्र Y, मंदिर ..." is a person, possibly a trustee: ask the LLM
+        if genders or len({_ORGANIZATIONS[g] for g in orgs}) > 1:
+            return None
+        org_type, religion = _ORGANIZATIONS[orgs.pop()]
+        prop_hindu, prop_muslim = _PROPS[religion]
+        return dict(
+            entity_type="non-human",
+            entity_confidence=0.99,
+            organization_type=org_type,
+            organization_confidence=0.95,
+            gender="cannot decide",
+            prop_women=None,
+            religion=religion,
+            prop_hindu=prop_hindu,
+            prop_muslim=prop_muslim,
+        )
+
+    if not genders or len(religions) != 1:
+        return None
+    # The first gender marker describes the account holder; later ones
+    # usually describe a relative ("श्रीमती X W/O श्री Y").
+    gender = genders[0]
+    religion = religions.pop()
+    prop_hindu, prop_muslim = _PROPS[religion]
+    return dict(
+        entity_type="human",
+        entity_confidence=0.99,
+        organization_type="not_applicable",
+        organization_confidence=1.0,
+        gender=gender,
+        prop_women=0.98 if gender == "woman" else 0.02,
+        religion=religion,
+        prop_hindu=prop_hindu,
+        prop_muslim=prop_muslim,
+    )
+
+
+def split_by_rules(names: Iterable[str]) -> Iterator[Tuple[str, Optional[NameAnnotationRecord]]]:
+    """(name, record) for each name; record is None where the LLM is needed (idx=-1 otherwise)."""
+    for name in names:
+        fields = classify(name)
+        yield name, None if fields is None else NameAnnotationRecord(idx=-1, name=name, **fields)
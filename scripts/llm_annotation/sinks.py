@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import pyarrow as pa
+
+from schema import NameAnnotationRecord
+
+# ============================================================
+# OUTPUT SINKS for annotate_names.py:
+# - JsonlSink: one JSON line per record (the original format).
+# - ArrowSink: a directory of Arrow IPC stream parts (part-00000.arrows, ...)
+#   rolled every `part_rows` rows, plus _manifest.json. Records are buffered
+#   and written as one record batch per flush, so resume and merge read
+#   columns directly (memory-mapped) instead of parsing text.
+# - TeeSink: write to several sinks (e.g. Arrow output + JSONL audit log).
+# ============================================================
+
+# Columnar schema of NameAnnotationRecord
+ANNOTATION_SCHEMA = pa.schema(
+    [
+        ("idx", pa.int64()),
+        ("name", pa.string()),
+        ("entity_type", pa.string()),
+        ("entity_confidence", pa.float64()),
+        ("organization_type", pa.string()),
+        ("organization_confidence", pa.float64()),
+        ("gender", pa.string()),
+        ("prop_women", pa.float64()),
+        ("religion", pa.string()),
+        ("prop_hindu", pa.float64()),
+        ("prop_muslim", pa.float64()),
+    ]
+)
+
+MANIFEST = "_manifest.json"
+PART_GLOB = "part-*.arrows"
+
+
+class JsonlSink:
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.f = open(path, "a", encoding="utf-8")
+
+    def write(self, records: Sequence[NameAnnotationRecord]) -> None:
+        for rec in records:
+            self.f.write(json.dumps(rec.model_dump(), ensure_ascii=False) + "\n")
+
+    def flush(self, fsync: bool = False) -> None:
+        self.f.flush()
+        if fsync:
+            os.fsync(self.f.fileno())
+
+    def close(self) -> None:
+        self.f.close()
+
+
+class ArrowSink:
+    """
+    Appends to the part directory `path`; each run starts a new part, so
+    parts left by earlier (possibly interrupted) runs are never rewritten.
+    """
+
+    def __init__(self, path: Path, part_rows: int = 1_000_000) -> None:
+        path.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.part_rows = part_rows
+        self.pending: List[dict] = []
+        self.parts = {p.name: _count_rows(p) for p in sorted(path.glob(PART_GLOB))}
+        self.f = None
+        self.writer: Optional[pa.ipc.RecordBatchStreamWriter] = None
+        self.part = ""
+
+    def _open_part(self) -> None:
+        self.part = f"part-{len(self.parts):05d}.arrows"
+        self.f = open(self.path / self.part, "wb")
+        self.writer = pa.ipc.new_stream(self.f, ANNOTATION_SCHEMA)
+        self.parts[self.part] = 0
+
+    def _close_part(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.f.close()
+            self.writer = self.f = None
+        self._write_manifest()
+
+    def _write_manifest(self) -> None:
+        manifest = {
+            "schema": [f.name for f in ANNOTATION_SCHEMA],
+            "rows": sum(self.parts.values()),
+            "parts": [{"file": name, "rows": rows} for name, rows in self.parts.items()],
+        }
+        tmp = self.path / (MANIFEST + ".tmp")
+        tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path / MANIFEST)
+
+    def write(self, records: Sequence[NameAnnotationRecord]) -> None:
+        self.pending.extend(rec.model_dump() for rec in records)
+
+    def flush(self, fsync: bool = False) -> None:
+        if self.pending:
+            if self.writer is None:
+                self._open_part()
+            self.writer.write_batch(pa.RecordBatch.from_pylist(self.pending, schema=ANNOTATION_SCHEMA))
+            self.parts[self.part] += len(self.pending)
+            self.pending = []
+        if self.f is not None:
+            self.f.flush()
+            if fsync:
+                os.fsync(self.f.fileno())
+        if self.writer is not None and self.parts[self.part] >= self.part_rows:
+            self._close_part()
+
+    def close(self) -> None:
+        self.flush()
+        self._close_part()
+
+
+class TeeSink:
+    def __init__(self, *sinks) -> None:
+        self.sinks = sinks
+
+    def write(self, records: Sequence[NameAnnotationRecord]) -> None:
+        for s in self.sinks:
+            s.write(records)
+
+    def flush(self, fsync: bool = False) -> None:
+        for s in self.sinks:
+            s.flush(fsync)
+
+    def close(self) -> None:
+        for s in self.sinks:
+            s.close()
+
+
+def _read_part(path: Path) -> List[pa.RecordBatch]:
+    """Complete record batches of one part; a batch torn by an interrupted run is dropped."""
+    batches = []
+    # Not closed here: the batches are zero-copy views of the mapping
+    source = pa.memory_map(str(path))
+    try:
+        for batch in pa.ipc.open_stream(source):
+            batches.append(batch)
+    except (pa.ArrowInvalid, OSError):
+        pass
+    return batches
+
+
+def _count_rows(path: Path) -> int:
+    return sum(b.num_rows for b in _read_part(path))
+
+
+def read_arrow_annotations(path: Path, columns: Optional[List[str]] = None) -> pa.Table:
+    """All rows of an ArrowSink directory (parts in order)."""
+    batches = [b for p in sorted(path.glob(PART_GLOB)) for b in _read_part(p)]
+    table = pa.Table.from_batches(batches, schema=ANNOTATION_SCHEMA)
+    return table if columns is None else table.select(columns)
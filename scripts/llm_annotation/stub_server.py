@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+# ============================================================
+# LOCAL STUB of the Responses API parse endpoint (POST /v1/responses), for
+# exercising annotate_names.py without an API key or cost:
+#
+#   python stub_server.py --port 8000 --latency 0.5 --drop-rate 0.05
+#   python annotate_names.py ... --base-url http://127.0.0.1:8000/v1 --concurrency 8
+#
+# Returns schema-valid dummy annotations for the ITEMS_JSON in the prompt,
+# optionally with latency, dropped items and transient 429s.
+# ============================================================
+
+ITEMS_RE = re.compile(r"ITEMS_JSON:\n(\[.*\])\s*$", re.S)
+
+
+def _dummy_annotation(idx: int, name: str) -> Dict[str, Any]:
+    woman = "श्रीमती" in name or "देवी" in name
+    return {
+        "idx": idx,
+        "entity_type": "human",
+        "entity_confidence": 0.9,
+        "organization_type": "not_applicable",
+        "organization_confidence": 1.0,
+        "gender": "woman" if woman else "man",
+        "prop_women": 0.9 if woman else 0.1,
+        "religion": "hindu",
+        "prop_hindu": 0.9,
+        "prop_muslim": 0.05,
+    }
+
+
+def _items_from_request(body: Dict[str, Any]) -> List[Dict[str, Any]]:
+    for msg in body.get("input", []):
+        content = msg.get("content", "")
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content)
+        m = ITEMS_RE.search(content)
+        if m:
+            return json.loads(m.group(1))
+    return []
+
+
+def make_handler(args: argparse.Namespace):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: Dict[str, Any]) -> None:
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self) -> None:  # noqa: N802
+            if not self.path.rstrip("/").endswith("/responses"):
+                self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            time.sleep(args.latency)
+
+            if random.random() < args.error_rate:
+                self._send(429, {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit"}})
+                return
+
+            items = _items_from_request(body)
+            anns = [
+                _dummy_annotation(it["idx"], it["name"])
+                for it in items
+                if random.random() >= args.drop_rate
+            ]
+            text = json.dumps({"annotations": anns}, ensure_ascii=False)
+            input_tokens = len(json.dumps(body, ensure_ascii=False).encode("utf-8")) // 4
+            output_tokens = len(text.encode("utf-8")) // 4
+
+            self._send(
+                200,
+                {
+                    "id": f"resp_stub_{random.getrandbits(32):08x}",
+                    "object": "response",
+                    "created_at": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "status": "completed",
+                    "output": [
+                        {
+                            "type": "message",
+                            "id": "msg_stub",
+                            "status": "completed",
+                            "role": "assistant",
+                            "content": [{"type": "output_text", "text": text, "annotations": []}],
+                        }
+                    ],
+                    "parallel_tool_calls": True,
+                    "tool_choice": "auto",
+                    "tools": [],
+                    "usage": {
+                        "input_tokens": input_tokens,
+                        "input_tokens_details": {"cached_tokens": 0},
+                        "output_tokens": output_tokens,
+                        "output_tokens_details": {"reasoning_tokens": 0},
+                        "total_tokens": input_tokens + output_tokens,
+                    },
+                },
+            )
+
+        def log_message(self, format: str, *a: Any) -> None:
+            if args.verbose:
+                super().log_message(format, *a)
+
+    return Handler
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Local stub of the Responses API for annotate_names.py")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--latency", type=float, default=0.2, help="Seconds per request")
+    ap.add_argument("--drop-rate", type=float, default=0.0, help="Probability of omitting each item")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 429 response")
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args))
+    print(f"Stub Responses API on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
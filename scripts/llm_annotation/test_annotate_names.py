@@ -0,0 +1,53 @@
+"""
+Run from ./scripts/llm_annotation (no API access needed):
+
+    python -m pytest -q test_annotate_names.py
+"""
+import asyncio
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from annotate_names import TokenBucket, merge_left_to_parquet, read_annotations
+
+
+def _record(idx, name, gender):
+    return {"idx": idx, "name": name, "entity_type": "human", "gender": gender}
+
+
+def test_read_annotations_keeps_first_row_of_each_name(tmp_path):
+    # cache/rules writes, resume and repair can all write a name again
+    annotations = tmp_path / "annotations.jsonl"
+    rows = [_record(0, "A", "man"), _record(1, "A", "woman"), _record(2, "B", "woman"), _record(3, "C", "man")]
+    annotations.write_text("".join(json.dumps(r) + "\n" for r in rows))
+
+    table = read_annotations(annotations)
+
+    assert table["name"].to_pylist() == ["A", "B", "C"]
+    assert table["gender"].to_pylist() == ["man", "woman", "man"]
+
+
+def test_merge_left_to_parquet_with_duplicate_annotations(tmp_path):
+    annotations = tmp_path / "annotations.jsonl"
+    rows = [_record(0, "A", "man"), _record(1, "A", "man"), _record(2, "B", "woman"), _record(3, "C", "man")]
+    annotations.write_text("".join(json.dumps(r) + "\n" for r in rows))
+    names = tmp_path / "names.parquet"
+    pq.write_table(pa.table({"name": ["C", "B", "A", "D"]}), names)
+
+    merged = tmp_path / "merged.parquet"
+    merge_left_to_parquet(str(names), "name", annotations, merged)
+
+    assert pq.read_table(merged)["gender"].to_pylist() == ["man", "woman", "man", None]
+
+
+def test_token_bucket_settles_the_reserved_tokens():
+    # a request estimated above the per-minute budget only reserves the budget
+    limiter = TokenBucket(rpm=0, tpm=100_000)
+    reserved = asyncio.run(limiter.acquire(150_000))
+    limiter.settle(reserved, 120_000)
+
+    assert reserved == 100_000
+    # net charge is the actual usage
+    assert limiter._tokens == pytest.approx(-20_000, abs=50)
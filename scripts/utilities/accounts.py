@@ -0,0 +1,84 @@
+"""
+Per-account aggregate of the processed land records: one row per
+(district, account_no) with the number of plots (nplots), total area
+(tt_area_acre), and the dominant name_of_ryot and caste across its plots.
+The table carries the account_id and name_id of utilities/ids.py.
+
+Account numbers are only unique within a district, so unlike the
+groupby("account_no") of the notebooks an account_no used in several
+districts is several accounts here, as in utilities/flags.py.
+
+Build once from ./scripts (or via `make accounts` from the repo root):
+
+    python -m utilities.accounts --engine parquet
+"""
+import argparse
+import os
+
+import pandas as pd
+
+from utilities import ids
+from utilities.ids import ACCOUNT_KEY
+from utilities.profiling import profiled
+from utilities.utils import get_fulldata, process_land_area
+
+ACCOUNTS_DATA = "../data/land_accounts.parquet"
+ACCOUNT_USECOLS = ["account_no", "name_of_ryot", "caste", "district", "6", "7", "8"]
+DOMINANT_COLUMNS = ["name_of_ryot", "caste"]
+
+
+def _dominant(df, col):
+    """Most frequent non-missing value of `col` per account (ties: first seen)"""
+    return (
+        df.groupby(ACCOUNT_KEY + [col], observed=True, sort=False)
+        .size()
+        .reset_index(name="n")
+        .sort_values("n", ascending=False, kind="stable")
+        .drop_duplicates(ACCOUNT_KEY)
+        .set_index(ACCOUNT_KEY)[col]
+    )
+
+
+@profiled
+def build_accounts(df):
+    """
+    Aggregate a process_land_area frame to one row per (district,
+    account_no); plots missing either are dropped.
+
+    Any of DOMINANT_COLUMNS present in `df` are reduced to their most
+    frequent value per account; accounts whose plots have no value for a
+    column get a missing value.
+    """
+    accounts = df.groupby(ACCOUNT_KEY, observed=True).agg(
+        nplots=("tt_area_acre", "size"),
+        tt_area_acre=("tt_area_acre", "sum"),
+    )
+    for col in DOMINANT_COLUMNS:
+        if col in df.columns:
+            accounts[col] = _dominant(df, col)
+
+    return accounts.reset_index()
+
+
+def get_accountdata(path=ACCOUNTS_DATA, columns=None):
+    """Read the cached per-account table (see build_accounts)"""
+    return pd.read_parquet(path, columns=columns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the per-account aggregate table")
+    parser.add_argument("--engine", default="pyarrow", help="get_fulldata engine")
+    parser.add_argument("--output", default=ACCOUNTS_DATA, help="Output parquet path")
+    args = parser.parse_args()
+
+    df = get_fulldata(engine=args.engine, compact=True, usecols=ACCOUNT_USECOLS).pipe(
+        process_land_area
+    )
+    print(f"{len(df):,} plots")
+    accounts = build_accounts(df)
+    del df
+    accounts = ids.add_ids(accounts, update=True)
+    print(f"{len(accounts):,} accounts")
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    accounts.to_parquet(args.output, index=False)
@@ -0,0 +1,187 @@
+"""
+Benchmarks of the land record data path on synthetic data
+(utilities/synthetic.py), so that performance can be tracked without the
+private CSVs.
+
+For each size the synthetic CSVs, their Parquet dataset and a matching
+annotation JSONL are built once under <workdir> and reused; then
+get_fulldata (per engine; "pandas" is the baseline the others are
+compared against), process_land_area, build_accounts, quantile_table and
+merge_left_to_parquet are timed (best of --repeat). The resident memory of
+each step is sampled while it runs (utilities/profiling.py): its peak and
+its growth over the memory at the start of the step.
+Results are written to JSON; with --baseline, steps more than --tolerance
+slower than the baseline are reported and the exit status is 1. Run from
+./scripts (or `make bench`):
+
+    python -m utilities.bench --rows 1M 10M
+    python -m utilities.bench --rows 1M --baseline ../data/bench/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from utilities.accounts import ACCOUNT_USECOLS, build_accounts
+from utilities.build_parquet import csv_to_parquet
+from utilities.profiling import Profiler
+from utilities.synthetic import synthetic_annotations, write_land_records
+from utilities.utils import get_fulldata, process_land_area, quantile_table
+
+BENCH_DIR = "../data/bench/"
+ENGINES = ("pandas", "pyarrow", "parquet")
+_SUFFIXES = {"K": 1_000, "M": 1_000_000}
+
+
+def parse_rows(value):
+    """'1M' / '500K' / '1000' -> number of rows"""
+    value = value.strip().upper()
+    if value[-1:] in _SUFFIXES:
+        return int(float(value[:-1]) * _SUFFIXES[value[-1]])
+    return int(value)
+
+
+def _merge_left_to_parquet():
+    # llm_annotation is run as scripts from its own directory
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "llm_annotation"))
+    from annotate_names import merge_left_to_parquet
+
+    return merge_left_to_parquet
+
+
+def prepare(rows, workdir=BENCH_DIR, seed=0):
+    """Synthetic inputs for `rows` rows (built on first use): dict of paths"""
+    base = os.path.join(workdir, f"rows_{rows}_seed_{seed}")
+    paths = {
+        "csv": os.path.join(base, "csv"),
+        "parquet": os.path.join(base, "parquet"),
+        "names": os.path.join(base, "names.parquet"),
+        "annotations": os.path.join(base, "annotations.jsonl"),
+        "merged": os.path.join(base, "merged.parquet"),
+    }
+    if not os.path.exists(os.path.join(base, "_done")):
+        print(f"building synthetic data for {rows:,} rows in {base}")
+        write_land_records(paths["csv"], rows, seed=seed)
+        csv_to_parquet(paths["csv"], paths["parquet"], overwrite=True)
+        names = get_fulldata(paths["parquet"], engine="parquet", compact=True, usecols=["name_of_ryot", "account_no"])
+        names.to_parquet(paths["names"], index=False)
+        synthetic_annotations(names["name_of_ryot"], paths["annotations"], seed=seed)
+        open(os.path.join(base, "_done"), "w").close()
+    return paths
+
+
+def run_benchmarks(rows, workdir=BENCH_DIR, engines=ENGINES, repeat=1, seed=0):
+    """{step: {"seconds", "rows", "peak_rss_mb", "rss_growth_mb"}} for one data size"""
+    paths = prepare(rows, workdir, seed=seed)
+    results = {}
+    # only this Profiler's own stages are recorded (it is not the active one)
+    profiler = Profiler(interval=0.01).start()
+
+    def timed(step, fn):
+        best, out, peak, growth = None, None, 0.0, 0.0
+        for _ in range(repeat):
+            out = None
+            with profiler.stage(step) as record:
+                start = time.perf_counter()
+                out = fn()
+                seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+            peak = max(peak, record["peak_rss_mb"])
+            growth = max(growth, record["peak_rss_mb"] - record["rss_start_mb"])
+        n = len(out) if hasattr(out, "__len__") else rows
+        results[step] = {
+            "seconds": round(best, 4),
+            "rows": n,
+            "peak_rss_mb": round(peak, 1),
+            "rss_growth_mb": round(growth, 1),
+        }
+        print(f"  {step:<28} {best:9.3f}s  {n:>12,} rows")
+        return out
+
+    df = None
+    for engine in engines:
+        df = None  # so each read starts without the previous engine's frame
+        directory = paths["parquet"] if engine == "parquet" else paths["csv"]
+        df = timed(
+            f"get_fulldata[{engine}]",
+            lambda: get_fulldata(directory, engine=engine, compact=engine != "pandas", usecols=ACCOUNT_USECOLS),
+        )
+    if df is None:
+        df = get_fulldata(paths["parquet"], engine="parquet", compact=True, usecols=ACCOUNT_USECOLS)
+
+    df = timed("process_land_area", lambda: process_land_area(df))
+    accounts = timed("build_accounts", lambda: build_accounts(df))
+    timed("quantile_table[district]", lambda: quantile_table(df, "tt_area_acre", by="district"))
+    timed("quantile_table[accounts]", lambda: quantile_table(accounts, "tt_area_acre"))
+    del df, accounts
+
+    merge_left_to_parquet = _merge_left_to_parquet()
+    timed(
+        "merge_left_to_parquet",
+        lambda: merge_left_to_parquet(
+            paths["names"], "name_of_ryot", Path(paths["annotations"]), Path(paths["merged"])
+        ),
+    )
+    profiler.stop()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """(size, step, seconds, baseline seconds) of the steps slower than baseline * (1 + tolerance)"""
+    regressions = []
+    for size, steps in results.items():
+        for step, result in steps.items():
+            before = baseline.get(size, {}).get(step)
+            if before and result["seconds"] > before["seconds"] * (1 + tolerance):
+                regressions.append((size, step, result["seconds"], before["seconds"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the data path on synthetic land records")
+    parser.add_argument("--rows", nargs="+", default=["1M"], help="Data sizes, e.g. 1M 10M 40M")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), help="get_fulldata engines to time (pandas, pyarrow, parquet)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per step (best is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=BENCH_DIR, help="Synthetic data cache")
+    parser.add_argument("--output", default=None, help="Results JSON (default: <workdir>/results.json)")
+    parser.add_argument("--baseline", default=None, help="Results JSON of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs. baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.rows:
+        rows = parse_rows(size)
+        print(f"{size} ({rows:,} rows)")
+        results[size] = run_benchmarks(rows, args.workdir, engines=args.engines, repeat=args.repeat, seed=args.seed)
+
+    output = args.output or os.path.join(args.workdir, "results.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "python": platform.python_version(),
+                "pandas": pd.__version__,
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "results": results,
+            },
+            f,
+            indent=1,
+        )
+    print(f"wrote {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for size, step, seconds, before in regressions:
+            print(f"REGRESSION {size} {step}: {seconds:.3f}s vs {before:.3f}s")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions vs {args.baseline}")
@@ -0,0 +1,56 @@
+"""
+Convert the raw per-district land record CSVs into a Parquet dataset
+partitioned by district (hive layout: <output>/district=<name>/*.parquet).
+
+Run once from ./scripts (or via `make parquet` from the repo root):
+
+    python -m utilities.build_parquet
+"""
+import argparse
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from utilities.utils import LR_CSV_DIR, LR_PARQUET_DIR, _list_csv_files, _read_csv_arrow
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("district", pa.dictionary(pa.int32(), pa.string()))]), flavor="hive"
+)
+
+
+def csv_to_parquet(input_dir=LR_CSV_DIR, output_dir=LR_PARQUET_DIR, overwrite=False):
+    """
+    Write every CSV in `input_dir` into the district-partitioned dataset at
+    `output_dir`, one file at a time so that memory stays at one district.
+    Columns are stored with the compact LR_ARROW_SCHEMA types, so district,
+    division, mouza, caste and residence are dictionary-encoded.
+    """
+    if os.path.exists(output_dir):
+        if not overwrite:
+            raise FileExistsError(f"{output_dir} exists; pass overwrite=True to rebuild")
+        shutil.rmtree(output_dir)
+
+    for f in _list_csv_files(input_dir):
+        stem = os.path.splitext(os.path.basename(f))[0]
+        table = _read_csv_arrow(f, compact=True)
+        ds.write_dataset(
+            table,
+            output_dir,
+            format="parquet",
+            partitioning=PARTITIONING,
+            basename_template=f"{stem}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        print(f"{stem}: {table.num_rows:,} rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--input", default=LR_CSV_DIR, help="Directory of raw CSVs")
+    parser.add_argument("--output", default=LR_PARQUET_DIR, help="Dataset directory")
+    parser.add_argument("--overwrite", action="store_true", help="Rebuild if it exists")
+    args = parser.parse_args()
+
+    csv_to_parquet(args.input, args.output, overwrite=args.overwrite)
@@ -0,0 +1,138 @@
+"""
+Devanagari name cleaning (the clean_hindi_names rules of
+20_get_ryot_hindi_caste.ipynb) as one compiled pattern.
+
+Everything but Devanagari letters and spaces is removed in a single regex
+pass with pyarrow's string kernels (slices in parallel threads; Arrow
+releases the GIL), whitespace is collapsed, and the names that changed are
+flagged in the same pass. Only the flagged names are scanned again, to
+count the characters removed per class. On mostly clean names this is
+about 4x faster than the pandas .str.replace chain on a single core:
+
+    cleaned, flagged, counts = clean_names(df["name_of_ryot"])
+
+clean_name() applies the same rules to one Python string (used for the
+annotation cache keys in llm_annotation/cache.py).
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utilities.profiling import profiled
+
+# Characters removed, by class. The patterns are valid for both Python re
+# and RE2 (Arrow's regex engine); the control class is not a raw string
+# because RE2 has no \u escapes.
+CHAR_CLASSES = {
+    # Basic punctuation and brackets
+    "punctuation": r'[°\.\,\;\:\!\?\[\]\(\)\{\}]',
+    # Special symbols
+    "symbols": r'[&"\'\`\~\@\#\$\%\^\*\_\=\+\-\|\\\/\<\>]',
+    # English letters and numbers
+    "alphanumeric": r'[a-zA-Z0-9]',
+    # Devanagari digits
+    "devanagari_digits": r'[०-९]',
+    # Unicode control/formatting characters
+    "unicode_control": '[\u0000-\u001F\u007F-\u009F\u200B-\u200F\u202A-\u202E\u206A-\u206F]',
+}
+CLEAN_PATTERN = "|".join(CHAR_CLASSES.values())
+# The same set as one character class: RE2 runs it about twice as fast as
+# the alternation
+_ARROW_CLEAN_PATTERN = "[" + "".join(p[1:-1] for p in CHAR_CLASSES.values()) + "]+"
+
+# Whitespace that Python's \s matches and the cleaning leaves (tabs,
+# newlines etc. are control characters and already removed). Runs of it,
+# and any single non-ASCII space, become one space; matching only those
+# keeps the regex from rewriting every single space.
+_SPACES = " \u00a0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000"
+_ARROW_SPACE_PATTERN = f"[{_SPACES}]{{2,}}|[{_SPACES[1:]}]"
+
+_CLEAN_RE = re.compile(CLEAN_PATTERN)
+_SPACE_RE = re.compile(r"\s+")
+
+# Class of each code point the cleaning can remove (-1: kept), for counting
+# the removed characters with one bincount
+_CLASS_OF = np.full(0x2070, -1, dtype="int8")
+for _i, _pattern in enumerate(CHAR_CLASSES.values()):
+    _CLASS_OF[[c for c in range(len(_CLASS_OF)) if re.fullmatch(_pattern, chr(c))]] = _i
+
+SLICE_ROWS = 1 << 20
+
+
+def clean_name(name):
+    """One name cleaned with the clean_hindi_names rules"""
+    return _SPACE_RE.sub(" ", _CLEAN_RE.sub("", name)).strip()
+
+
+def _to_arrow(values):
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        array = values
+    else:
+        array = pa.array(pd.Series(values), from_pandas=True)
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    if pa.types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+    if pa.types.is_large_string(array.type):
+        array = array.cast(pa.string())
+    return array
+
+
+def _clean_slice(array):
+    cleaned = pc.replace_substring_regex(array, _ARROW_CLEAN_PATTERN, "")
+    cleaned = pc.replace_substring_regex(cleaned, _ARROW_SPACE_PATTERN, " ")
+    cleaned = pc.utf8_trim(cleaned, " ")
+    return cleaned, pc.fill_null(pc.not_equal(cleaned, array), False)
+
+
+@profiled
+def clean_names(values, n_jobs=None):
+    """
+    Clean `values` (a Series or Arrow array of names).
+
+    Returns (cleaned, flagged, counts): the cleaned Arrow string array
+    (missing names stay missing, names left empty become ""), a boolean
+    array of the names the cleaning changed, and a dict with the number of
+    characters removed per CHAR_CLASSES class plus the number of flagged
+    and emptied names.
+    """
+    array = _to_arrow(values)
+    slices = [array.slice(i, SLICE_ROWS) for i in range(0, len(array), SLICE_ROWS)] or [array]
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        results = list(pool.map(_clean_slice, slices))
+    cleaned = pa.concat_arrays([r[0] for r in results])
+    flagged = pa.concat_arrays([r[1] for r in results])
+
+    # the removed characters of the changed names, classified by code point
+    removed = pc.replace_substring_regex(array.filter(flagged), "[^" + _ARROW_CLEAN_PATTERN[1:-2] + "]+", "")
+    chars = "".join(removed.drop_null().to_pylist())
+    codes = np.frombuffer(chars.encode("utf-32-le"), dtype="uint32")
+    per_class = np.bincount(_CLASS_OF[codes[codes < len(_CLASS_OF)]] + 1, minlength=len(CHAR_CLASSES) + 1)
+    counts = dict(zip(CHAR_CLASSES, per_class[1:].tolist()))
+    counts["flagged"] = pc.sum(flagged).as_py() or 0
+    counts["emptied"] = pc.sum(pc.and_(flagged, pc.equal(cleaned, ""))).as_py() or 0
+    return cleaned, flagged, counts
+
+
+def clean_series(series, n_jobs=None):
+    """(cleaned Series with the index and dtype of `series`, per-class counts)"""
+    cleaned, _, counts = clean_names(series, n_jobs=n_jobs)
+    if isinstance(series.dtype, pd.StringDtype):
+        result = pd.Series(pd.arrays.ArrowStringArray(cleaned), index=series.index, name=series.name)
+        return result.astype(series.dtype), counts
+    result = pd.Series(cleaned.to_pandas(), index=series.index, name=series.name)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        result = result.astype("category")
+    elif series.dtype == object:
+        result = result.astype(object)
+    return result, counts
+
+
+def format_counts(counts):
+    """One-line summary of clean_names counts"""
+    removed = ", ".join(f"{name} {counts[name]:,}" for name in CHAR_CLASSES if counts[name])
+    return f"{counts['flagged']:,} names cleaned ({counts['emptied']:,} emptied); removed: {removed or 'nothing'}"
@@ -0,0 +1,415 @@
+"""
+Crosswalk of the land record geography (district, division, mouza) to the
+census crosswalk (br_lr_census_crosswalk.dta), with fuzzy village matching.
+
+The exact 3-key merge of crosswalk_district_block_village.ipynb leaves
+about 7.9k (district, block, village) tuples unmatched, mostly spelling
+variants (नगरपालीका / नगरपालिका) and ward numbers written with an
+abbreviation mark (वार्ड0 10). Here every tuple is matched down the
+hierarchy of the reference:
+
+    district -> block within the district -> village within the district
+
+on normalized names (normalize_geo): exactly where possible, else by edit
+similarity. Village candidates are blocked on shared character trigrams
+within the district (very common trigrams are ignored), and all candidate
+pairs are scored at once with a vectorized Levenshtein distance, in a pool
+of worker processes over districts. Villages in the matched block are
+preferred, and candidates with different numbers (ward 10 / ward 11) are
+never matched.
+
+The result has one row per land record tuple with the matched reference
+tuple, its other columns (census codes), the three scores and how the
+village was matched. It is cached with the hash of the reference file and
+of this module, so a rerun only matches tuples it has not seen. Build from
+./scripts:
+
+    python -m utilities.crosswalk --engine parquet
+"""
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import re
+import sys
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utilities.pipeline import _file_hash, _write_parquet
+from utilities.profiling import profiled
+from utilities.utils import get_fulldata
+
+XWALK_DATA = "../data/br_lr_census_crosswalk.dta"
+CROSSWALK_DATA = "../data/crosswalk/lr_census_crosswalk.parquet"
+GEO_SLUGS = ["zilla_district_lr", "anchal_block_lr", "mauja_village_lr"]
+LR_GEO_COLUMNS = {"district": "zilla_district_lr", "division": "anchal_block_lr", "mouza": "mauja_village_lr"}
+
+MIN_SCORE = 0.8
+MIN_BLOCK_SCORE = 0.75
+BLOCK_BONUS = 0.05
+MAX_CANDIDATES = 25
+# trigrams in more than this share of a district's villages do not block
+STOP_GRAM_SHARE = 0.05
+
+# Abbreviation mark written as a zero (वार्ड0, मो०) or as ॰ after a letter
+_ABBREVIATION_RE = re.compile("(?<=[\u0900-\u0963\u0971-\u097f])[0\u0966\u0970]")
+_BRACKETS_RE = re.compile(r"\[.*?\]")
+# everything but Devanagari letters and signs, ASCII letters and digits
+_OTHER_RE = re.compile("[^\u0900-\u0963\u0971-\u097fa-zA-Z0-9]+")
+_VARIANTS = str.maketrans(
+    {
+        "\u093c": None,  # nukta
+        "\u0901": "\u0902",  # chandrabindu -> anusvara
+        "\u0940": "\u093f",  # vowel sign II -> I
+        "\u0942": "\u0941",  # vowel sign UU -> U
+        "\u0908": "\u0907",  # letter II -> I
+        "\u090a": "\u0909",  # letter UU -> U
+        **{chr(0x0966 + d): str(d) for d in range(10)},  # Devanagari digits
+    }
+)
+
+
+# ----------------------------------------------------------------------------
+# Normalization and scoring
+# ----------------------------------------------------------------------------
+def normalize_name(value):
+    """
+    One name normalized for matching: bracketed codes ([001]) and
+    punctuation removed, abbreviation marks and Devanagari digits turned
+    into spaces and ASCII digits, long/short vowel signs, nukta and
+    chandrabindu unified, whitespace collapsed.
+    """
+    value = _ABBREVIATION_RE.sub(" ", _BRACKETS_RE.sub(" ", unicodedata.normalize("NFC", value)))
+    return _OTHER_RE.sub(" ", value.translate(_VARIANTS)).strip()
+
+
+def normalize_geo(values):
+    """normalize_name of each of `values`, computed once per distinct value"""
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    normalized = np.array([normalize_name(str(u)) for u in uniques] + [None], dtype=object)
+    return pd.Series(normalized[codes], index=values.index, dtype=object)
+
+
+def _code_matrix(strings):
+    """(rows x max length) int32 code points padded with -1, and the lengths"""
+    lengths = np.fromiter(map(len, strings), dtype=np.intp, count=len(strings))
+    matrix = np.full((len(strings), max(lengths.max(initial=0), 1)), -1, dtype=np.int32)
+    if lengths.sum():
+        codes = np.frombuffer("".join(strings).encode("utf-32-le"), dtype=np.uint32).astype(np.int32)
+        rows = np.repeat(np.arange(len(strings)), lengths)
+        cols = np.arange(len(codes)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        matrix[rows, cols] = codes
+    return matrix, lengths
+
+
+def levenshtein(a, b, chunk=50_000):
+    """
+    Edit distances between a[i] and b[i], for all pairs at once: one numpy
+    step per character of the longest `a`, with insertions resolved by a
+    running minimum along each row.
+    """
+    a, b = list(a), list(b)
+    out = np.empty(len(a), dtype=np.intp)
+    for start in range(0, len(a), chunk):
+        A, la = _code_matrix(a[start : start + chunk])
+        B, lb = _code_matrix(b[start : start + chunk])
+        n, m = B.shape
+        offsets = np.arange(m + 1, dtype=np.int32)
+        rows = np.arange(n)
+        prev = np.broadcast_to(offsets, (n, m + 1)).copy()
+        dist = lb.copy()
+        for i in range(1, A.shape[1] + 1):
+            cur = np.empty_like(prev)
+            cur[:, 0] = i
+            np.minimum(prev[:, 1:] + 1, prev[:, :-1] + (A[:, i - 1 : i] != B), out=cur[:, 1:])
+            cur = np.minimum.accumulate(cur - offsets, axis=1) + offsets
+            done = la == i
+            dist[done] = cur[rows[done], lb[done]]
+            prev = cur
+        out[start : start + chunk] = dist
+    return out
+
+
+def edit_similarity(a, b):
+    """1 - Levenshtein distance / length of the longer string, for pairs a[i], b[i]"""
+    a, b = list(a), list(b)
+    longest = np.maximum([len(s) for s in a], [len(s) for s in b]) if a else np.empty(0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(longest > 0, 1 - levenshtein(a, b) / np.maximum(longest, 1), 1.0)
+
+
+def _numbers(normalized):
+    return normalized.str.findall(r"\d+").str.join(" ")
+
+
+def _trigrams(normalized):
+    """(row, trigram) pairs of ' name ' for each row of `normalized`"""
+    grams = [[f" {s} "[i : i + 3] for i in range(len(s))] for s in normalized]
+    rows = np.repeat(np.arange(len(grams)), [len(g) for g in grams])
+    return pd.DataFrame({"row": rows, "gram": [g for gs in grams for g in gs]}).drop_duplicates()
+
+
+# ----------------------------------------------------------------------------
+# Hierarchical index
+# ----------------------------------------------------------------------------
+def read_reference(path=XWALK_DATA):
+    """The census crosswalk as in the notebooks: block codes dropped, one row per tuple"""
+    reference = pd.read_stata(path)
+    reference["anchal_block_lr"] = reference["anchal_block_lr"].str.replace(r"\[.*?\]", "", regex=True)
+    for col in GEO_SLUGS:
+        reference[col] = reference[col].str.strip()
+    return reference.drop_duplicates(GEO_SLUGS).reset_index(drop=True)
+
+
+class GeoIndex:
+    """
+    The reference tuples with normalized names and integer district /
+    block codes, and the village trigrams of every district.
+    """
+
+    def __init__(self, reference):
+        self.reference = reference.reset_index(drop=True)
+        norm = {col: normalize_geo(self.reference[col]) for col in GEO_SLUGS}
+        self.district, self.districts = pd.factorize(norm["zilla_district_lr"])
+        self.block, self.blocks = pd.factorize(norm["zilla_district_lr"] + "|" + norm["anchal_block_lr"])
+        self.block_names = pd.Series(self.blocks).str.split("|", n=1).str[1].to_numpy()
+        self.block_district = pd.Series(self.district).groupby(self.block).first().to_numpy()
+        self.village = norm["mauja_village_lr"].to_numpy()
+        self.numbers = _numbers(norm["mauja_village_lr"]).to_numpy()
+
+        # trigram -> villages, without the trigrams common within a district
+        grams = _trigrams(self.village)
+        grams["district"] = self.district[grams["row"].to_numpy()]
+        frequency = grams.groupby(["district", "gram"])["row"].transform("size").to_numpy()
+        limit = np.maximum(STOP_GRAM_SHARE * np.bincount(self.district), 2)[grams["district"].to_numpy()]
+        self.grams = grams[frequency <= limit]
+
+    def match_districts(self, names):
+        """(district code or -1, score) of each normalized district name"""
+        return _best_of(names, list(self.districts), MIN_BLOCK_SCORE)
+
+    def match_blocks(self, district, names):
+        """(block code or -1, score) of each normalized block name within its district"""
+        code = np.full(len(names), -1)
+        score = np.zeros(len(names))
+        for d in np.unique(district[district >= 0]):
+            rows = np.flatnonzero(district == d)
+            blocks = np.flatnonzero(self.block_district == d)
+            best, best_score = _best_of([names[r] for r in rows], list(self.block_names[blocks]), MIN_BLOCK_SCORE)
+            code[rows] = np.where(best >= 0, blocks[np.maximum(best, 0)], -1)
+            score[rows] = best_score
+        return code, score
+
+    def district_task(self, d):
+        """What a worker needs to match the villages of district `d`"""
+        rows = np.flatnonzero(self.district == d)
+        grams = self.grams[self.grams["district"] == d]
+        return {
+            "rows": rows,
+            "village": self.village[rows],
+            "numbers": self.numbers[rows],
+            "block": self.block[rows],
+            "grams": grams.assign(row=np.searchsorted(rows, grams["row"].to_numpy()))[["row", "gram"]],
+        }
+
+
+def _best_of(names, choices, min_score):
+    """Best of `choices` for each of `names` (exact first) and its similarity; -1 below min_score"""
+    names = list(names)
+    position = {c: i for i, c in enumerate(choices)}
+    best = np.array([position.get(n, -1) for n in names], dtype=np.intp)
+    score = np.where(best >= 0, 1.0, 0.0)
+    todo = np.flatnonzero(best < 0)
+    if len(todo) and choices:
+        pairs_a = [names[i] for i in todo for _ in choices]
+        pairs_b = choices * len(todo)
+        sim = edit_similarity(pairs_a, pairs_b).reshape(len(todo), len(choices))
+        pick = sim.argmax(axis=1)
+        top = sim[np.arange(len(todo)), pick]
+        best[todo] = np.where(top >= min_score, pick, -1)
+        score[todo] = top
+    return best, score
+
+
+def _match_villages(task, queries):
+    """
+    Worker: best reference village (row within the district, or -1), its
+    similarity and method for each query of one district.
+    """
+    village = queries["village"].to_numpy()
+    result = pd.DataFrame({"ref": -1, "village_score": 0.0, "method": "unmatched"}, index=queries.index)
+
+    # exact normalized names, preferring the matched block
+    ref = pd.DataFrame({"village": task["village"], "block": task["block"], "ref": np.arange(len(task["rows"]))})
+    exact = (
+        queries.reset_index()
+        .merge(ref, on="village", how="inner", suffixes=("", "_ref"))
+        .assign(other_block=lambda df: df["block_ref"] != df["block"])
+        .sort_values(["other_block", "ref"])
+        .drop_duplicates("index")
+        .set_index("index")
+    )
+    result.loc[exact.index, "ref"] = exact["ref"]
+    result.loc[exact.index, "village_score"] = 1.0
+    result.loc[exact.index, "method"] = "normalized"
+
+    # trigram-blocked candidates for the rest, scored all at once
+    todo = queries.index.difference(exact.index)
+    if not len(todo) or not len(ref):
+        return result
+    pos = queries.index.get_indexer(todo)
+    qgrams = _trigrams(village[pos])
+    pairs = qgrams.merge(task["grams"], on="gram", suffixes=("", "_ref"))
+    if not len(pairs):
+        return result
+    shared = pairs.groupby(["row", "row_ref"]).size().rename("shared").reset_index()
+    nq = np.bincount(qgrams["row"].to_numpy(), minlength=len(pos))
+    nr = np.bincount(task["grams"]["row"].to_numpy(), minlength=len(ref))
+    shared["dice"] = 2 * shared["shared"] / (nq[shared["row"]] + nr[shared["row_ref"]])
+    shared = shared.sort_values(["row", "dice"], ascending=[True, False]).groupby("row").head(MAX_CANDIDATES)
+
+    q = pos[shared["row"].to_numpy()]
+    r = shared["row_ref"].to_numpy()
+    sim = edit_similarity(village[q], task["village"][r])
+    sim[queries["numbers"].to_numpy()[q] != task["numbers"][r]] = 0
+    rank = sim + BLOCK_BONUS * (queries["block"].to_numpy()[q] == task["block"][r])
+    scored = pd.DataFrame({"q": q, "ref": r, "sim": sim, "rank": rank}).sort_values(["q", "rank"], ascending=[True, False])
+    best = scored.drop_duplicates("q")
+    best = best[best["sim"] >= MIN_SCORE]
+    index = queries.index[best["q"].to_numpy()]
+    result.loc[index, "ref"] = best["ref"].to_numpy()
+    result.loc[index, "village_score"] = best["sim"].to_numpy()
+    result.loc[index, "method"] = "fuzzy"
+    return result
+
+
+def _match_district(args):
+    task, queries = args
+    result = _match_villages(task, queries)
+    # district-local row -> reference row
+    result["ref"] = np.where(result["ref"] >= 0, task["rows"][np.maximum(result["ref"].to_numpy(dtype=np.intp), 0)], -1)
+    return result
+
+
+@profiled
+def match_geography(lr, index, n_jobs=None):
+    """
+    Match the (GEO_SLUGS) tuples of `lr` to the reference of `index`.
+
+    Returns `lr` with the matched reference tuple (xwalk_ columns), the
+    reference's other columns, district / block / village scores and the
+    village match method: exact, normalized, fuzzy or unmatched.
+    """
+    lr = lr[GEO_SLUGS].reset_index(drop=True)
+    reference = index.reference
+    keys = reference[GEO_SLUGS].assign(ref=np.arange(len(reference)))
+    ref = lr.merge(keys, on=GEO_SLUGS, how="left")["ref"].to_numpy()
+    exact = ~np.isnan(ref)
+
+    out = pd.DataFrame(
+        {
+            "ref": np.where(exact, ref, -1).astype(np.intp),
+            "district_score": np.where(exact, 1.0, 0.0),
+            "block_score": np.where(exact, 1.0, 0.0),
+            "village_score": np.where(exact, 1.0, 0.0),
+            "method": np.where(exact, "exact", "unmatched"),
+        }
+    )
+
+    rest = np.flatnonzero(~exact)
+    if len(rest):
+        norm = {col: normalize_geo(lr[col].iloc[rest]).to_numpy() for col in GEO_SLUGS}
+        district, district_score = index.match_districts(norm["zilla_district_lr"])
+        block, block_score = index.match_blocks(district, norm["anchal_block_lr"])
+        queries = pd.DataFrame(
+            {
+                "village": norm["mauja_village_lr"],
+                "numbers": _numbers(pd.Series(norm["mauja_village_lr"])).to_numpy(),
+                "block": block,
+            },
+            index=rest,
+        )
+        tasks = [(index.district_task(d), queries[district == d]) for d in np.unique(district[district >= 0])]
+        if n_jobs == 1 or len(tasks) <= 1:
+            results = [_match_district(t) for t in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                results = list(executor.map(_match_district, tasks))
+        out.loc[rest, "district_score"] = district_score
+        out.loc[rest, "block_score"] = block_score
+        for result in results:
+            for col in ("ref", "village_score", "method"):
+                out.loc[result.index, col] = result[col]
+
+    # reference rows of the matches (-1: all missing)
+    matches = (
+        reference.rename(columns={col: f"xwalk_{col}" for col in GEO_SLUGS})
+        .reindex(out["ref"].to_numpy(dtype=np.intp))
+        .reset_index(drop=True)
+    )
+    return pd.concat([lr, matches, out.drop(columns="ref")], axis=1)
+
+
+# ----------------------------------------------------------------------------
+# Cached crosswalk
+# ----------------------------------------------------------------------------
+def get_lr_geography(engine="pyarrow", directory=None):
+    """Unique (GEO_SLUGS) tuples of the land records, stripped as in the notebooks"""
+    df = get_fulldata(directory, engine=engine, compact=engine != "pandas", usecols=list(LR_GEO_COLUMNS))
+    df = df.rename(columns=LR_GEO_COLUMNS).drop_duplicates(GEO_SLUGS)
+    df = pd.DataFrame({col: df[col].astype(object).str.strip() for col in GEO_SLUGS})
+    return df.drop_duplicates().dropna().reset_index(drop=True)
+
+
+def build_crosswalk(lr, reference_path=XWALK_DATA, output=CROSSWALK_DATA, n_jobs=None):
+    """
+    Match the tuples of `lr` not in the cached crosswalk at `output` (all of
+    them if the reference or this module changed) and rewrite it.
+    """
+    state_path = os.path.splitext(output)[0] + ".json"
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+    reference_hash = _file_hash(reference_path, state.get("reference"))
+    code = hashlib.sha256(inspect.getsource(sys.modules[__name__]).encode("utf-8")).hexdigest()
+
+    cached = None
+    if (
+        os.path.exists(output)
+        and state.get("code") == code
+        and state.get("reference", {}).get("sha256") == reference_hash["sha256"]
+    ):
+        cached = pd.read_parquet(output)
+        seen = lr.merge(cached[GEO_SLUGS], on=GEO_SLUGS, how="left", indicator=True)["_merge"] == "both"
+        lr = lr[~seen.to_numpy()]
+    print(f"{len(lr):,} tuples to match" + (f" ({len(cached):,} cached)" if cached is not None else ""))
+
+    if len(lr) or cached is None:
+        result = match_geography(lr, GeoIndex(read_reference(reference_path)), n_jobs=n_jobs)
+        result = result if cached is None else pd.concat([cached, result], ignore_index=True)
+        _write_parquet(result, output)
+        state = {"reference": reference_hash, "code": code}
+        with open(state_path, "w") as f:
+            json.dump(state, f, indent=1)
+    else:
+        result = cached
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crosswalk the land record geography to the census crosswalk")
+    parser.add_argument("--engine", default="pyarrow", help="get_fulldata engine")
+    parser.add_argument("--reference", default=XWALK_DATA, help="Census crosswalk (.dta)")
+    parser.add_argument("--output", default=CROSSWALK_DATA, help="Cached crosswalk parquet")
+    parser.add_argument("--n-jobs", type=int, default=None, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    result = build_crosswalk(get_lr_geography(args.engine), args.reference, args.output, n_jobs=args.n_jobs)
+    counts = result["method"].value_counts()
+    print(", ".join(f"{method} {n:,}" for method, n in counts.items()))
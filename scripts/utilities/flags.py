@@ -0,0 +1,363 @@
+"""
+Per-account flag table: flagged (organization / government) names and
+near-duplicate accounts.
+
+flagged_land_accounts.ipynb drops the plots whose name_of_ryot is in
+data/flagged_names.txt with a list membership test per row, and
+06_append_dedupe_land_records.ipynb only drops exact account_no repeats
+within a file. Here
+
+- each distinct name is looked up once in a hash index of the flagged
+  names (flagged_name), and searched once for any flagged name as a
+  substring (flagged_substring, the commented str.contains variant of the
+  notebook). The substring search is a single RE2 alternation of all the
+  names run with pyarrow's string kernels: RE2 compiles it to one
+  automaton, so every name is scanned once whatever the length of the list.
+- accounts (one per district and account_no) are compared on their
+  (name_of_ryot, name_of_father, mouza), normalized as in
+  utilities/crosswalk.py (so vowel-length spellings agree and village
+  numbers are kept): MinHash signatures of character
+  trigrams, LSH bands to find candidate pairs, and the estimated Jaccard
+  similarity of the signatures to keep the close ones. Accounts linked by
+  such pairs, or with identical text, share a dup_group, also across
+  districts.
+
+Build from ./scripts (or via `make flags` from the repo root):
+
+    python -m utilities.flags --engine parquet
+
+and read the table back with get_flagdata(). Its key is (district,
+account_no), the key of the account_id dictionary (utilities/ids.py); the
+build looks up name_id / account_id (-1 for keys not in the dictionaries)
+but does not add to them. E.g. the plots of unflagged accounts are
+
+    flags = get_flagdata(columns=["district", "account_no", "flagged_name"])
+    df.merge(flags[~flags.flagged_name], on=["district", "account_no"])
+"""
+import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utilities import ids
+from utilities.crosswalk import _code_matrix, _numbers, normalize_geo
+from utilities.profiling import profiled
+from utilities.ids import ACCOUNT_KEY
+from utilities.utils import get_fulldata
+
+FLAGGED_NAMES = "../data/flagged_names.txt"
+FLAGS_DATA = "../data/flags/account_flags.parquet"
+FLAG_USECOLS = ["account_no", "name_of_ryot", "name_of_father", "district", "mouza"]
+DUP_COLUMNS = ["name_of_ryot", "name_of_father", "mouza"]
+
+# Flagged names shorter than this are only matched exactly ("." would
+# otherwise flag every abbreviated name)
+MIN_PATTERN_LENGTH = 4
+SHINGLE = 3
+NUM_PERM = 32
+BANDS = 8
+# Minimum estimated Jaccard similarity of the trigram sets of two accounts
+DUP_THRESHOLD = 0.8
+CHUNK_ROWS = 100_000
+
+_RE2_SPECIAL = re.compile(r"([\\.^$|?*+()\[\]{}])")
+
+
+def load_flagged_names(path=FLAGGED_NAMES):
+    """The distinct non-empty lines of `path`, stripped, in file order"""
+    with open(path, encoding="utf-8") as f:
+        names = (line.strip() for line in f)
+        return list(dict.fromkeys(name for name in names if name))
+
+
+def substring_pattern(names, min_length=MIN_PATTERN_LENGTH):
+    """One RE2 alternation of the `names` of at least `min_length` characters (longest first)"""
+    names = sorted({n for n in names if len(n) >= min_length}, key=lambda n: (-len(n), n))
+    return "|".join(_RE2_SPECIAL.sub(r"\\\1", n) for n in names)
+
+
+@profiled
+def match_names(values, names, min_length=MIN_PATTERN_LENGTH):
+    """
+    Flags of each of `values` (a Series of names) against the flagged
+    `names`, as a frame with the index of `values`:
+
+    - flagged_name: equal to one of `names` (both stripped)
+    - flagged_substring: contains one of `names` of at least min_length
+      characters
+    - flag_pattern: the flagged name found (categorical; missing if none)
+
+    Only the distinct values are looked up and scanned.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    array = pc.utf8_trim_whitespace(pa.array(np.asarray(uniques, dtype=object), type=pa.string(), from_pandas=True))
+    stripped = np.asarray(array.to_pylist(), dtype=object)
+
+    keys = pd.Index(list(dict.fromkeys(n.strip() for n in names)))
+    exact = keys.get_indexer(pd.Index(stripped)) >= 0
+    found = np.zeros(len(array), dtype=bool)
+    found_names = np.full(len(array), None, dtype=object)
+    pattern = substring_pattern(keys, min_length)
+    if pattern and len(array):
+        found = pc.fill_null(pc.match_substring_regex(array, pattern), False).to_numpy(zero_copy_only=False)
+        matched = pc.extract_regex(array.filter(found), f"(?P<name>{pattern})").field("name")
+        found_names[found] = matched.to_numpy(zero_copy_only=False)
+    # exact matches of the short names have no substring hit to report
+    found_names[exact & ~found] = stripped[exact & ~found]
+    pattern_codes, patterns = pd.factorize(found_names)
+
+    # one extra unflagged entry for the missing values (code -1)
+    codes = np.where(codes >= 0, codes, len(array))
+    index = values.index if isinstance(values, pd.Series) else None
+    return pd.DataFrame(
+        {
+            "flagged_name": np.append(exact, False)[codes],
+            "flagged_substring": np.append(found, False)[codes],
+            "flag_pattern": pd.Categorical.from_codes(np.append(pattern_codes, -1)[codes], categories=patterns),
+        },
+        index=index,
+    )
+
+
+# ----------------------------------------------------------------------------
+# MinHash / LSH
+# ----------------------------------------------------------------------------
+def _permutations(num_perm, seed):
+    """Odd multipliers and offsets of the multiply-shift hashes (one per permutation)"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 2**63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+    return a, b
+
+
+def _minhash_chunk(args):
+    """Worker: (rows x num_perm) uint32 MinHash signatures of the character shingles of `texts`"""
+    texts, a, b, k = args
+    matrix, lengths = _code_matrix(texts)
+    if matrix.shape[1] < k:
+        matrix = np.pad(matrix, ((0, 0), (0, k - matrix.shape[1])), constant_values=-1)
+    width = matrix.shape[1] - k + 1
+    # the k code points of every shingle as one integer (exact below 0x110000 ** 3 < 2 ** 64)
+    shingles = np.zeros((len(texts), width), dtype=np.uint64)
+    for j in range(k):
+        shingles = shingles * np.uint64(0x110000) + matrix[:, j : j + width].astype(np.uint64)
+    # texts shorter than k are one (padded) shingle
+    invalid = np.arange(width) >= np.maximum(lengths - k + 1, 1)[:, None]
+
+    signatures = np.empty((len(texts), len(a)), dtype=np.uint32)
+    for p in range(len(a)):
+        hashed = (shingles * a[p] + b[p]) >> np.uint64(32)
+        hashed[invalid] = np.iinfo(np.uint32).max
+        signatures[:, p] = hashed.min(axis=1)
+    return signatures
+
+
+@profiled
+def minhash(texts, num_perm=NUM_PERM, k=SHINGLE, seed=0, n_jobs=None, chunk=CHUNK_ROWS):
+    """
+    MinHash signatures (len(texts) x num_perm, uint32) of the sets of
+    k-character shingles of `texts`. Texts are processed in chunks of
+    similar length (so little of each chunk is padding), in `n_jobs`
+    worker processes (default: all cores).
+    """
+    texts = list(texts)
+    a, b = _permutations(num_perm, seed)
+    order = np.argsort(np.fromiter(map(len, texts), dtype=np.intp, count=len(texts)), kind="stable")
+    tasks = [
+        ([texts[i] for i in order[start : start + chunk]], a, b, k) for start in range(0, len(texts), chunk)
+    ]
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1 or len(tasks) <= 1:
+        results = [_minhash_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_minhash_chunk, tasks))
+
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    if results:
+        signatures[order] = np.concatenate(results)
+    return signatures
+
+
+def lsh_pairs(signatures, bands=BANDS, keys=None):
+    """
+    Candidate pairs (left < right) of rows of `signatures` that agree on
+    every row of at least one of `bands` bands (and on `keys`, if given:
+    it is part of every band's bucket key). Each member of a bucket is
+    paired with the bucket's first member, which links the same rows with
+    O(rows) pairs however common a bucket is.
+    """
+    n, num_perm = signatures.shape
+    rows = num_perm // bands
+    start = np.zeros(n, dtype=np.uint64) if keys is None else pd.factorize(keys)[0].astype(np.uint64)
+    left, right = [], []
+    for band in range(bands):
+        block = signatures[:, band * rows : (band + 1) * rows].astype(np.uint64)
+        key = start.copy()
+        for col in block.T:
+            key = key * np.uint64(0x9E3779B97F4A7C15) + col
+        order = np.argsort(key, kind="stable")
+        sorted_key = key[order]
+        new_bucket = np.concatenate([np.ones(min(n, 1), dtype=bool), sorted_key[1:] != sorted_key[:-1]])
+        leader = order[new_bucket][np.cumsum(new_bucket) - 1]
+        member = leader != order
+        left.append(leader[member])
+        right.append(order[member])
+    left, right = np.concatenate(left), np.concatenate(right)
+    pairs = np.unique(np.minimum(left, right) * n + np.maximum(left, right))
+    return pairs // max(n, 1), pairs % max(n, 1)
+
+
+def _components(n, left, right):
+    """Connected component of each of n nodes (labelled by its smallest node) given edges (left, right)"""
+    labels = np.arange(n)
+    while True:
+        low = np.minimum(labels[left], labels[right])
+        new = labels.copy()
+        np.minimum.at(new, left, low)
+        np.minimum.at(new, right, low)
+        new = new[new]
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+
+@profiled
+def near_duplicates(texts, threshold=DUP_THRESHOLD, keys=None, num_perm=NUM_PERM, bands=BANDS, n_jobs=None):
+    """
+    Group of each of `texts` (distinct strings): texts whose MinHash
+    signatures agree on at least `threshold` of the permutations, directly
+    or through other texts, share the smallest position among them. Texts
+    with different `keys` (if given) never share an LSH bucket.
+    Returns (groups, similarity), with the best similarity to a linked
+    text (0 for texts without one).
+    """
+    signatures = minhash(texts, num_perm=num_perm, n_jobs=n_jobs)
+    left, right = lsh_pairs(signatures, bands, keys=keys)
+    similarity = (signatures[left] == signatures[right]).mean(axis=1)
+    close = similarity >= threshold
+    if keys is not None:
+        # against bucket key collisions
+        keys = np.asarray(keys)
+        close &= keys[left] == keys[right]
+    left, right, similarity = left[close], right[close], similarity[close]
+
+    best = np.zeros(len(signatures))
+    np.maximum.at(best, left, similarity)
+    np.maximum.at(best, right, similarity)
+    return _components(len(signatures), left, right), best
+
+
+# ----------------------------------------------------------------------------
+# Flag table
+# ----------------------------------------------------------------------------
+def _dup_text(accounts):
+    """Normalized name, father's name and village of each account joined with '#' ('' without a name)"""
+    normalized = [normalize_geo(accounts[col].astype(object)).fillna("") for col in DUP_COLUMNS]
+    text = normalized[0] + "#" + normalized[1] + "#" + normalized[2]
+    return text.where(normalized[0] != "", "")
+
+
+@profiled
+def build_flags(df, names, threshold=DUP_THRESHOLD, min_length=MIN_PATTERN_LENGTH, n_jobs=None):
+    """
+    One row per (district, account_no) of the plot-level `df` (FLAG_USECOLS)
+    with its number of plots, the first name_of_ryot, name_of_father and
+    mouza, and
+
+    - flagged_name / flagged_substring / flag_pattern: match_names of any
+      of its plots' names (the first pattern found)
+    - dup_group: near-duplicate group (-1 if none); dup_size: accounts in
+      the group; dup_districts: districts in the group; dup_exact: another
+      account has the same normalized text; dup_similarity: best estimated
+      Jaccard similarity to another account of the group
+    """
+    flags = match_names(df["name_of_ryot"], names, min_length=min_length)
+    accounts = (
+        pd.concat([df[ACCOUNT_KEY + DUP_COLUMNS], flags], axis=1)
+        .groupby(ACCOUNT_KEY, observed=True, sort=False)
+        .agg(
+            nplots=("name_of_ryot", "size"),
+            **{col: (col, "first") for col in DUP_COLUMNS},
+            flagged_name=("flagged_name", "any"),
+            flagged_substring=("flagged_substring", "any"),
+            flag_pattern=("flag_pattern", "first"),
+        )
+        .reset_index()
+    )
+
+    text_codes, texts = pd.factorize(_dup_text(accounts))
+    texts = np.asarray(texts, dtype=object)
+    has_text = texts != ""
+    groups = np.full(len(texts), -1)
+    similarity = np.zeros(len(texts))
+    if has_text.any():
+        # identical texts are one distinct text already; different numbers
+        # (ward 10 / ward 11, plot numbers in names) are different accounts
+        numbers = _numbers(pd.Series(texts[has_text], dtype=object)).to_numpy()
+        labels, best = near_duplicates(texts[has_text], threshold=threshold, keys=numbers, n_jobs=n_jobs)
+        groups[has_text] = np.flatnonzero(has_text)[labels]
+        similarity[has_text] = best
+    exact = np.bincount(text_codes, minlength=len(texts)) > 1
+
+    group = groups[text_codes]
+    size = np.append(np.bincount(group[group >= 0], minlength=len(texts)), 0)[group]
+    duplicate = size > 1
+    dup_group = np.full(len(accounts), -1)
+    dup_group[duplicate] = pd.factorize(group[duplicate])[0]
+    district_codes = pd.factorize(accounts["district"])[0]
+    districts = (
+        pd.DataFrame({"group": group[duplicate], "district": district_codes[duplicate]})
+        .groupby("group")["district"]
+        .nunique()
+    )
+    return accounts.assign(
+        dup_group=dup_group,
+        dup_size=np.where(duplicate, size, 1),
+        dup_districts=np.where(duplicate, districts.reindex(group).fillna(1).to_numpy(dtype=int), 1),
+        dup_exact=exact[text_codes] & (texts[text_codes] != ""),
+        dup_similarity=np.where(exact[text_codes] & duplicate, 1.0, similarity[text_codes]),
+    )
+
+
+def get_flagdata(path=FLAGS_DATA, columns=None):
+    """Read the cached per-account flag table (see build_flags)"""
+    return pd.read_parquet(path, columns=columns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the per-account flagged-name and near-duplicate table")
+    parser.add_argument("--engine", default="pyarrow", help="get_fulldata engine")
+    parser.add_argument("--flagged", default=FLAGGED_NAMES, help="Flagged names, one per line")
+    parser.add_argument("--output", default=FLAGS_DATA, help="Output parquet path")
+    parser.add_argument("--threshold", type=float, default=DUP_THRESHOLD, help="Near-duplicate similarity")
+    parser.add_argument("--min-length", type=int, default=MIN_PATTERN_LENGTH, help="Shortest substring pattern")
+    parser.add_argument("--n-jobs", type=int, default=None, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    df = get_fulldata(engine=args.engine, compact=True, usecols=FLAG_USECOLS)
+    print(f"{len(df):,} plots")
+    flags = build_flags(
+        df, load_flagged_names(args.flagged), threshold=args.threshold, min_length=args.min_length, n_jobs=args.n_jobs
+    )
+    del df
+    # read-only: the accounts build (utilities/accounts.py) adds new keys
+    flags = ids.add_ids(flags)
+    duplicate = flags["dup_group"] >= 0
+    print(
+        f"{len(flags):,} accounts: {flags['flagged_name'].sum():,} flagged names, "
+        f"{flags['flagged_substring'].sum():,} flagged substrings, {duplicate.sum():,} in "
+        f"{flags.loc[duplicate, 'dup_group'].nunique():,} near-duplicate groups "
+        f"({(duplicate & (flags['dup_districts'] > 1)).sum():,} across districts)"
+    )
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    flags.to_parquet(args.output, index=False)
@@ -1,9 +1,14 @@
 # Graph utilities
+from statistics import NormalDist
+
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
+import numpy as np
 import seaborn as sns
 import pandas as pd
 
+from utilities.groups import group_codes
+
 sns.set_theme(
     context="notebook",
     font_scale=1.05,
@@ -147,6 +152,293 @@ def conbarplot(
     return ax
 
 
+# ----------------------------------------------------------------------------
+# Pre-aggregated plots
+#
+# sns.displot / histplot / pointplot on the 12M-42M row frames rasterize
+# every value and bootstrap every CI. The helpers below reduce the data to
+# O(bins) rows with bincounts and one sort first, and the *_binned / *_points
+# / *_summary plots draw only those rows:
+#
+#     bins = bin_counts(accounts, "nplots", by="caste", discrete=True, binrange=(1, 8), stat="density")
+#     histplot_binned(bins, "nplots", stat="density", hue="caste")
+#     ecdfplot_points(ecdf_points(accounts, "tt_area_acre", by="caste", clip=(0, 1)), "tt_area_acre", hue="caste")
+#     conbarplot_summary(mean_ci(accounts, "tt_area_acre", by="religion"), x="religion", groups=[...])
+# ----------------------------------------------------------------------------
+def _values_by_group(df, col, by, clip=None):
+    """Non-missing values of `col` within `clip`, their group codes and the group labels"""
+    codes, groups = group_codes(df, by)
+    values = df[col].to_numpy(dtype=float, na_value=np.nan)
+    keep = (codes >= 0) & ~np.isnan(values)
+    if clip is not None:
+        lo, hi = clip
+        if lo is not None:
+            keep &= values >= lo
+        if hi is not None:
+            keep &= values <= hi
+    return values[keep], codes[keep], groups
+
+
+def _long_frame(columns, codes, groups, by):
+    frame = pd.DataFrame(columns)
+    if by is not None:
+        frame.insert(0, by, pd.Categorical.from_codes(codes, categories=groups))
+    return frame
+
+
+def bin_counts(df, col, bins=50, by=None, discrete=False, binrange=None, stat="count"):
+    """
+    Histogram of `col` per group of `by` as a long frame (one row per group
+    and bin, empty bins included): [by], col (bin center), left, right,
+    count and, for stat="probability" / "percent" / "density", that column
+    normalized within each group (like common_norm=False).
+
+    discrete=True gives unit-width bins centered on the integers, as in
+    seaborn. Values outside `binrange` (lo, hi) are dropped.
+    """
+    values, codes, groups = _values_by_group(df, col, by, clip=binrange)
+    ngroups = 1 if groups is None else len(groups)
+    if len(values):
+        lo, hi = (values.min(), values.max()) if binrange is None else binrange
+    else:
+        lo, hi = (0, 1) if binrange is None else binrange
+    if discrete:
+        first = int(np.rint(lo))
+        nbins = int(np.rint(hi)) - first + 1
+        index = np.rint(values).astype(np.intp) - first
+        edges = np.arange(first, first + nbins + 1) - 0.5
+    else:
+        nbins = bins
+        width = (hi - lo) / nbins or 1
+        edges = lo + np.arange(nbins + 1) * width
+        # same bin assignment as np.histogram, also for values on the edges
+        index = np.minimum(np.searchsorted(edges, values, side="right") - 1, nbins - 1)
+
+    counts = np.bincount(codes * nbins + index, minlength=ngroups * nbins).reshape(ngroups, nbins)
+    frame = _long_frame(
+        {
+            col: np.tile((edges[:-1] + edges[1:]) / 2, ngroups),
+            "left": np.tile(edges[:-1], ngroups),
+            "right": np.tile(edges[1:], ngroups),
+            "count": counts.ravel(),
+        },
+        np.repeat(np.arange(ngroups), nbins),
+        groups,
+        by,
+    )
+    if stat != "count":
+        totals = counts.sum(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            normed = counts / totals
+            if stat == "percent":
+                normed = normed * 100
+            elif stat == "density":
+                normed = normed / np.diff(edges)
+            elif stat != "probability":
+                raise ValueError(f"Unknown stat: {stat}")
+        frame[stat] = normed.ravel()
+    return frame
+
+
+def ecdf_points(df, col, by=None, clip=None, max_points=2000):
+    """
+    Step points (col, proportion) of the ECDF of `col` per group of `by`,
+    from one sort: one point per distinct value, thinned to at most
+    `max_points` per group (the points where the proportion crosses
+    multiples of 1 / max_points, so every step larger than that is kept).
+    Values outside `clip` (lo, hi) are dropped before the ECDF is taken,
+    as with a .query() on the data.
+    """
+    values, codes, groups = _values_by_group(df, col, by, clip=clip)
+    ngroups = 1 if groups is None else len(groups)
+    sizes = np.bincount(codes, minlength=ngroups)
+    starts = np.cumsum(sizes) - sizes
+    # group the values (radix sort of small codes), then sort each group in
+    # place: several times faster than a lexsort on (codes, values)
+    small = np.int16 if ngroups < 1 << 15 else np.int32
+    values = values[np.argsort(codes.astype(small), kind="stable")]
+    codes = np.repeat(np.arange(ngroups), sizes)
+    for start, size in zip(starts, sizes):
+        values[start : start + size].sort()
+
+    # last position of every run of equal (group, value)
+    last = np.flatnonzero(np.r_[(values[1:] != values[:-1]) | (codes[1:] != codes[:-1]), len(values) > 0])
+    point_codes = codes[last]
+    proportion = (last - starts[point_codes] + 1) / sizes[point_codes]
+
+    # thin: keep the first point at or above each multiple of 1 / max_points
+    step = np.floor(proportion * max_points)
+    keep = np.r_[True, (step[1:] != step[:-1]) | (point_codes[1:] != point_codes[:-1])] if len(last) else []
+    return _long_frame(
+        {col: values[last][keep], "proportion": proportion[keep]},
+        point_codes[keep],
+        groups,
+        by,
+    )
+
+
+def mean_ci(df, col, by=None, ci=95):
+    """
+    n, mean, sd and the normal-approximation `ci`% interval of the mean
+    (ll, hl) of `col` per group of `by`. With hundreds of thousands of rows
+    per group this matches the bootstrap intervals of sns.pointplot.
+    """
+    values, codes, groups = _values_by_group(df, col, by)
+    ngroups = 1 if groups is None else len(groups)
+    n = np.bincount(codes, minlength=ngroups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(codes, weights=values, minlength=ngroups) / n
+        sd = np.sqrt(np.bincount(codes, weights=(values - mean[codes]) ** 2, minlength=ngroups) / (n - 1))
+        half = NormalDist().inv_cdf(0.5 + ci / 200) * sd / np.sqrt(n)
+    return _long_frame(
+        {"n": n, "mean": mean, "sd": sd, "ll": mean - half, "hl": mean + half},
+        np.arange(ngroups),
+        groups,
+        by,
+    )
+
+
+def _hue_levels(data, hue, order, palette, color):
+    if hue is None:
+        return [(None, data, color)]
+    levels = order or list(data[hue].unique())
+    colors = sns.color_palette(palette, len(levels))
+    return [(level, data[data[hue] == level], c) for level, c in zip(levels, colors)]
+
+
+def histplot_binned(
+    bins,
+    x,
+    stat="count",
+    hue=None,
+    order=None,
+    palette="cividis",
+    color="0.3",
+    alpha=0.5,
+    linestyles=None,
+    figsize=(9, 6),
+    ax=None,
+):
+    """
+    Histogram from bin_counts output, one filled step outline per hue level
+    """
+    if ax is None:
+        _, ax = plt.subplots(figsize=figsize)
+    for ix, (level, rows, c) in enumerate(_hue_levels(bins, hue, order, palette, color)):
+        edges = np.r_[rows["left"].to_numpy(), rows["right"].to_numpy()[-1:]]
+        ax.stairs(
+            rows[stat].to_numpy(),
+            edges,
+            fill=True,
+            alpha=alpha,
+            color=c,
+            label=level,
+        )
+        ax.stairs(
+            rows[stat].to_numpy(),
+            edges,
+            color="0.3" if hue else c,
+            linestyle=linestyles[ix] if linestyles else "-",
+            linewidth=2 if hue else 1,
+        )
+    sns.despine(left=True)
+    ax.set_xlabel(x)
+    ax.set_ylabel(stat.capitalize())
+    if hue:
+        ax.legend(title=hue)
+    return ax
+
+
+def ecdfplot_points(
+    points,
+    x,
+    hue=None,
+    order=None,
+    palette="cividis",
+    color="0.3",
+    alpha=1,
+    linestyles=None,
+    figsize=(9, 6),
+    ax=None,
+):
+    """
+    ECDF from ecdf_points output, one step line per hue level
+    """
+    if ax is None:
+        _, ax = plt.subplots(figsize=figsize)
+    for ix, (level, rows, c) in enumerate(_hue_levels(points, hue, order, palette, color)):
+        ax.step(
+            rows[x].to_numpy(),
+            rows["proportion"].to_numpy(),
+            where="post",
+            color=c,
+            alpha=alpha,
+            linestyle=linestyles[ix] if linestyles else "-",
+            label=level,
+        )
+    ax.set_ylim(0, 1.02)
+    sns.despine(left=True)
+    ax.set_xlabel(x)
+    ax.set_ylabel("Proportion")
+    if hue:
+        ax.legend(title=hue)
+    return ax
+
+
+def conbarplot_summary(
+    summary,
+    x,
+    y="mean",
+    groups=None,
+    xticklabels=None,
+    title=None,
+    annote_scaler=2,
+    annotesize=11,
+    titlesize=15,
+    palette="cividis",
+    alpha=0.7,
+    ax=None,
+):
+    """
+    conbarplot from one row per group (e.g. mean_ci output): bars of `y`,
+    points with their ll-hl intervals, connected by a dashed line. With
+    two or more `groups`, the first is annotated with its mean and the
+    second with the difference, as in conbarplot.
+    """
+    summary = summary.set_index(x)
+    groups = groups or list(summary.index)
+    rows = summary.loc[groups]
+    pos = np.arange(len(groups))
+    means = rows[y].to_numpy()
+
+    ax = ax or plt.gca()
+    ax.bar(pos, means, color=sns.color_palette(palette, len(groups)), alpha=alpha, width=0.8)
+    ax.plot(pos, means, linestyle="--", color=".4", zorder=2)
+    ax.errorbar(
+        pos,
+        means,
+        yerr=[means - rows["ll"].to_numpy(), rows["hl"].to_numpy() - means],
+        fmt="o",
+        color=".3",
+        elinewidth=2,
+        zorder=3,
+    )
+    if len(groups) >= 2:
+        diff = means[1] - means[0]
+        plt.text(x=1, y=means[1] + annote_scaler, s=f"(Diff. = {diff:.1f})", ha="left", fontsize=annotesize)
+        plt.text(x=0, y=means[0] + annote_scaler, s=f"{means[0]:.1f}", ha="left", fontsize=annotesize)
+
+    sns.despine(left=True)
+    plt.ylabel("")
+    plt.xlabel("")
+    ax.set_xticks(pos)
+    ax.set_xticklabels(xticklabels or [str(g) for g in groups])
+    ax.yaxis.set_major_locator(plt.MaxNLocator(4))
+    if title:
+        plt.title(title, fontweight="bold", size=titlesize, loc="left")
+    return ax
+
+
 def save_mpl_fig(savepath):
     plt.savefig(f"{savepath}.pdf", dpi=None, bbox_inches="tight", pad_inches=0)
     plt.savefig(f"{savepath}.png", dpi=120, bbox_inches="tight", pad_inches=0)
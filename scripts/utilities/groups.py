@@ -0,0 +1,18 @@
+"""
+Group codes shared by the table (utils.quantile_table, inequality) and plot
+(graph_utils) helpers. Kept free of the data-loading imports of utils.py,
+so the plotting module only needs numpy and pandas.
+"""
+import numpy as np
+import pandas as pd
+
+
+def group_codes(df, by):
+    """
+    Code of each row's group of column `by` (-1 where missing) and the
+    sorted group labels; by=None puts every row in group 0 (labels None).
+    """
+    if by is None:
+        return np.zeros(len(df), dtype=np.intp), None
+    codes, groups = pd.factorize(df[by], sort=True)
+    return codes, groups
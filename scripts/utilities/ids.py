@@ -0,0 +1,191 @@
+"""
+Stable integer ids for names and accounts.
+
+Each dictionary is a Parquet table of (key, id) that is only ever appended
+to: a name or account keeps its id across runs and datasets, so every
+intermediate table can carry name_id / account_id and be joined or grouped
+on integers. String keys are hashed once per distinct value (lookup_codes);
+joins on ids are array takes (take_by_id).
+
+Accounts are keyed on (district, account_no): account numbers are only
+unique within a district's records, and the same account_no in two
+districts is two accounts. A dictionary with a multi-column key stores the
+key columns instead of `key`.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+IDS_DIR = "../data/ids/"
+NAME_IDS = os.path.join(IDS_DIR, "names.parquet")
+# not accounts.parquet: that dictionary was keyed on account_no alone
+ACCOUNT_IDS = os.path.join(IDS_DIR, "district_accounts.parquet")
+ACCOUNT_KEY = ["district", "account_no"]
+
+
+def _plain(series):
+    """A categorical as its categories' dtype (other dtypes unchanged)"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.astype(series.cat.categories.dtype)
+    return series
+
+
+def distinct(values):
+    """
+    Codes of `values` (a Series, or a DataFrame of key columns) in its
+    distinct non-missing values or rows, first-seen order (-1 where
+    missing), and those values / rows. Rows are coded one column at a time
+    from the column codes, so only distinct values are hashed.
+    """
+    if not isinstance(values, pd.DataFrame):
+        codes, uniques = pd.factorize(values)
+        return codes, _plain(pd.Series(uniques))
+
+    combined = np.zeros(len(values), dtype=np.int64)
+    missing = np.zeros(len(values), dtype=bool)
+    for col in values.columns:
+        col_codes, col_uniques = pd.factorize(values[col])
+        missing |= col_codes < 0
+        # refactorized after each column, so the combined code stays below rows * values
+        combined = pd.factorize(combined * max(len(col_uniques), 1) + col_codes)[0]
+    valid = np.flatnonzero(~missing)
+    codes = np.full(len(values), -1, dtype=np.int64)
+    codes[valid] = pd.factorize(combined[valid])[0]
+    first = valid[np.unique(codes[valid], return_index=True)[1]]
+    uniques = values.iloc[first].reset_index(drop=True)
+    return codes, pd.DataFrame({col: _plain(uniques[col]) for col in uniques.columns})
+
+
+def lookup_codes(values, keys):
+    """
+    Position of each of `values` in `keys` (-1 where absent or missing);
+    both a Series, or both DataFrames of the same key columns.
+
+    Only the distinct values are hashed: the categories of a categorical,
+    otherwise the uniques from pd.factorize (per column for DataFrames).
+    """
+    if isinstance(values, pd.DataFrame):
+        both = pd.concat([keys.reset_index(drop=True), values.reset_index(drop=True)], ignore_index=True)
+        codes, uniques = distinct(both)
+        pos = np.full(max(len(uniques), 1), -1)
+        pos[codes[: len(keys)]] = np.arange(len(keys))
+        codes = codes[len(keys):]
+        return np.where(codes >= 0, pos[codes], -1)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    pos = pd.Index(keys).get_indexer(uniques)
+    if len(pos) == 0:
+        return np.full(len(codes), -1)
+    return np.where(codes >= 0, pos[codes], -1)
+
+
+def take(values, positions):
+    """values[positions] with missing values where positions == -1 (categoricals stay categorical)"""
+    positions = np.asarray(positions)
+    if len(values) == 0:
+        positions = np.full(len(positions), -1)
+        values = values.reindex([0])
+    safe = np.where(positions >= 0, positions, 0)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        return pd.Categorical.from_codes(np.where(positions >= 0, codes[safe], -1), dtype=values.dtype)
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        return np.where(positions >= 0, values.to_numpy(dtype="float64", na_value=np.nan)[safe], np.nan)
+    return pd.Series(values.to_numpy(dtype=object)[safe]).where(positions >= 0).to_numpy()
+
+
+def load_ids(path, key_columns=None):
+    """(key, id) dictionary at `path` (empty if not built yet)"""
+    if not os.path.exists(path):
+        columns = {col: pd.Series(dtype=object) for col in key_columns or ["key"]}
+        return pd.DataFrame({**columns, "id": pd.Series(dtype="int32")})
+    return pd.read_parquet(path)
+
+
+def dictionary_keys(table):
+    """The `key` column of a dictionary, or its key columns for a multi-column key"""
+    return table["key"] if "key" in table.columns else table.drop(columns="id")
+
+
+def update_ids(values, path):
+    """
+    Add the distinct non-missing `values` (a Series, or a DataFrame of key
+    columns: rows with a missing column are skipped) not yet in the
+    dictionary at `path`, with the next ids in first-seen order. Returns
+    the dictionary.
+    """
+    frame = isinstance(values, pd.DataFrame)
+    table = load_ids(path, list(values.columns) if frame else None)
+    uniques = distinct(values if frame else pd.Series(values))[1]
+    new = uniques[lookup_codes(uniques, dictionary_keys(table)) < 0]
+    if len(new) == 0:
+        return table
+
+    start = int(table["id"].max()) + 1 if len(table) else 0
+    if start + len(new) > np.iinfo("int32").max:
+        raise OverflowError(f"{path}: more than int32 ids")
+    added = new.reset_index(drop=True) if frame else pd.DataFrame({"key": new.to_numpy()})
+    added["id"] = np.arange(start, start + len(new), dtype="int32")
+    table = pd.concat([table, added], ignore_index=True) if len(table) else added
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    return table
+
+
+def encode(values, path=None, table=None):
+    """int32 ids of `values` (Series or key-column DataFrame) in a dictionary (-1 where not in it)"""
+    if table is None:
+        table = load_ids(path, list(values.columns) if isinstance(values, pd.DataFrame) else None)
+    pos = lookup_codes(values, dictionary_keys(table))
+    ids = table["id"].to_numpy()
+    return np.where(pos >= 0, ids[np.where(pos >= 0, pos, 0)] if len(ids) else -1, -1).astype("int32")
+
+
+def update_name_ids(names, path=NAME_IDS):
+    return update_ids(names, path)
+
+
+def update_account_ids(accounts, path=ACCOUNT_IDS):
+    """`accounts`: a DataFrame with the ACCOUNT_KEY columns"""
+    return update_ids(accounts[ACCOUNT_KEY], path)
+
+
+def add_ids(df, name_col="name_of_ryot", account_cols=ACCOUNT_KEY, update=False):
+    """
+    Add a name_id column if `name_col` is in `df` and an account_id column
+    if all of `account_cols` are; with `update`, unseen keys get new ids
+    first (otherwise their id is -1).
+    """
+    columns = {}
+    if name_col in df.columns:
+        columns["name_id"] = df[name_col], NAME_IDS
+    if all(col in df.columns for col in account_cols):
+        columns["account_id"] = df[list(account_cols)], ACCOUNT_IDS
+    for id_col, (values, path) in columns.items():
+        columns[id_col] = encode(values, path, table=update_ids(values, path) if update else None)
+    return df.assign(**columns)
+
+
+def id_positions(table_ids, ids):
+    """Row of `table_ids` holding each of `ids` (-1 where absent), by a dense array lookup"""
+    table_ids = np.asarray(table_ids)
+    size = max(int(table_ids.max()) + 1 if len(table_ids) else 0, 1)
+    position = np.full(size, -1, dtype="int64")
+    position[table_ids] = np.arange(len(table_ids))
+    ids = np.asarray(ids)
+    valid = (ids >= 0) & (ids < size)
+    return np.where(valid, position[np.where(valid, ids, 0)], -1)
+
+
+def take_by_id(table, id_col, ids, columns):
+    """
+    Columns of `table` (one row per id) for each of `ids`, as a DataFrame:
+    a left join on integer ids without hashing.
+    """
+    rows = id_positions(table[id_col].to_numpy(), ids)
+    return pd.DataFrame({col: take(table[col], rows) for col in columns})
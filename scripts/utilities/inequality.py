@@ -0,0 +1,197 @@
+"""
+Inequality of land holdings: Gini, Theil, Lorenz curves and top shares.
+
+Each measure is computed for every group from one sort of the values by
+(group, value), using within-group ranks and a single running sum, the
+same way quantile_table does it for percentiles. Typical use, on the
+per-account table (utilities/accounts.py):
+
+    accounts = get_accountdata()
+    inequality_table(accounts, ["tt_area_acre", "nplots"], by=["caste", "district"])
+    lorenz_curve(accounts, "tt_area_acre", by="caste")
+    bootstrap_inequality(accounts, "tt_area_acre", by="caste", n_boot=500)
+
+bootstrap_inequality resamples accounts within each group in a process
+pool; its estimate / ll / hl columns are what forestplot expects.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utilities.profiling import profiled
+from utilities.groups import group_codes
+
+TOP_SHARES = [0.001, 0.01, 0.1]
+LORENZ_POINTS = 101
+
+
+def _top_label(p):
+    return f"top_{p * 100:g}%"
+
+
+def _stat_names(top):
+    return ["n", "total", "mean", "gini", "theil"] + [_top_label(p) for p in top]
+
+
+def _sort_by_group(df, col, by):
+    """Non-missing values of `col` sorted by (group, value), their group codes, group sizes and labels"""
+    codes, groups = group_codes(df, by)
+    values = df[col].to_numpy(dtype=float, na_value=np.nan)
+    keep = (codes >= 0) & ~np.isnan(values)
+    codes, values = codes[keep], values[keep]
+    order = np.lexsort((values, codes))
+    ngroups = 1 if groups is None else len(groups)
+    return values[order], codes[order], np.bincount(codes, minlength=ngroups), groups
+
+
+def _lorenz_at(values, sizes, q):
+    """
+    Lorenz curve of every group at population shares `q` (groups x q),
+    from `values` sorted by (group, value); linear between accounts.
+    """
+    starts = np.cumsum(sizes) - sizes
+    cum = np.concatenate([[0.0], np.cumsum(values)])
+    pos = starts[:, None] + np.asarray(q, dtype=float)[None, :] * sizes[:, None]
+    lo = np.floor(pos).astype(np.intp)
+    hi = np.minimum(lo + 1, len(values))
+    below = cum[lo] + (pos - lo) * (cum[hi] - cum[lo]) - cum[starts][:, None]
+    total = cum[starts + sizes] - cum[starts]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return below / total[:, None]
+
+
+def _group_stats(values, codes, sizes, top=TOP_SHARES):
+    """groups x stats array (columns as in _stat_names) from sorted values"""
+    ngroups = len(sizes)
+    starts = np.cumsum(sizes) - sizes
+    n = sizes.astype(float)
+    rank = np.arange(len(values)) - starts[codes] + 1
+    total = np.bincount(codes, weights=values, minlength=ngroups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / n
+        # Gini from ranks of the sorted values: 2 * sum(i x_i) / (n sum x) - (n + 1) / n
+        gini = 2 * np.bincount(codes, weights=rank * values, minlength=ngroups) / (n * total) - (n + 1) / n
+        # Theil T = mean((x / mu) ln(x / mu)), with 0 ln 0 = 0
+        xlogx = np.where(values > 0, values * np.log(np.where(values > 0, values, 1)), 0)
+        theil = np.bincount(codes, weights=xlogx, minlength=ngroups) / total - np.log(mean)
+    shares = 1 - _lorenz_at(values, sizes, [1 - p for p in top])
+    stats = np.column_stack([n, total, mean, gini, theil, shares])
+    stats[sizes == 0, 1:] = np.nan
+    return stats
+
+
+@profiled
+def inequality_table(df, cols=("tt_area_acre", "nplots"), by=None, top=TOP_SHARES):
+    """
+    n, total, mean, Gini, Theil and top-share columns (e.g. top_1% = share
+    of the total held by the largest 1%) of each of `cols`.
+
+    `by` is None, a column or a list of columns; each is grouped on
+    separately. Rows are indexed by (by, group, variable); by=None gives
+    the single group "all".
+    """
+    cols = [cols] if isinstance(cols, str) else list(cols)
+    bys = by if isinstance(by, (list, tuple)) else [by]
+    frames = []
+    for b in bys:
+        for col in cols:
+            values, codes, sizes, groups = _sort_by_group(df, col, b)
+            stats = _group_stats(values, codes, sizes, top)
+            index = pd.MultiIndex.from_arrays(
+                [
+                    ["all" if b is None else b] * len(sizes),
+                    ["all"] if groups is None else list(groups),
+                    [col] * len(sizes),
+                ],
+                names=["by", "group", "variable"],
+            )
+            frames.append(pd.DataFrame(stats, index=index, columns=_stat_names(top)))
+    result = pd.concat(frames)
+    return result.astype({"n": "int64"})
+
+
+@profiled
+def lorenz_curve(df, col, by=None, points=LORENZ_POINTS):
+    """
+    Lorenz curve of `col`: share of the total held by the smallest
+    population share of accounts, at `points` evenly spaced shares.
+    Indexed by population_share with one column per group (like
+    quantile_table), or a single `col` column when by=None.
+    """
+    values, codes, sizes, groups = _sort_by_group(df, col, by)
+    q = np.linspace(0, 1, points)
+    curve = _lorenz_at(values, sizes, q)
+    return pd.DataFrame(
+        curve.T,
+        index=pd.Index(q, name="population_share"),
+        columns=[col] if groups is None else groups,
+    )
+
+
+# ----------------------------------------------------------------------------
+# Bootstrap
+# ----------------------------------------------------------------------------
+_BOOT = {}
+
+
+def _boot_init(values, codes, sizes, top):
+    _BOOT.update(values=values, codes=codes, sizes=sizes, top=top)
+
+
+def _boot_replicates(seeds):
+    """Worker: group stats of one resample per seed (replicates x groups x stats)"""
+    values, codes, sizes, top = _BOOT["values"], _BOOT["codes"], _BOOT["sizes"], _BOOT["top"]
+    starts = np.cumsum(sizes) - sizes
+    out = []
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        # Draw within each group; the group blocks are contiguous and sorted,
+        # so sorting the drawn positions sorts the resampled values too
+        idx = starts[codes] + (rng.random(len(values)) * sizes[codes]).astype(np.intp)
+        idx.sort()
+        out.append(_group_stats(values[idx], codes, sizes, top))
+    return np.stack(out) if out else np.empty((0, len(sizes), len(_stat_names(top))))
+
+
+@profiled
+def bootstrap_inequality(df, col, by=None, n_boot=200, ci=0.95, top=TOP_SHARES, n_jobs=None, seed=0):
+    """
+    Percentile bootstrap intervals for the inequality_table measures of
+    `col`, resampling rows with replacement within each group.
+
+    Returns one row per (group, stat) with the point estimate and the
+    `ci` interval as estimate / ll / hl. Replicates are spread over
+    `n_jobs` worker processes (default: all cores); they are seeded
+    from `seed`, so results do not depend on n_jobs.
+    """
+    values, codes, sizes, groups = _sort_by_group(df, col, by)
+    estimate = _group_stats(values, codes, sizes, top)
+
+    seeds = np.random.SeedSequence(seed).spawn(n_boot)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    batches = [seeds[i::n_jobs] for i in range(n_jobs) if seeds[i::n_jobs]]
+    if n_jobs == 1:
+        _boot_init(values, codes, sizes, top)
+        replicates = [_boot_replicates(b) for b in batches]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_jobs, initializer=_boot_init, initargs=(values, codes, sizes, top)
+        ) as executor:
+            replicates = list(executor.map(_boot_replicates, batches))
+    replicates = np.concatenate(replicates)
+
+    alpha = (1 - ci) / 2
+    with np.errstate(invalid="ignore"):
+        ll, hl = np.nanquantile(replicates, [alpha, 1 - alpha], axis=0)
+
+    names = _stat_names(top)
+    labels = ["all"] if groups is None else list(groups)
+    index = pd.MultiIndex.from_product([labels, names], names=["group", "stat"])
+    result = pd.DataFrame(
+        {"estimate": estimate.ravel(), "ll": ll.ravel(), "hl": hl.ravel()},
+        index=index,
+    )
+    # group sizes are fixed by the resampling
+    return result.drop(index=["n"], level="stat")
@@ -0,0 +1,147 @@
+"""
+First-name / last-name lookup store for the gender (naampy) and caste
+(outkast) predictions.
+
+Predictions depend only on the English first or last name, so they are
+stored once per unique token, and each Hindi name just points at its
+tokens through integer ids:
+
+    names.parquet       name, name_id, first_id, last_id (int32 ids)
+    firstnames.parquet  first_id, firstname, pred_gender, prop_female
+    lastnames.parquet   last_id, lastname, prop_sc, prop_st, prop_other, pred_caste
+
+attach_name_predictions() maps them onto the plot-level table with integer
+takes instead of string merges. Build from ./scripts (or `make name_tokens`):
+
+    python -m utilities.name_tokens
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from utilities import ids
+from utilities.ids import id_positions, lookup_codes, take
+from utilities.profiling import profiled
+
+NAME_TOKENS_DIR = "../data/name_tokens/"
+TRANSLATED_DATA = "../data/hindi_names_religion_translated.parquet"
+GENDER_DATA = "../data/hindi_eng_names_gender.csv.gz"
+OUTKAST_DATA = "../data/hindi_eng_names_caste_outkast.csv.gz"
+CASTE_COLS = ["prop_sc", "prop_st", "prop_other"]
+
+
+def split_name_tokens(eng_name):
+    """(firstname, lastname) of English names, as in 50_get_gender / get_caste_outkast"""
+    words = eng_name.str.split()
+    return words.str[0], words.str[-1]
+
+
+def _token_table(tokens, key, id_col, predictions, columns):
+    """Unique tokens (in id order) with their predictions, if any"""
+    table = pd.DataFrame({id_col: np.arange(len(tokens), dtype="int32"), key: tokens})
+    if predictions is None:
+        return table
+    predictions = predictions.dropna(subset=[key]).drop_duplicates(key)[[key] + columns]
+    return table.merge(predictions, how="left", on=key, validate="1:1")
+
+
+@profiled
+def build_name_tokens(translated, gender=None, outkast=None):
+    """
+    Lookup tables from the translated names (name, eng_name) and, if given,
+    the gender predictions (keyed by firstname) and outkast predictions
+    (keyed by lastname). Names with an empty transliteration are left out.
+    """
+    names = translated[translated["eng_name"].notna() & (translated["eng_name"] != "")]
+    names = names.drop_duplicates("name")
+    firstname, lastname = split_name_tokens(names["eng_name"])
+    first_id, first_tokens = pd.factorize(firstname)
+    last_id, last_tokens = pd.factorize(lastname)
+
+    firstnames = _token_table(first_tokens, "firstname", "first_id", gender, ["pred_gender", "prop_female"])
+    if "pred_gender" in firstnames:
+        firstnames = firstnames.astype({"pred_gender": "category", "prop_female": "float32"})
+
+    lastnames = _token_table(last_tokens, "lastname", "last_id", outkast, CASTE_COLS)
+    if "prop_sc" in lastnames:
+        probs = lastnames[CASTE_COLS].astype("float32")
+        pred = probs.fillna(-1).idxmax(axis=1).where(probs.notna().any(axis=1))
+        lastnames = lastnames.assign(**probs, pred_caste=pred.astype("category"))
+
+    return {
+        "names": pd.DataFrame(
+            {
+                "name": names["name"].to_numpy(),
+                "first_id": first_id.astype("int32"),
+                "last_id": last_id.astype("int32"),
+            }
+        ),
+        "firstnames": firstnames,
+        "lastnames": lastnames,
+    }
+
+
+def save_name_tokens(tables, directory=NAME_TOKENS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    for key, table in tables.items():
+        table.to_parquet(os.path.join(directory, f"{key}.parquet"), index=False)
+
+
+def load_name_tokens(directory=NAME_TOKENS_DIR):
+    return {
+        key: pd.read_parquet(os.path.join(directory, f"{key}.parquet"))
+        for key in ("names", "firstnames", "lastnames")
+    }
+
+
+@profiled
+def attach_name_predictions(
+    df, tables=None, name_col="name_of_ryot", first=("pred_gender",), last=("pred_caste",)
+):
+    """
+    Add the `first` (first-name) and `last` (last-name) prediction columns
+    to `df` by its Hindi name column; names not in the store get missing
+    values.
+
+    If both `df` and the store carry name_id (see utilities/ids.py), rows
+    are matched on it without hashing any string; otherwise only the
+    distinct names of `df` are hashed (the categories, if the column is
+    categorical). Either way the predictions are then integer takes.
+    """
+    tables = tables or load_name_tokens()
+    if "name_id" in df.columns and "name_id" in tables["names"].columns:
+        row = id_positions(tables["names"]["name_id"].to_numpy(), df["name_id"].to_numpy())
+    else:
+        row = lookup_codes(df[name_col], tables["names"]["name"])
+    first_id = take(tables["names"]["first_id"], row)
+    last_id = take(tables["names"]["last_id"], row)
+    first_id = np.nan_to_num(first_id, nan=-1).astype("int64")
+    last_id = np.nan_to_num(last_id, nan=-1).astype("int64")
+
+    columns = {}
+    for col in first:
+        columns[col] = take(tables["firstnames"][col], first_id)
+    for col in last:
+        columns[col] = take(tables["lastnames"][col], last_id)
+    return df.assign(**columns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the first/last-name prediction lookup tables")
+    parser.add_argument("--translated", default=TRANSLATED_DATA, help="Parquet with name, eng_name")
+    parser.add_argument("--gender", default=GENDER_DATA, help="naampy predictions by firstname")
+    parser.add_argument("--outkast", default=OUTKAST_DATA, help="outkast predictions by lastname")
+    parser.add_argument("--output", default=NAME_TOKENS_DIR, help="Output directory")
+    args = parser.parse_args()
+
+    tables = build_name_tokens(
+        pd.read_parquet(args.translated, columns=["name", "eng_name"]),
+        gender=pd.read_csv(args.gender, usecols=["firstname", "pred_gender", "prop_female"]),
+        outkast=pd.read_csv(args.outkast, usecols=["lastname"] + CASTE_COLS),
+    )
+    tables["names"] = ids.add_ids(tables["names"], name_col="name", update=True)
+    save_name_tokens(tables, args.output)
+    for key, table in tables.items():
+        print(f"{key}: {len(table):,} rows")
@@ -0,0 +1,418 @@
+"""
+Incremental runner for the intermediate name data (replaces running
+20_get_ryot_hindi_caste, 30_get_religion, 40_translate_hindi_to_english,
+50_get_gender and get_caste_outkast end to end):
+
+    names -> religion -> translate -> gender
+                                   -> outkast
+
+Unique names are split into NPARTS hash partitions. A stage reruns a
+partition only when the partition's content or the stage's code (function
+source and package versions) changed, and then only for the names it has
+not processed yet, so adding one district's CSV only sends that district's
+new names through pranaam, indicate, naampy and outkast. State is kept in
+<workdir>/state.json. Raw and cleaned names are registered in the name id
+dictionary (utilities/ids.py) and every output carries their name_id.
+
+Run from ./scripts (or via `make pipeline` from the repo root):
+
+    python -m utilities.pipeline              # all stages
+    python -m utilities.pipeline translate    # a stage and its upstream
+"""
+import argparse
+import hashlib
+import inspect
+import json
+import os
+from contextlib import nullcontext
+from importlib import metadata
+
+import pandas as pd
+
+from utilities import clean, ids, profiling, religion, translit
+from utilities.utils import (
+    LR_CSV_DIR,
+    _filter_land_area,
+    _list_csv_files,
+    _read_csv_arrow,
+    _to_pandas,
+    process_land_area,
+)
+
+WORKDIR = "../data/pipeline/"
+NPARTS = 64
+NAMES_USECOLS = ["name_of_ryot", "caste", "6", "7", "8"]
+
+
+# ----------------------------------------------------------------------------
+# Stage functions: take the rows not processed yet, return their results
+# ----------------------------------------------------------------------------
+def _names_rows(df):
+    return df[["name_of_ryot"]].rename(columns={"name_of_ryot": "name"})
+
+
+def _religion(df):
+    return religion.predict_religion(df["name"])
+
+
+def _translate(df):
+    return df.assign(eng_name=translit.transliterate_names(df["name"]).values)
+
+
+def _gender_rows(df):
+    """Translated rows -> one row per first name (as in 50_get_gender)"""
+    return (
+        df[df["eng_name"].notna() & (df["eng_name"] != "")]
+        .assign(firstname=lambda df: df.eng_name.str.split().str[0])
+        .drop_duplicates("firstname")
+    )
+
+
+def _gender(df):
+    from naampy import in_rolls_fn_gender
+
+    df = in_rolls_fn_gender(df, "firstname")
+    # fill in pred_gender (for those in rolls)
+    mask = df["pred_gender"].isna()
+    df.loc[mask & (df["prop_female"] > 0.5), "pred_gender"] = "female"
+    df.loc[mask & (df["prop_female"] <= 0.5), "pred_gender"] = "male"
+    return df
+
+
+def _outkast(df):
+    from outkast import secc_caste
+
+    df = df[["name", "eng_name"]].assign(
+        lastname=lambda df: [str(name).split(" ")[-1] for name in df.eng_name]
+    )
+    # outkast only looks at the last name: predict each one once
+    lastnames = secc_caste(df[["lastname"]].drop_duplicates(), "lastname")
+    return df.merge(lastnames, how="left", on="lastname", validate="m:1")
+
+
+class Stage:
+    """
+    A derived table keyed by `key`, computed by `fn` from the rows of
+    `input` (after `prepare`, if given).
+
+    Partitioned stages follow their input's name partitions; the others
+    (gender, keyed by first name) see the whole input at once.
+    """
+
+    def __init__(self, name, input, fn, key, outputs, prepare=None, partitioned=True, packages=(), code=()):
+        self.name = name
+        self.input = input
+        self.fn = fn
+        self.key = key
+        self.outputs = outputs
+        self.prepare = prepare
+        self.partitioned = partitioned
+        self.packages = packages
+        self.code = code
+
+    def code_hash(self):
+        h = hashlib.sha256()
+        for obj in (self.fn, self.prepare, *self.code):
+            if obj is not None:
+                h.update(inspect.getsource(obj).encode("utf-8"))
+        for package in self.packages:
+            try:
+                h.update(f"{package}=={metadata.version(package)}".encode("utf-8"))
+            except metadata.PackageNotFoundError:
+                h.update(f"{package}==missing".encode("utf-8"))
+        return h.hexdigest()
+
+
+# The names stage is built from the raw CSVs by _run_names
+NAMES_CODE = (_filter_land_area, clean)
+NAMES_OUTPUTS = ["../data/ryot_hindi_caste.csv.gz"]
+
+STAGES = {
+    s.name: s
+    for s in [
+        Stage(
+            "religion",
+            "names",
+            _religion,
+            key="name",
+            outputs=["../data/hindi_names_religion.csv.gz"],
+            prepare=_names_rows,
+            packages=("pranaam",),
+            code=(religion,),
+        ),
+        Stage(
+            "translate",
+            "religion",
+            _translate,
+            key="name",
+            outputs=[
+                "../data/hindi_names_religion_translated.parquet",
+                "../data/hindi_names_religion_translated.csv.gz",
+            ],
+            packages=("indicate",),
+            code=(translit,),
+        ),
+        Stage(
+            "gender",
+            "translate",
+            _gender,
+            key="firstname",
+            outputs=["../data/hindi_eng_names_gender.csv.gz"],
+            prepare=_gender_rows,
+            partitioned=False,
+            packages=("naampy",),
+        ),
+        Stage(
+            "outkast",
+            "translate",
+            _outkast,
+            key="name",
+            outputs=["../data/hindi_eng_names_caste_outkast.csv.gz"],
+            packages=("outkast",),
+        ),
+    ]
+}
+
+
+# ----------------------------------------------------------------------------
+# Hashing and storage
+# ----------------------------------------------------------------------------
+def _file_hash(path, known):
+    """sha256 of a file, reused from `known` while its size and mtime match"""
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    if known and known.get("stamp") == stamp:
+        return known
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 24), b""):
+            h.update(block)
+    return {"stamp": stamp, "sha256": h.hexdigest()}
+
+
+def _frame_hash(df):
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+
+def _part_path(workdir, stage, p):
+    return os.path.join(workdir, stage, f"part-{p:03d}.parquet")
+
+
+def _write_parquet(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def _read_parts(workdir, stage, nparts):
+    paths = [_part_path(workdir, stage, p) for p in range(nparts)]
+    return pd.concat([pd.read_parquet(p) for p in paths if os.path.exists(p)], ignore_index=True)
+
+
+def _write_outputs(df, outputs):
+    for col in ("name", "name_of_ryot"):
+        if col in df.columns and "name_id" not in df.columns:
+            df = df.assign(name_id=ids.encode(df[col], ids.NAME_IDS))
+    for path in outputs:
+        if path.endswith(".parquet"):
+            _write_parquet(df, path)
+        else:
+            df.to_csv(path, index=False, compression="gzip")
+        print(f"  wrote {path} ({len(df):,} rows)")
+
+
+# ----------------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------------
+def _run_names(state, workdir, nparts, csv_dir):
+    """
+    Unique cleaned names and caste per name partition, as in
+    20_get_ryot_hindi_caste: names are deduplicated in file order (first
+    caste wins) before cleaning, and names cleaned to "" are dropped.
+    """
+    st = state.setdefault("names", {})
+    code = hashlib.sha256("".join(inspect.getsource(o) for o in NAMES_CODE).encode("utf-8")).hexdigest()
+    if st.get("code") != code:
+        st.clear()
+        st["code"] = code
+    files = st.setdefault("files", {})
+
+    by_file = os.path.join(workdir, "names", "by_file")
+    changed = False
+    current = set()
+    for f in _list_csv_files(csv_dir):
+        stem = os.path.splitext(os.path.basename(f))[0]
+        current.add(stem)
+        out = os.path.join(by_file, stem + ".parquet")
+        fh = _file_hash(f, files.get(stem))
+        if files.get(stem, {}).get("sha256") == fh["sha256"] and os.path.exists(out):
+            files[stem] = fh
+            continue
+        df = (
+            _to_pandas(_read_csv_arrow(f, usecols=NAMES_USECOLS))
+            .pipe(process_land_area)
+            .dropna(subset="name_of_ryot")[["name_of_ryot", "caste"]]
+            .drop_duplicates(subset=["name_of_ryot"])
+        )
+        # raw names get ids too, so get_fulldata rows can be encoded
+        ids.update_name_ids(df["name_of_ryot"])
+        _write_parquet(df, out)
+        files[stem] = fh
+        changed = True
+        print(f"  names: {stem} ({len(df):,} unique names)")
+    for stem in set(files) - current:
+        del files[stem]
+        os.remove(os.path.join(by_file, stem + ".parquet"))
+        changed = True
+
+    parts = st.setdefault("parts", {})
+    if not changed and len(parts) == nparts and all(os.path.exists(p) for p in NAMES_OUTPUTS):
+        return
+
+    df = pd.concat(
+        [pd.read_parquet(os.path.join(by_file, stem + ".parquet")) for stem in sorted(current)],
+        ignore_index=True,
+    )
+    df = df.drop_duplicates(subset=["name_of_ryot"]).reset_index(drop=True)
+    df["name_of_ryot"], counts = clean.clean_series(df["name_of_ryot"])
+    print(f"  names: {clean.format_counts(counts)}")
+    df = df[df["name_of_ryot"].str.len() > 0]
+    ids.update_name_ids(df["name_of_ryot"])
+    _write_outputs(df, NAMES_OUTPUTS)
+
+    part = pd.util.hash_pandas_object(df["name_of_ryot"], index=False).values % nparts
+    for p in range(nparts):
+        chunk = df[part == p].sort_values("name_of_ryot", kind="stable")
+        h = _frame_hash(chunk)
+        if parts.get(str(p), {}).get("output") != h or not os.path.exists(_part_path(workdir, "names", p)):
+            _write_parquet(chunk, _part_path(workdir, "names", p))
+            parts[str(p)] = {"output": h}
+    print(f"names: {len(df):,} unique names")
+
+
+def _run_stage(stage, state, workdir, nparts):
+    """
+    Recompute the partitions whose input changed since the last run (all
+    of them if the stage's code hash changed), then rewrite the outputs.
+    Each partition records the hash of the upstream partition it was built
+    from and of its own result, which its downstream stages compare against.
+    """
+    st = state.setdefault(stage.name, {})
+    code = stage.code_hash()
+    if st.get("code") != code:
+        st.clear()
+        st["code"] = code
+    parts = st.setdefault("parts", {})
+    upstream = state[stage.input]["parts"]
+
+    if stage.partitioned:
+        jobs = [
+            (str(p), upstream[str(p)]["output"], _part_path(workdir, stage.input, p))
+            for p in range(nparts)
+        ]
+    else:
+        input_hash = hashlib.sha256(
+            json.dumps([upstream[str(p)]["output"] for p in range(nparts)]).encode("utf-8")
+        ).hexdigest()
+        jobs = [("all", input_hash, None)]
+
+    # Results for keys seen before are kept; the new keys of all changed
+    # partitions go to stage.fn in one call (one model load / worker pool)
+    pending = []
+    for p, input_hash, input_path in jobs:
+        path = os.path.join(workdir, stage.name, "all.parquet") if p == "all" else _part_path(workdir, stage.name, int(p))
+        if parts.get(p, {}).get("input") == input_hash and os.path.exists(path):
+            continue
+        rows = pd.read_parquet(input_path) if input_path else _read_parts(workdir, stage.input, nparts)
+        if stage.prepare is not None:
+            rows = stage.prepare(rows)
+        existing = pd.read_parquet(path) if p in parts and os.path.exists(path) else None
+        if existing is not None:
+            existing = existing[existing[stage.key].isin(rows[stage.key])]
+        pending.append((p, input_hash, path, rows, existing))
+
+    new = [
+        rows if existing is None else rows[~rows[stage.key].isin(existing[stage.key])]
+        for _, _, _, rows, existing in pending
+    ]
+    new = pd.concat(new, ignore_index=True) if new else None
+    with profiling.stage(f"{stage.name}.fn", rows_in=0 if new is None else len(new)) as record:
+        results = stage.fn(new) if new is not None and len(new) else None
+        record["rows_out"] = None if results is None else len(results)
+
+    for p, input_hash, path, rows, existing in pending:
+        frames = [f for f in (existing, results) if f is not None]
+        if not frames:
+            result = rows
+        else:
+            result = pd.concat(frames, ignore_index=True)
+            result = result[result[stage.key].isin(rows[stage.key])]
+            result = result.sort_values(stage.key, kind="stable").reset_index(drop=True)
+        _write_parquet(result, path)
+        parts[p] = {"input": input_hash, "output": _frame_hash(result)}
+    updated = len(pending)
+    print(f"{stage.name}: {0 if new is None else len(new):,} new key(s) in {updated} partition(s)")
+
+    if updated or not all(os.path.exists(p) for p in stage.outputs):
+        df = (
+            _read_parts(workdir, stage.name, nparts)
+            if stage.partitioned
+            else pd.read_parquet(os.path.join(workdir, stage.name, "all.parquet"))
+        )
+        _write_outputs(df, stage.outputs)
+
+
+def _with_upstream(targets):
+    order = []
+    for name in targets:
+        chain = []
+        while name != "names":
+            chain.append(name)
+            name = STAGES[name].input
+        order.extend(n for n in reversed(chain) if n not in order)
+    return [n for n in STAGES if n in order]
+
+
+def run(targets=None, workdir=WORKDIR, nparts=NPARTS, csv_dir=LR_CSV_DIR):
+    """Bring `targets` (default: all stages) and their upstream stages up to date"""
+    state_path = os.path.join(workdir, "state.json")
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+    if state.get("nparts", nparts) != nparts:
+        raise ValueError(f"{workdir} was built with {state['nparts']} partitions")
+    state["nparts"] = nparts
+
+    def save():
+        os.makedirs(workdir, exist_ok=True)
+        with open(state_path + ".tmp", "w") as f:
+            json.dump(state, f, indent=1)
+        os.replace(state_path + ".tmp", state_path)
+
+    with profiling.stage("pipeline.names"):
+        _run_names(state, workdir, nparts, csv_dir)
+    save()
+    for name in _with_upstream(targets or list(STAGES)):
+        with profiling.stage(f"pipeline.{name}"):
+            _run_stage(STAGES[name], state, workdir, nparts)
+        save()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally build the intermediate name data")
+    parser.add_argument("stages", nargs="*", help=f"Stages to bring up to date: {', '.join(STAGES)} (default: all)")
+    parser.add_argument("--workdir", default=WORKDIR, help="Partitions and state.json")
+    parser.add_argument("--nparts", type=int, default=NPARTS, help="Number of name partitions")
+    parser.add_argument("--input", default=LR_CSV_DIR, help="Directory of raw CSVs")
+    parser.add_argument("--report", default=None, help="Write a JSON profile report of the stages")
+    parser.add_argument("--cprofile", default=None, help="Write cProfile stats (for snakeviz / flameprof)")
+    args = parser.parse_args()
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+
+    profiled = args.report or args.cprofile
+    with profiling.profiling(args.report, cprofile=args.cprofile) if profiled else nullcontext():
+        run(args.stages, workdir=args.workdir, nparts=args.nparts, csv_dir=args.input)
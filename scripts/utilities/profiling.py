@@ -0,0 +1,208 @@
+"""
+Stage-level timing and memory instrumentation.
+
+While a Profiler is active, every stage records wall time, CPU time (this
+process plus finished worker processes), rows in and out, and the resident
+memory at its start and end and at its peak (sampled in a background
+thread). The utilities functions are wrapped with @profiled, so in a
+notebook
+
+    from utilities import profiling
+
+    with profiling.profiling("../data/profile/run.json", cprofile="../data/profile/run.prof"):
+        df = get_fulldata(engine="parquet", compact=True).pipe(process_land_area)
+        with profiling.stage("caste merge", rows_in=len(df)) as s:
+            df = df.merge(castes, how="left", on="caste", validate="m:1")
+            s["rows_out"] = len(df)
+
+writes a JSON report with one entry per stage (nested stages name their
+parent). The optional cProfile output can be opened with snakeviz or
+turned into a flame graph with flameprof. With no active Profiler the
+wrappers only call through.
+"""
+import cProfile
+import functools
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_active = None
+
+
+def rss_mb():
+    """Current resident memory of this process (peak so far where /proc is missing)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1 << 20)
+    except OSError:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+def _cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _rows(obj):
+    if obj is None:
+        return None
+    if hasattr(obj, "num_rows"):
+        return obj.num_rows
+    if hasattr(obj, "shape"):
+        return obj.shape[0]
+    if isinstance(obj, tuple):
+        # (result, extras) return values count the rows of the result
+        return _rows(obj[0]) if obj else None
+    if isinstance(obj, (str, bytes)):
+        return None
+    return len(obj) if hasattr(obj, "__len__") else None
+
+
+class Profiler:
+    """Collects stage records; memory is sampled every `interval` seconds"""
+
+    def __init__(self, cprofile=False, interval=0.05):
+        self.stages = []
+        self.interval = interval
+        self._stack = []
+        self._cprofile = cProfile.Profile() if cprofile else None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._started = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = rss_mb()
+            for record in self._stack:
+                record["peak_rss_mb"] = max(record["peak_rss_mb"], rss)
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        if self._cprofile is not None:
+            self._cprofile.enable()
+        return self
+
+    def stop(self):
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        rss = rss_mb()
+        record = {
+            "stage": name,
+            "parent": self._stack[-1]["stage"] if self._stack else None,
+            "rows_in": rows_in,
+            "rows_out": None,
+            "rss_start_mb": round(rss, 1),
+            "peak_rss_mb": rss,
+        }
+        self._stack.append(record)
+        wall, cpu = time.perf_counter(), _cpu_seconds()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = round(time.perf_counter() - wall, 4)
+            record["cpu_s"] = round(_cpu_seconds() - cpu, 4)
+            rss = rss_mb()
+            record["rss_end_mb"] = round(rss, 1)
+            record["peak_rss_mb"] = round(max(record["peak_rss_mb"], rss), 1)
+            self._stack.remove(record)
+            self.stages.append(record)
+
+    def report(self):
+        return {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "argv": sys.argv,
+            "wall_s": round(time.perf_counter() - self._started, 4) if self._started else None,
+            "max_rss_mb": round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1 << 20 if sys.platform == "darwin" else 1024), 1
+            ),
+            "stages": self.stages,
+        }
+
+    def write(self, report_path=None, profile_path=None, extra=None):
+        """Write the JSON report and/or the cProfile stats (pstats format)"""
+        if report_path:
+            os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+            with open(report_path, "w") as f:
+                json.dump({**self.report(), **(extra or {})}, f, indent=1, default=str)
+            print(f"profile report: {report_path}")
+        if profile_path and self._cprofile is not None:
+            os.makedirs(os.path.dirname(profile_path) or ".", exist_ok=True)
+            self._cprofile.dump_stats(profile_path)
+            print(f"cProfile stats: {profile_path}")
+
+
+def start(cprofile=False, interval=0.05):
+    """Make a new Profiler the active one"""
+    global _active
+    _active = Profiler(cprofile=cprofile, interval=interval).start()
+    return _active
+
+
+def stop(report_path=None, profile_path=None, extra=None):
+    """Stop the active Profiler, write its outputs and return its report"""
+    global _active
+    profiler, _active = _active, None
+    if profiler is None:
+        return None
+    profiler.stop()
+    profiler.write(report_path, profile_path, extra=extra)
+    return profiler.report()
+
+
+@contextmanager
+def profiling(report_path=None, cprofile=None, interval=0.05):
+    """Profile the block; `cprofile` is a path for cProfile stats (None: no cProfile)"""
+    profiler = start(cprofile=bool(cprofile), interval=interval)
+    try:
+        yield profiler
+    finally:
+        stop(report_path, cprofile)
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """A stage of the active Profiler (a throwaway record if none is active)"""
+    if _active is None:
+        yield {}
+        return
+    with _active.stage(name, rows_in=rows_in) as record:
+        yield record
+
+
+def profiled(fn=None, *, name=None):
+    """
+    Decorator: run `fn` as a stage named after it, with the rows of its
+    first argument in and of its result out.
+    """
+    if fn is None:
+        return functools.partial(profiled, name=name)
+    stage_name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _active is None:
+            return fn(*args, **kwargs)
+        with _active.stage(stage_name, rows_in=_rows(args[0]) if args else None) as record:
+            result = fn(*args, **kwargs)
+            record["rows_out"] = _rows(result)
+        return result
+
+    return wrapper
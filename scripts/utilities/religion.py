@@ -0,0 +1,99 @@
+"""
+Religion of unique Hindi names with pranaam, in fixed-size chunks.
+
+Names are deduplicated, split into chunks of `chunksize` and predicted in a
+pool of worker processes (each loads the pranaam model once). Every
+finished chunk is checkpointed to Parquet, so an interrupted run resumes
+with the chunks that are left. Replaces the single pred_rel call of
+30_get_religion.ipynb; run from ./scripts:
+
+    python -m utilities.religion
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from utilities.profiling import profiled
+
+NAMES_DATA = "../data/ryot_hindi_caste.csv.gz"
+RELIGION_DATA = "../data/hindi_names_religion.csv.gz"
+RELIGION_CHECKPOINTS = "../data/religion_chunks/"
+
+
+def _predict_chunk(names):
+    """Worker: (predictions, seconds) for one chunk of names"""
+    from pranaam import pranaam
+
+    start = time.perf_counter()
+    result = pranaam.pred_rel(names, lang="hin")
+    return result, time.perf_counter() - start
+
+
+def _chunk_path(checkpoint_dir, i, names):
+    # the chunk's content is part of the name, so a checkpoint is never
+    # reused for a different list of names
+    digest = hashlib.sha256("\n".join(names).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(checkpoint_dir, f"chunk-{i:05d}-{digest}.parquet")
+
+
+@profiled
+def predict_religion(names, checkpoint_dir=RELIGION_CHECKPOINTS, chunksize=50_000, n_jobs=None, keep_checkpoints=False):
+    """
+    pranaam.pred_rel(lang="hin") output for the unique non-missing `names`,
+    in first-seen order.
+
+    Chunks already in `checkpoint_dir` are read back instead of predicted;
+    the checkpoints are removed at the end unless `keep_checkpoints`.
+    Workers are spawned rather than forked, as TensorFlow is not fork-safe.
+    """
+    unique = pd.Series(pd.unique(pd.Series(names).dropna())).astype(str).tolist()
+    chunks = [unique[i : i + chunksize] for i in range(0, len(unique), chunksize)]
+    paths = [_chunk_path(checkpoint_dir, i, chunk) for i, chunk in enumerate(chunks)]
+    todo = [i for i, path in enumerate(paths) if not os.path.exists(path)]
+    print(f"{len(unique):,} unique names in {len(chunks)} chunks ({len(chunks) - len(todo)} checkpointed)")
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    start = time.perf_counter()
+    done = 0
+    if todo:
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {executor.submit(_predict_chunk, chunks[i]): i for i in todo}
+            for future in as_completed(futures):
+                i = futures[future]
+                result, seconds = future.result()
+                tmp = paths[i] + ".tmp"
+                result.to_parquet(tmp, index=False)
+                os.replace(tmp, paths[i])
+                done += len(chunks[i])
+                elapsed = time.perf_counter() - start
+                print(
+                    f"  chunk {i}: {len(chunks[i]):,} names in {seconds:.1f}s "
+                    f"({len(chunks[i]) / seconds:,.0f} names/s); "
+                    f"{done / elapsed:,.0f} names/s overall"
+                )
+
+    result = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True) if paths else pd.DataFrame()
+    if not keep_checkpoints:
+        for path in paths:
+            os.remove(path)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predict religion of the unique ryot names with pranaam")
+    parser.add_argument("--input", default=NAMES_DATA, help="CSV with a name_of_ryot column")
+    parser.add_argument("--output", default=RELIGION_DATA, help="Output CSV")
+    parser.add_argument("--checkpoints", default=RELIGION_CHECKPOINTS, help="Directory of finished chunks")
+    parser.add_argument("--chunksize", type=int, default=50_000, help="Names per pranaam call")
+    parser.add_argument("--n-jobs", type=int, default=None, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    names = pd.read_csv(args.input, usecols=["name_of_ryot"])["name_of_ryot"]
+    result = predict_religion(names, args.checkpoints, chunksize=args.chunksize, n_jobs=args.n_jobs)
+    result.to_csv(args.output, index=False, compression="gzip")
+    print(f"{len(result):,} names -> {args.output}")
@@ -0,0 +1,493 @@
+"""
+Batch build of the paper figures and tables (the uplots, religion_plots,
+gender_plots and caste_outkast_plots targets of the Makefile).
+
+Every artifact is declared below as an Artifact: a `data` function that
+reduces the per-account table (utilities/accounts.py, with the gender,
+caste and religion predictions of the account's name attached) to a small
+frame with the graph_utils / quantile_table helpers, and either a `draw`
+function (figure, saved with save_mpl_fig) or LaTeX options (table, written
+with pandas_to_tex). The per-account table is loaded once; the small
+frames are then drawn and written in a pool of worker processes with the
+Agg backend.
+
+An artifact is skipped when its outputs exist and the hash of its input
+files and of its code (data / draw functions, graph_utils, and the
+loading and percentile helpers they use) matches the one
+recorded in RENDER_STATE, so only what a data fix touched is redrawn. Run
+from ./scripts (or `make render` / `make uplots` ... from the repo root):
+
+    python -m utilities.render                   # all groups
+    python -m utilities.render gender religion   # some groups
+    python -m utilities.render --force           # ignore the recorded hashes
+"""
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Headless rendering in the parent and in the workers: set before pyplot
+# is imported (by graph_utils)
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import pandas as pd
+import pyarrow.parquet as pq
+
+from utilities import graph_utils, profiling
+from utilities.accounts import ACCOUNTS_DATA
+from utilities.graph_utils import (
+    bin_counts,
+    conbarplot_summary,
+    ecdf_points,
+    ecdfplot_points,
+    histplot_binned,
+    mean_ci,
+    save_mpl_fig,
+)
+from utilities.groups import group_codes
+from utilities.ids import lookup_codes, take
+from utilities.name_tokens import NAME_TOKENS_DIR, attach_name_predictions
+from utilities.pipeline import _file_hash
+from utilities.religion import RELIGION_DATA
+from utilities.utils import pandas_to_tex, quantile_table
+
+RENDER_STATE = "../data/render_state.json"
+FIGURE_DIR = "../figures/"
+TABLE_DIR = "../tables/"
+
+NAME_TOKENS_FILES = [os.path.join(NAME_TOKENS_DIR, f"{key}.parquet") for key in ("names", "firstnames", "lastnames")]
+# Input files and per-account columns of each group of artifacts
+GROUPS = {
+    "uncond": ([ACCOUNTS_DATA], ["nplots", "tt_area_acre", "land_per_plot"]),
+    "gender": ([ACCOUNTS_DATA, *NAME_TOKENS_FILES], ["nplots", "tt_area_acre", "pred_gender"]),
+    "religion": ([ACCOUNTS_DATA, RELIGION_DATA], ["nplots", "tt_area_acre", "religion"]),
+    "caste": ([ACCOUNTS_DATA, *NAME_TOKENS_FILES], ["nplots", "tt_area_acre", "pred_caste"]),
+}
+
+FIGSIZE = (9, 6)
+LINESTYLES = ["-", "--", ":", "-."]
+LEGEND_OPTS = dict(title="", loc="best", frameon=False, handletextpad=0.3)
+
+
+class Artifact:
+    """
+    A figure (`draw` given) or a table (`tex`: pandas_to_tex options) named
+    `name`, made from `data(accounts)`.
+    """
+
+    def __init__(self, name, group, data, draw=None, tex=None):
+        self.name = name
+        self.group = group
+        self.data = data
+        self.draw = draw
+        self.tex = tex
+
+    @property
+    def outputs(self):
+        if self.draw is not None:
+            return [os.path.join(FIGURE_DIR, f"{self.name}.{ext}") for ext in ("pdf", "png")]
+        return [os.path.join(TABLE_DIR, f"{self.name}.tex")]
+
+    def code_hash(self):
+        h = hashlib.sha256()
+        for fn in (self.data, self.draw):
+            if fn is not None:
+                h.update(inspect.getsource(fn).encode("utf-8"))
+                # the arguments of the factories below
+                h.update(repr(sorted(inspect.getclosurevars(fn).nonlocals.items())).encode("utf-8"))
+        h.update(inspect.getsource(graph_utils if self.draw is not None else pandas_to_tex).encode("utf-8"))
+        # the helpers behind the numbers of every artifact
+        for helper in (load_accounts, _upper, quantile_table, group_codes, attach_name_predictions):
+            h.update(inspect.getsource(helper).encode("utf-8"))
+        h.update(repr(self.tex).encode("utf-8"))
+        return h.hexdigest()
+
+
+# ----------------------------------------------------------------------------
+# Data and draw functions
+# ----------------------------------------------------------------------------
+def _upper(accounts, col, upper=None, quantile=None):
+    if quantile is None:
+        return upper
+    return quantile_table(accounts, col, q=[quantile]).iloc[0, 0]
+
+
+def _percentiles(col, by=None, names=None, dtype=None):
+    """quantile_table of `col` with a Percentile column (group columns renamed with `names`)"""
+
+    def data(accounts):
+        table = quantile_table(accounts, col, by=by)
+        if names:
+            missing = [level for level in names if level not in table.columns]
+            if missing:
+                print(f"{col} by {by}: no accounts in {', '.join(map(str, missing))} (empty columns)")
+            table = table.reindex(columns=list(names)).rename(columns=names)
+        if dtype:
+            # the empty columns of missing levels stay float
+            table = table.astype({c: dtype for c in table.columns if table[c].notna().all()})
+        else:
+            table = table.round(2)
+        return table.reset_index()
+
+    return data
+
+
+def _ecdf(col, by=None, upper=None, quantile=None):
+    def data(accounts):
+        return ecdf_points(accounts, col, by=by, clip=(None, _upper(accounts, col, upper, quantile)))
+
+    return data
+
+
+def _hist(col, by=None, upper=None, quantile=None, stat="count", discrete=True, bins=50):
+    def data(accounts):
+        binrange = (None, _upper(accounts, col, upper, quantile))
+        if binrange[1] is None:
+            binrange = None
+        elif discrete:
+            binrange = (accounts[col].min(), binrange[1])
+        else:
+            binrange = (0, binrange[1])
+        return bin_counts(accounts, col, bins=bins, by=by, discrete=discrete, binrange=binrange, stat=stat)
+
+    return data
+
+
+def _means(col, by):
+    def data(accounts):
+        return mean_ci(accounts, col, by=by)
+
+    return data
+
+
+def _legend(ax, labels):
+    handles, _ = ax.get_legend_handles_labels()
+    ax.legend(handles, labels, **LEGEND_OPTS)
+
+
+def _draw_ecdf(col, xlabel, hue=None, labels=None):
+    def draw(points):
+        ax = ecdfplot_points(points, col, hue=hue, linestyles=LINESTYLES if hue else None, figsize=FIGSIZE)
+        ax.set_xlabel(xlabel)
+        if hue:
+            _legend(ax, labels)
+
+    return draw
+
+
+def _draw_hist(col, xlabel, stat="count", hue=None, labels=None, xlim=None):
+    def draw(bins):
+        ax = histplot_binned(bins, col, stat=stat, hue=hue, linestyles=LINESTYLES if hue else None, figsize=FIGSIZE)
+        ax.set_xlabel(xlabel)
+        if stat == "count":
+            ax.set_ylabel("")
+            ax.get_yaxis().set_major_formatter(matplotlib.ticker.StrMethodFormatter("{x:,.0f}"))
+        if xlim:
+            ax.set_xlim(*xlim)
+        if hue:
+            _legend(ax, labels)
+
+    return draw
+
+
+def _draw_conbar(by, groups, xticklabels, title, annote_scaler=0.1):
+    def draw(summary):
+        conbarplot_summary(
+            summary,
+            x=by,
+            groups=groups,
+            xticklabels=xticklabels,
+            title=title,
+            annote_scaler=annote_scaler,
+        )
+
+    return draw
+
+
+TEX = dict(float_format="%.2f")
+GENDERS = {"female": "Female", "male": "Male"}
+RELIGIONS = {"not-muslim": "Hindu", "muslim": "Muslim"}
+CASTES = {"prop_other": "Other", "prop_sc": "SC", "prop_st": "ST"}
+
+NPLOTS_LABEL = "Number of land plot(s) per account holder"
+AREA_LABEL = "Area of land plot(s) per account holder"
+AREA_PER_PLOT_LABEL = "Area per land plot per account holder"
+
+ARTIFACTS = {
+    a.name: a
+    for a in [
+        # 10_land_distribution_bihar: unconditional distributions
+        Artifact(
+            "percentiles_landplots_per_accountholder",
+            "uncond",
+            _percentiles("nplots", dtype="int64"),
+            tex=TEX,
+        ),
+        Artifact(
+            "number_plots_per_accountholder_ecdf",
+            "uncond",
+            _ecdf("nplots", quantile=0.99),
+            _draw_ecdf("nplots", NPLOTS_LABEL),
+        ),
+        Artifact(
+            "number_plots_per_accountholder_histogram",
+            "uncond",
+            _hist("nplots", quantile=0.99),
+            _draw_hist("nplots", NPLOTS_LABEL),
+        ),
+        Artifact(
+            "percentiles_landarea_per_accountholder",
+            "uncond",
+            _percentiles("tt_area_acre"),
+            tex=TEX,
+        ),
+        Artifact(
+            "plot_area_per_accountholder_ecdf",
+            "uncond",
+            _ecdf("tt_area_acre", quantile=0.99),
+            _draw_ecdf("tt_area_acre", AREA_LABEL),
+        ),
+        Artifact(
+            "plot_area_per_accountholder_histogram",
+            "uncond",
+            _hist("tt_area_acre", quantile=0.99),
+            _draw_hist("tt_area_acre", AREA_LABEL),
+        ),
+        Artifact(
+            "percentiles_landarea_per_plot_per_accountholder",
+            "uncond",
+            _percentiles("land_per_plot"),
+            tex=TEX,
+        ),
+        Artifact(
+            "landarea_per_plot_per_accountholder_ecdf",
+            "uncond",
+            _ecdf("land_per_plot", quantile=0.99),
+            _draw_ecdf("land_per_plot", AREA_PER_PLOT_LABEL),
+        ),
+        Artifact(
+            "landarea_per_plot_per_accountholder_histogram",
+            "uncond",
+            _hist("land_per_plot", quantile=0.99),
+            _draw_hist("land_per_plot", AREA_PER_PLOT_LABEL),
+        ),
+        # 61_land_distribution_bihar_gender
+        Artifact(
+            "percentiles_landplots_per_accountholder_gender",
+            "gender",
+            _percentiles("nplots", by="pred_gender", names={"female": "nplots_women", "male": "nplots_men"}, dtype="int64"),
+            tex=TEX,
+        ),
+        Artifact(
+            "percentiles_landarea_per_accountholder_gender",
+            "gender",
+            _percentiles("tt_area_acre", by="pred_gender", names={"female": "area_women", "male": "area_men"}),
+            tex=TEX,
+        ),
+        Artifact(
+            "number_plots_per_accountholder_ecdf_gender",
+            "gender",
+            _ecdf("nplots", by="pred_gender", upper=8),
+            _draw_ecdf("nplots", "Number of plots per account holder", hue="pred_gender", labels=list(GENDERS.values())),
+        ),
+        Artifact(
+            "number_plots_per_accountholder_histogram_gender",
+            "gender",
+            _hist("nplots", by="pred_gender", upper=8, stat="density"),
+            _draw_hist(
+                "nplots",
+                "Number of plots per account holder",
+                stat="density",
+                hue="pred_gender",
+                labels=list(GENDERS.values()),
+            ),
+        ),
+        Artifact(
+            "plot_area_per_accountholder_ecdf_gender",
+            "gender",
+            _ecdf("tt_area_acre", by="pred_gender", upper=1),
+            _draw_ecdf("tt_area_acre", "Area of plot(s) per account holder", hue="pred_gender", labels=list(GENDERS.values())),
+        ),
+        # muslims_dist
+        Artifact(
+            "religion_number_plots",
+            "religion",
+            _hist("nplots", by="religion", upper=10, stat="probability"),
+            _draw_hist(
+                "nplots",
+                "Number of plots",
+                stat="probability",
+                hue="religion",
+                labels=[RELIGIONS["muslim"], RELIGIONS["not-muslim"]],
+                xlim=(0, 10),
+            ),
+        ),
+        Artifact(
+            "religion_barplot_plots",
+            "religion",
+            _means("nplots", "religion"),
+            _draw_conbar("religion", list(RELIGIONS), list(RELIGIONS.values()), "Distribution of land ownership, by religion"),
+        ),
+        Artifact(
+            "religion_barplot_plotarea",
+            "religion",
+            _means("tt_area_acre", "religion"),
+            _draw_conbar(
+                "religion",
+                list(RELIGIONS),
+                list(RELIGIONS.values()),
+                "Distribution of land area owned, by religion",
+                annote_scaler=2,
+            ),
+        ),
+        # caste_outkast_dist
+        Artifact(
+            "castes_outkast_number_plots",
+            "caste",
+            _hist("nplots", by="pred_caste", upper=10, stat="probability"),
+            _draw_hist(
+                "nplots",
+                "Number of plots",
+                stat="probability",
+                hue="pred_caste",
+                labels=list(CASTES.values()),
+                xlim=(0, 10),
+            ),
+        ),
+        Artifact(
+            "castes_outkast_barplot_plots",
+            "caste",
+            _means("nplots", "pred_caste"),
+            _draw_conbar("pred_caste", list(CASTES), list(CASTES.values()), "Distribution of land ownership, by caste"),
+        ),
+        Artifact(
+            "castes_outkast_barplot_plotarea",
+            "caste",
+            _means("tt_area_acre", "pred_caste"),
+            _draw_conbar("pred_caste", list(CASTES), list(CASTES.values()), "Distribution of land area owned, by caste"),
+        ),
+    ]
+}
+
+
+# ----------------------------------------------------------------------------
+# Loading, hashing and rendering
+# ----------------------------------------------------------------------------
+def load_accounts(columns, path=ACCOUNTS_DATA):
+    """
+    The per-account table with `columns`: land_per_plot is derived, and
+    pred_gender / pred_caste / religion are the predictions for the
+    account's (dominant) name_of_ryot.
+    """
+    predictions = {"pred_gender", "pred_caste", "religion"} & set(columns)
+    read = {"nplots", "tt_area_acre"} | (set(columns) - predictions - {"land_per_plot"})
+    if predictions:
+        read |= {"name_of_ryot"} | ({"name_id"} & set(pq.read_schema(path).names))
+    accounts = pd.read_parquet(path, columns=sorted(read))
+
+    if "land_per_plot" in columns:
+        accounts["land_per_plot"] = accounts["tt_area_acre"] / accounts["nplots"]
+    if {"pred_gender", "pred_caste"} & predictions:
+        accounts = attach_name_predictions(
+            accounts,
+            first=("pred_gender",) if "pred_gender" in predictions else (),
+            last=("pred_caste",) if "pred_caste" in predictions else (),
+        )
+    if "religion" in predictions:
+        religion = pd.read_csv(RELIGION_DATA, usecols=["name", "pred_label"])
+        accounts["religion"] = take(religion["pred_label"], lookup_codes(accounts["name_of_ryot"], religion["name"]))
+    return accounts
+
+
+def _render(name, data):
+    """Worker: draw or write one artifact; returns (name, seconds)"""
+    start = time.perf_counter()
+    artifact = ARTIFACTS[name]
+    if artifact.draw is not None:
+        artifact.draw(data)
+        save_mpl_fig(os.path.join(FIGURE_DIR, name))
+        plt.close("all")
+    else:
+        pandas_to_tex(data, os.path.join(TABLE_DIR, name), **artifact.tex)
+    return name, time.perf_counter() - start
+
+
+def render(groups=None, force=False, n_jobs=None, state_path=RENDER_STATE):
+    """Render the artifacts of `groups` (default: all) that are out of date; returns their names"""
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+    files = state.setdefault("files", {})
+    done = state.setdefault("artifacts", {})
+
+    groups = groups or list(GROUPS)
+    for path in sorted({p for g in groups for p in GROUPS[g][0]}):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} (input of {', '.join(g for g in groups if path in GROUPS[g][0])})")
+        files[path] = _file_hash(path, files.get(path))
+
+    keys = {}
+    for artifact in ARTIFACTS.values():
+        if artifact.group in groups:
+            inputs = "".join(files[p]["sha256"] for p in GROUPS[artifact.group][0])
+            keys[artifact.name] = hashlib.sha256((inputs + artifact.code_hash()).encode("utf-8")).hexdigest()
+    todo = [
+        name
+        for name, key in keys.items()
+        if force or done.get(name) != key or not all(os.path.exists(p) for p in ARTIFACTS[name].outputs)
+    ]
+    print(f"{len(todo)} of {len(keys)} artifacts out of date")
+    if not todo:
+        return []
+
+    columns = sorted({c for name in todo for c in GROUPS[ARTIFACTS[name].group][1]})
+    with profiling.stage("render.load"):
+        accounts = load_accounts(columns)
+    with profiling.stage("render.data", rows_in=len(accounts)):
+        data = {name: ARTIFACTS[name].data(accounts) for name in todo}
+    del accounts
+
+    os.makedirs(FIGURE_DIR, exist_ok=True)
+    os.makedirs(TABLE_DIR, exist_ok=True)
+    failed = []
+    with profiling.stage("render.draw"), ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = {executor.submit(_render, name, data[name]): name for name in todo}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                _, seconds = future.result()
+            except Exception as e:
+                failed.append(name)
+                print(f"  {name} FAILED: {e!r}")
+                continue
+            done[name] = keys[name]
+            print(f"  {name} ({seconds:.1f}s)")
+
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    with open(state_path + ".tmp", "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(state_path + ".tmp", state_path)
+    if failed:
+        raise RuntimeError(f"{len(failed)} artifact(s) failed: {', '.join(failed)}")
+    return todo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the paper figures and tables that are out of date")
+    parser.add_argument("groups", nargs="*", help=f"Groups to render: {', '.join(GROUPS)} (default: all)")
+    parser.add_argument("--force", action="store_true", help="Render even if the inputs and code are unchanged")
+    parser.add_argument("--n-jobs", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--state", default=RENDER_STATE, help="Recorded input hashes")
+    args = parser.parse_args()
+    unknown = set(args.groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown group(s): {', '.join(sorted(unknown))}")
+
+    render(args.groups, force=args.force, n_jobs=args.n_jobs, state_path=args.state)
@@ -0,0 +1,230 @@
+"""
+Synthetic land records with the schema of the raw per-district CSVs, for
+benchmarking without the private data (see utilities/bench.py).
+
+Rows are generated account by account: the number of plots per account is
+heavy-tailed (Zipf with exponent `zipf_a`, capped at `max_plots`), and every
+plot of an account shares its ryot, caste, district, division and mouza.
+District sizes are skewed as well (Zipf weights with exponent
+`district_skew`). A `dirty` share of names carry the punctuation, digits
+and honorifics clean_hindi_names removes, and a small share of plots have
+the invalid decimals / non-positive areas process_land_area drops.
+
+Write one CSV per district from ./scripts:
+
+    python -m utilities.synthetic --rows 1000000 --output ../data/synthetic/lr_1m/
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+LR_COLUMNS = [
+    "name_of_ryot",
+    "name_of_father",
+    "residence",
+    "caste",
+    "district",
+    "division",
+    "mouza",
+    "account_no",
+    "6",
+    "7",
+    "8",
+]
+
+DISTRICTS = [
+    "पटना", "नालंदा", "भोजपुर", "बक्सर", "रोहतास", "कैमूर", "गया", "जहानाबाद",
+    "अरवल", "नवादा", "औरंगाबाद", "सारण", "सीवान", "गोपालगंज", "पश्चिमी चंपारण",
+    "पूर्वी चंपारण", "मुजफ्फरपुर", "सीतामढ़ी", "शिवहर", "वैशाली", "दरभंगा",
+    "मधुबनी", "समस्तीपुर", "बेगूसराय", "मुंगेर", "शेखपुरा", "लखीसराय", "जमुई",
+    "खगड़िया", "भागलपुर", "बांका", "सहरसा", "सुपौल", "मधेपुरा", "पूर्णिया",
+    "किशनगंज", "अररिया", "कटिहार",
+]
+CASTES = [
+    "यादव", "कुर्मी", "कोईरी", "ब्राह्मण", "राजपूत", "भूमिहार", "कायस्थ", "बनिया",
+    "तेली", "पासवान", "चमार", "मुसहर", "धानुक", "मल्लाह", "नोनिया", "कहार",
+    "शेख", "अंसारी", "पठान", "सैयद",
+]
+FIRST_NAMES = [
+    "राम", "श्याम", "सुनील", "अनिल", "राजेश", "सुरेश", "महेश", "दिनेश", "रमेश",
+    "विनोद", "मनोज", "संजय", "अजय", "विजय", "राजु", "मोहन", "सोहन", "गोपाल",
+    "कृष्ण", "शिव", "सीता", "गीता", "सुनीता", "रीता", "पार्वती", "लक्ष्मी",
+    "कमला", "उर्मिला", "मोहम्मद", "अली", "अब्दुल", "इरफान", "सलीम", "शकील",
+    "नसीम", "फातिमा", "रजिया", "शबनम",
+]
+LAST_NAMES = [
+    "यादव", "सिंह", "कुमार", "प्रसाद", "शर्मा", "मिश्रा", "पासवान", "राम", "महतो",
+    "मंडल", "साह", "राय", "ठाकुर", "झा", "पाण्डेय", "चौधरी", "देवी", "खातून",
+    "अंसारी", "आलम", "हुसैन", "खान", "अहमद",
+]
+# Rarer first names are put together from syllables, for a long tail of
+# unique names
+SYLLABLES = [
+    "रा", "मे", "शि", "वि", "नो", "सु", "रे", "श", "दि", "ने", "मु", "के", "प्र",
+    "का", "श्या", "जय", "दे", "चं", "द्र", "ल", "नि", "त्य", "आ", "नं", "ह", "री",
+    "ग", "णे", "भू", "प", "ज", "वा", "स", "मी", "ना", "र", "ब", "ली", "अ", "इ",
+]
+HONORIFICS = ["श्री", "श्रीमती", "मो०", "स्व०", "डॉ०"]
+# organization_type labels of llm_annotation/schema.py for non-human names
+ORGANIZATION_TYPES = ["religious", "state", "cooperative", "commercial", "commercial_farm", "educational", "trust_ngo"]
+DIRT = [".", ",", "(", ")", "-", "0", "1", "९", "a", "\u200b", "  "]
+
+
+def _zipf_weights(n, s):
+    w = 1.0 / np.arange(1, n + 1) ** s
+    return w / w.sum()
+
+
+def _plots_per_account(rows, zipf_a, max_plots, rng):
+    """Heavy-tailed plot counts summing to exactly `rows`"""
+    if rows == 0:
+        return np.zeros(0, dtype=np.int64)
+    counts = []
+    total = 0
+    while total < rows:
+        draw = np.minimum(rng.zipf(zipf_a, size=max(rows // 2, 1024)), max_plots)
+        counts.append(draw)
+        total += int(draw.sum())
+    counts = np.concatenate(counts)
+    counts = counts[: np.searchsorted(np.cumsum(counts), rows) + 1]
+    counts[-1] -= int(counts.sum()) - rows
+    return counts
+
+
+def _pick(values, n, rng):
+    return np.asarray(values, dtype=object)[rng.integers(len(values), size=n)]
+
+
+def _names(n, dirty, rng):
+    first = _pick(FIRST_NAMES, n, rng)
+    rare = rng.random(n) < 0.5
+    k = int(rare.sum())
+    first[rare] = _pick(SYLLABLES, k, rng) + _pick(SYLLABLES, k, rng) + np.where(
+        rng.random(k) < 0.5, _pick(SYLLABLES, k, rng), ""
+    )
+    last = _pick(LAST_NAMES, n, rng)
+    names = pd.Series(first + " " + last)
+    dirty_rows = rng.random(n) < dirty
+    k = int(dirty_rows.sum())
+    if k:
+        names[dirty_rows] = _pick(HONORIFICS, k, rng) + " " + names[dirty_rows].to_numpy() + _pick(DIRT, k, rng)
+    return names.to_numpy()
+
+
+def generate_district(rows, district, seed=0, zipf_a=2.0, max_plots=5000, dirty=0.05, invalid=0.01, account_start=0):
+    """
+    `rows` synthetic plots of one district, as a DataFrame with LR_COLUMNS.
+    Account numbers start at `account_start` so that districts written
+    separately do not share accounts.
+    """
+    rng = np.random.default_rng(seed)
+    counts = _plots_per_account(rows, zipf_a, max_plots, rng)
+    n_accounts = len(counts)
+    account = np.repeat(np.arange(n_accounts), counts)
+
+    # per account
+    names = _names(n_accounts, dirty, rng)
+    fathers = _names(n_accounts, dirty, rng)
+    castes = rng.choice(len(CASTES), size=n_accounts, p=_zipf_weights(len(CASTES), 1.0))
+    n_divisions = max(n_accounts // 20_000, 1)
+    division = rng.integers(n_divisions, size=n_accounts)
+    mouza = division * 1000 + rng.integers(1000, size=n_accounts)
+
+    # per plot: small holdings, log-normal acres + decimals
+    area = rng.lognormal(mean=-1.0, sigma=1.2, size=rows)
+    acres = np.floor(area)
+    decimals = np.round((area - acres) * 100).clip(0, 99)
+    bad = rng.random(rows) < invalid
+    decimals[bad] = rng.choice([-1, 0, 150], size=int(bad.sum()))
+    acres[bad & (decimals == 0)] = 0
+
+    return pd.DataFrame(
+        {
+            "name_of_ryot": names[account],
+            "name_of_father": fathers[account],
+            "residence": "ग्राम",
+            "caste": np.asarray(CASTES, dtype=object)[castes][account],
+            "district": district,
+            "division": np.asarray([f"अंचल {d}" for d in division], dtype=object)[account],
+            "mouza": np.asarray([f"मौजा {m}" for m in mouza], dtype=object)[account],
+            "account_no": account_start + account,
+            "6": acres,
+            "7": decimals,
+            "8": np.round((acres + decimals / 100) * 0.404686, 4),
+        },
+        columns=LR_COLUMNS,
+    )
+
+
+def write_land_records(output_dir, rows, seed=0, districts=None, district_skew=0.8, **kwargs):
+    """
+    Write `rows` synthetic plots to one CSV per district in `output_dir`,
+    generating one district at a time. Returns the rows per district.
+    Extra arguments go to generate_district.
+    """
+    districts = districts or DISTRICTS
+    rng = np.random.default_rng(seed)
+    sizes = rng.multinomial(rows, _zipf_weights(len(districts), district_skew))
+    os.makedirs(output_dir, exist_ok=True)
+    account_start = 10**15
+    for i, (district, n) in enumerate(zip(districts, sizes)):
+        df = generate_district(int(n), district, seed=seed * 1000 + i, account_start=account_start, **kwargs)
+        df.to_csv(os.path.join(output_dir, f"{i:02d}.csv"), index=False)
+        if len(df):
+            account_start = int(df["account_no"].max()) + 1
+    return dict(zip(districts, sizes.tolist()))
+
+
+def synthetic_annotations(names, path, seed=0):
+    """JSONL of random annotations (annotate_names output format) for the unique `names`"""
+    rng = np.random.default_rng(seed)
+    names = pd.Series(pd.unique(pd.Series(names).dropna()))
+    n = len(names)
+    human = rng.random(n) < 0.98
+    prop_women = rng.random(n)
+    prop_muslim = rng.random(n) * 0.3
+    df = pd.DataFrame(
+        {
+            "idx": np.arange(n),
+            "name": names,
+            "entity_type": np.where(human, "human", "non-human"),
+            "entity_confidence": 0.9,
+            "organization_type": np.where(human, "not_applicable", _pick(ORGANIZATION_TYPES, n, rng)),
+            "organization_confidence": np.where(human, 0.9, 0.8),
+            "gender": np.where(human, np.where(prop_women > 0.5, "woman", "man"), "cannot decide"),
+            "prop_women": np.where(human, prop_women, np.nan),
+            "religion": np.where(prop_muslim > 0.15, "muslim", "hindu"),
+            "prop_hindu": 1 - prop_muslim,
+            "prop_muslim": prop_muslim,
+        }
+    )
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    df.to_json(path, orient="records", lines=True, force_ascii=False)
+    return n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic land record CSVs (one per district)")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Total number of plots")
+    parser.add_argument("--output", required=True, help="Output directory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--zipf-a", type=float, default=2.0, help="Exponent of the plots-per-account distribution")
+    parser.add_argument("--max-plots", type=int, default=5000, help="Cap on plots per account")
+    parser.add_argument("--district-skew", type=float, default=0.8, help="Zipf exponent of district sizes")
+    parser.add_argument("--dirty", type=float, default=0.05, help="Share of names with characters to clean")
+    parser.add_argument("--invalid", type=float, default=0.01, help="Share of plots with invalid areas")
+    args = parser.parse_args()
+
+    sizes = write_land_records(
+        args.output,
+        args.rows,
+        seed=args.seed,
+        district_skew=args.district_skew,
+        zipf_a=args.zipf_a,
+        max_plots=args.max_plots,
+        dirty=args.dirty,
+        invalid=args.invalid,
+    )
+    print(f"{sum(sizes.values()):,} rows in {len(sizes)} districts -> {args.output}")
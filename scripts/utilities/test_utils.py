@@ -0,0 +1,61 @@
+"""
+Run from ./scripts:
+
+    python -m pytest -q utilities/test_utils.py
+"""
+import pandas as pd
+import pytest
+
+from utilities import ids
+from utilities.build_parquet import csv_to_parquet
+from utilities.utils import _filter_land_area, get_fulldata, process_land_area
+
+ROWS = pd.DataFrame(
+    {
+        "account_no": [1, 2, 3, 4],
+        "district": ["पटना"] * 4,
+        "6": [1.0, 0.0, 2.0, 3.0],
+        # a fractional decimal, an integer written as "12.0" and an out-of-range one
+        "7": [12.5, 40, 12.0, 120],
+        "8": [0.5, 0.2, 0.9, 1.3],
+    }
+)
+
+
+@pytest.fixture
+def csv_dir(tmp_path):
+    directory = tmp_path / "csv"
+    directory.mkdir()
+    ROWS.to_csv(directory / "00.csv", index=False)
+    return directory
+
+
+@pytest.mark.parametrize("engine,compact", [("pandas", False), ("pandas", True), ("pyarrow", True)])
+def test_fractional_decimals(csv_dir, engine, compact):
+    df = get_fulldata(str(csv_dir), engine=engine, compact=compact)
+    processed, counts = _filter_land_area(df)
+
+    assert processed["account_no"].tolist() == [1, 2, 3]
+    assert processed["tt_area_acre"].tolist() == pytest.approx([1.125, 0.4, 2.12])
+    assert counts["dropped_decimals"] == 1
+
+
+def test_fractional_decimals_parquet(csv_dir, tmp_path):
+    csv_to_parquet(str(csv_dir), str(tmp_path / "parquet"))
+    df = get_fulldata(str(tmp_path / "parquet"), engine="parquet", compact=True)
+
+    processed = process_land_area(df).sort_values("account_no")
+    assert processed["tt_area_acre"].tolist() == pytest.approx([1.125, 0.4, 2.12])
+
+
+def test_account_ids_keyed_on_district_and_account_no(tmp_path):
+    path = str(tmp_path / "accounts.parquet")
+    first = pd.DataFrame({"district": ["पटना", "गया", "पटना", None], "account_no": [1, 1, 1, 2]})
+    ids.update_ids(first, path)
+    # the same account_no in another district is another account; keys without a district get no id
+    assert ids.encode(first, path).tolist() == [0, 1, 0, -1]
+
+    second = pd.DataFrame({"district": ["गया", "नालंदा"], "account_no": [1, 1]})
+    ids.update_ids(second, path)
+    assert ids.encode(second, path).tolist() == [1, 2]
+    assert ids.encode(first, path).tolist() == [0, 1, 0, -1]
@@ -0,0 +1,77 @@
+"""
+Hindi -> English transliteration of names, one unique token at a time.
+
+Names are split into whitespace tokens; each distinct token is
+transliterated once (with indicate, in a process pool) and remembered in an
+on-disk token cache that is reused across runs. Full names are rebuilt from
+the token table with a vectorized map and groupby.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from utilities.profiling import profiled
+
+TOKEN_CACHE = "../data/translit_token_cache.parquet"
+
+
+def _transliterate_tokens(tokens):
+    """Worker: transliterate a list of tokens (indicate is loaded once per process)"""
+    from indicate import transliterate
+
+    return [transliterate.hindi2english(t) for t in tokens]
+
+
+def load_token_cache(path=TOKEN_CACHE):
+    """Token -> English Series (empty if there is no cache yet)"""
+    if not os.path.exists(path):
+        return pd.Series(dtype=object, name="eng")
+    cache = pd.read_parquet(path)
+    return cache.set_index("token")["eng"]
+
+
+def save_token_cache(cache, path=TOKEN_CACHE):
+    """Write the token cache atomically"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    cache.rename_axis("token").rename("eng").reset_index().to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def transliterate_tokens(tokens, cache_path=TOKEN_CACHE, n_jobs=None, chunksize=2000, save_every=20):
+    """
+    Token -> English Series for `tokens`, transliterating only those not in
+    the cache at `cache_path` (None: no cache). The cache is saved every
+    `save_every` chunks, so an interrupted run keeps most of its work.
+    """
+    cache = load_token_cache(cache_path) if cache_path else pd.Series(dtype=object, name="eng")
+    todo = pd.Index(tokens).unique().difference(cache.index)
+    print(f"{len(todo):,} new tokens ({len(cache):,} cached)")
+
+    chunks = [todo[i : i + chunksize].tolist() for i in range(0, len(todo), chunksize)]
+    parts = [cache]
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        for i, (chunk, eng) in enumerate(zip(chunks, executor.map(_transliterate_tokens, chunks)), 1):
+            parts.append(pd.Series(eng, index=chunk, dtype=object))
+            if cache_path and (i % save_every == 0 or i == len(chunks)):
+                parts = [pd.concat(parts)]
+                save_token_cache(parts[0], cache_path)
+            print(f"  {min(i * chunksize, len(todo)):,}/{len(todo):,} tokens")
+
+    return pd.concat(parts)
+
+
+@profiled
+def transliterate_names(names, cache_path=TOKEN_CACHE, n_jobs=None, chunksize=2000):
+    """
+    English transliteration of each name in `names` (a Series), word by
+    word on whitespace; missing names and names without words map to "".
+    """
+    names = pd.Series(names)
+    words = names.reset_index(drop=True).dropna().astype(str).str.split().explode().dropna()
+
+    mapping = transliterate_tokens(words, cache_path=cache_path, n_jobs=n_jobs, chunksize=chunksize)
+    eng = words.map(mapping).groupby(level=0, sort=False).agg(" ".join)
+
+    return pd.Series(eng.reindex(range(len(names)), fill_value="").values, index=names.index, name="eng_name")
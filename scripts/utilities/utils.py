@@ -1,24 +1,249 @@
+import numpy as np
 import pandas as pd
 import janitor
 import os
 import gc
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
 
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+
+from utilities.clean import clean_series
+from utilities.groups import group_codes
+from utilities.profiling import profiled
+
+LR_CSV_DIR = "../data/bihar_land_records_csv/"
+# Built from LR_CSV_DIR by `make parquet` (see utilities/build_parquet.py)
+LR_PARQUET_DIR = "../data/bihar_land_records_parquet/"
+
+# Declared schema of the land record columns, applied at read time with
+# get_fulldata(compact=True): geographies, residence and caste are
+# dictionary-encoded (categorical), names are Arrow strings rather than
+# Python objects, the area columns are 32-bit floats and account_no is an
+# integer key. Decimals are floats too: a few records have fractional
+# decimals (12.5), which the CSV readers keep and process_land_area accepts.
+_DICT_STRING = pa.dictionary(pa.int32(), pa.string())
+LR_ARROW_SCHEMA = {
+    "name_of_ryot": pa.string(),
+    "name_of_father": pa.string(),
+    "residence": _DICT_STRING,
+    "caste": _DICT_STRING,
+    "district": _DICT_STRING,
+    "division": _DICT_STRING,
+    "mouza": _DICT_STRING,
+    "account_no": pa.int64(),
+    "6": pa.float32(),  # acres
+    "7": pa.float32(),  # decimals
+    "8": pa.float32(),  # hectare
+}
+LR_PANDAS_DTYPES = {
+    "name_of_ryot": "string[pyarrow]",
+    "name_of_father": "string[pyarrow]",
+    "residence": "category",
+    "caste": "category",
+    "district": "category",
+    "division": "category",
+    "mouza": "category",
+    "account_no": "Int64",
+    "6": "float32",
+    "7": "float32",
+    "8": "float32",
+}
+# Arrow -> pandas dtypes for compact frames (dictionaries become categoricals
+# and floats keep their width without a mapper)
+_COMPACT_TYPES_MAPPER = {
+    pa.string(): pd.StringDtype("pyarrow"),
+    pa.int64(): pd.Int64Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+}.get
+
+
+def _list_csv_files(directory):
+    return [
+        os.path.join(directory, filename)
+        for filename in sorted(os.listdir(directory))
+        if filename.endswith(".csv")
+    ]
+
+
+def _read_csv_arrow(f, usecols=None, compact=False):
+    column_types = LR_ARROW_SCHEMA if compact else {}
+    return pv.read_csv(
+        f,
+        read_options=pv.ReadOptions(use_threads=True),
+        convert_options=pv.ConvertOptions(
+            include_columns=usecols, column_types=column_types
+        ),
+    )
+
+
+def _to_pandas(table, compact=False):
+    # self_destruct releases each Arrow column as soon as it is converted
+    final_frame = table.to_pandas(
+        split_blocks=True,
+        self_destruct=True,
+        types_mapper=_COMPACT_TYPES_MAPPER if compact else None,
+    )
+    del table
+    gc.collect()
+
+    return final_frame
+
+
+def _get_fulldata_arrow(directory, n_jobs=None, usecols=None, compact=False):
+    files = _list_csv_files(directory)
+    # pyarrow releases the GIL while parsing, so threads are enough to keep
+    # several files (each parsed by its own pool of reader threads) in flight
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        tables = list(pool.map(lambda f: _read_csv_arrow(f, usecols, compact), files))
+
+    # Concatenating Arrow tables only stacks the chunks (no copy), so the
+    # full frame is never held twice.
+    table = pa.concat_tables(tables, promote_options="permissive")
+    del tables
+
+    return _to_pandas(table, compact=compact)
+
+
+def _get_fulldata_parquet(directory, usecols=None, districts=None, compact=False):
+    dataset = ds.dataset(
+        directory,
+        format="parquet",
+        partitioning=ds.HivePartitioning.discover(infer_dictionary=True),
+    )
+    # Only the requested columns are decoded, and the district filter is
+    # resolved against the partition directories so other districts'
+    # files are never opened
+    filter_ = None if districts is None else ds.field("district").isin(districts)
+    table = dataset.to_table(columns=usecols, filter=filter_)
+
+    return _to_pandas(table, compact=compact)
+
+
+def _concat_frames(frames):
+    # pd.concat only keeps a categorical dtype when every frame has the same
+    # categories; otherwise the column silently falls back to object
+    for col in frames[0].select_dtypes("category").columns:
+        categories = reduce(
+            lambda a, b: a.union(b), (f[col].cat.categories for f in frames)
+        )
+        for f in frames:
+            f[col] = f[col].cat.set_categories(categories)
+    return pd.concat(frames, axis=0, ignore_index=True)
+
+
+@profiled
+def get_fulldata(
+    directory=None,
+    engine="pandas",
+    n_jobs=None,
+    districts=None,
+    compact=False,
+    **pandas_kwargs,
+):
+    """
+    Read and stack all the per-district land records.
+
+    - engine="pandas" reads the CSVs in `directory` one after another
+      with pd.read_csv
+    - engine="pyarrow" reads n_jobs CSVs at a time with pyarrow's
+      multithreaded CSV reader and builds the frame from the concatenated
+      Arrow table
+    - engine="parquet" reads the district-partitioned dataset built by
+      utilities/build_parquet.py, decoding only `usecols` and, if
+      `districts` is given, only those districts' partitions
+
+    `directory` defaults to LR_CSV_DIR (LR_PARQUET_DIR for the parquet
+    engine). The pyarrow and parquet engines only accept `usecols` (and the
+    no-op `low_memory`) as pandas_kwargs.
+
+    With compact=True the columns are read with the declared
+    LR_ARROW_SCHEMA / LR_PANDAS_DTYPES instead of pandas' defaults, which
+    roughly quarters the memory of the full table.
+    """
+    if engine in ("pyarrow", "parquet"):
+        unsupported = set(pandas_kwargs) - {"usecols", "low_memory"}
+        if unsupported:
+            raise ValueError(
+                f"Unsupported arguments for engine={engine!r}: {sorted(unsupported)}"
+            )
+    if engine == "parquet":
+        return _get_fulldata_parquet(
+            directory or LR_PARQUET_DIR,
+            usecols=pandas_kwargs.get("usecols"),
+            districts=districts,
+            compact=compact,
+        )
+    if districts is not None:
+        raise ValueError("districts is only supported with engine='parquet'")
+
+    directory = directory or LR_CSV_DIR
+    if engine == "pyarrow":
+        return _get_fulldata_arrow(
+            directory,
+            n_jobs=n_jobs,
+            usecols=pandas_kwargs.get("usecols"),
+            compact=compact,
+        )
+    if engine != "pandas":
+        raise ValueError(f"Unknown engine: {engine!r}")
+
+    if compact:
+        pandas_kwargs["dtype"] = {**LR_PANDAS_DTYPES, **pandas_kwargs.get("dtype", {})}
 
-def get_fulldata(directory="../data/bihar_land_records_csv/", **pandas_kwargs):
     final_df = []
-    for filename in os.listdir(directory):
-        if not filename.endswith('.csv'):
-            continue
-        f = os.path.join(directory, filename)
+    for f in _list_csv_files(directory):
         lr_file = pd.read_csv(f, **pandas_kwargs)
         final_df.append(lr_file)
 
-    final_frame = pd.concat(final_df, axis=0, ignore_index=True)
+    final_frame = _concat_frames(final_df)
     del final_df
     gc.collect()
 
     return final_frame
 
+def _filter_land_area(df):
+    """
+    Apply the process_land_area rules with a single row mask, so that only
+    the kept rows are copied, and count the rows each rule drops.
+    """
+    def _mask(condition):
+        # missing values (NaN or pd.NA) never satisfy a rule
+        return condition.to_numpy(dtype=bool, na_value=False)
+
+    def _float64(col):
+        # whatever the stored width (and in parquet built with integer
+        # decimals, nullability), as with the default dtypes
+        return pd.Series(df[col].to_numpy(dtype="float64", na_value=np.nan), index=df.index)
+
+    decimals = df["7"]
+    tt_area_acre = _float64("6") + _float64("7") / 100
+
+    valid_decimals = _mask((decimals >= 0) & (decimals <= 99))
+    positive_area = _mask(tt_area_acre > 0)
+    keep = valid_decimals & positive_area
+
+    counts = {
+        "rows_in": len(df),
+        "dropped_decimals": int((~valid_decimals).sum()),
+        "decimals_lt0": int(_mask(decimals < 0).sum()),
+        "decimals_gt99": int(_mask(decimals > 99).sum()),
+        "dropped_area": int((valid_decimals & ~positive_area).sum()),
+        "area_eq0": int((valid_decimals & _mask(tt_area_acre == 0)).sum()),
+        "area_lt0": int((valid_decimals & _mask(tt_area_acre < 0)).sum()),
+        "rows_out": int(keep.sum()),
+    }
+    processed = (
+        df.loc[keep]
+        .rename_columns(new_column_names={"6": "acres", "7": "decimals", "8": "hectare"})
+        .assign(tt_area_acre=tt_area_acre[keep])
+    )
+    return processed, counts
+
+
+@profiled
 def process_land_area(df):
     """
     Process land area data:
@@ -26,14 +251,233 @@ def process_land_area(df):
     - Calculate total area in acres
     - Filter positive areas only
     """
-    return (
-        df
-        .rename_columns(new_column_names={"6": "acres", "7": "decimals", "8": "hectare"})
-        .query("decimals >= 0 & decimals <= 99")
-        .assign(tt_area_acre=lambda df_: df_["acres"] + df_["decimals"] / 100)
-        .query("tt_area_acre > 0")
+    return _filter_land_area(df)[0]
+
+
+@profiled
+def clean_hindi_names(df, name_column="name_of_ryot"):
+    """
+    Aggressively clean Hindi names - keep ONLY valid Devanagari and spaces
+    (as in 20_get_ryot_hindi_caste.ipynb).
+
+    Removes punctuation and special characters, English letters and
+    numbers, Devanagari digits and Unicode control characters, then
+    collapses whitespace. Names left empty are kept (as ""). See
+    utilities/clean.py for the engine and the per-class removal counts.
+    """
+    df[name_column], _ = clean_series(df[name_column])
+    return df
+
+
+def iter_land_area(directory=None, chunksize=1_000_000, compact=False, **pandas_kwargs):
+    """
+    Stream the land record CSVs through process_land_area chunk by chunk,
+    so rejected rows are never held in memory.
+
+    Yields (chunk, counts) pairs, where counts holds the file name, chunk
+    number, rows in/out and the rows dropped by each rule:
+    - dropped_decimals: decimals outside 0-99 or missing
+      (decimals_lt0 / decimals_gt99 break the out-of-range ones down)
+    - dropped_area: valid decimals but tt_area_acre not positive
+      (area_eq0 / area_lt0 break it down)
+    """
+    if compact:
+        pandas_kwargs["dtype"] = {**LR_PANDAS_DTYPES, **pandas_kwargs.get("dtype", {})}
+
+    for f in _list_csv_files(directory or LR_CSV_DIR):
+        with pd.read_csv(f, chunksize=chunksize, **pandas_kwargs) as reader:
+            for i, chunk in enumerate(reader):
+                processed, counts = _filter_land_area(chunk)
+                yield processed, {"file": os.path.basename(f), "chunk": i, **counts}
+
+
+def get_land_area(directory=None, chunksize=1_000_000, compact=False, **pandas_kwargs):
+    """
+    Out-of-core equivalent of get_fulldata(...).pipe(process_land_area).
+
+    Returns the processed frame and a frame of per-chunk drop counts (see
+    iter_land_area); summing the counts gives the filter totals reported in
+    00_summary_basic_bihar_land_record.ipynb without extra passes.
+    """
+    final_df, counts = [], []
+    for processed, chunk_counts in iter_land_area(
+        directory, chunksize=chunksize, compact=compact, **pandas_kwargs
+    ):
+        final_df.append(processed)
+        counts.append(chunk_counts)
+
+    final_frame = _concat_frames(final_df)
+    del final_df
+    gc.collect()
+
+    return final_frame, pd.DataFrame(counts)
+
+# Percentiles reported in the tables/percentiles_*.tex tables
+NTILES = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.96, 0.97, 0.98, 0.99, 1]
+
+
+def _quantile_frame(result, q, col, groups):
+    return pd.DataFrame(
+        result,
+        index=pd.Index(q, name="Percentile"),
+        columns=[col] if groups is None else groups,
     )
 
+
+@profiled
+def quantile_table(df, col, q=NTILES, by=None):
+    """
+    Percentiles `q` of `col` for every group of `by`, from one sort.
+
+    Same linear interpolation as Series.quantile (missing values and groups
+    are skipped). Returns a frame indexed by Percentile with one column per
+    group, or a single `col` column when by=None.
+    """
+    codes, groups = group_codes(df, by)
+    values = df[col].to_numpy(dtype=float, na_value=np.nan)
+    keep = (codes >= 0) & ~np.isnan(values)
+    codes, values = codes[keep], values[keep]
+
+    # Sort once by (group, value); each group is then a contiguous sorted run
+    order = np.lexsort((values, codes))
+    values = values[order]
+    ngroups = 1 if groups is None else len(groups)
+    sizes = np.bincount(codes, minlength=ngroups)
+    starts = np.cumsum(sizes) - sizes
+
+    q = list(q)
+    pos = starts + np.asarray(q, dtype=float)[:, None] * (sizes - 1)
+    pos = np.clip(pos, 0, max(len(values) - 1, 0))
+    lo = np.floor(pos).astype(np.intp)
+    hi = np.ceil(pos).astype(np.intp)
+    if len(values):
+        result = values[lo] + (values[hi] - values[lo]) * (pos - lo)
+    else:
+        result = np.full(pos.shape, np.nan)
+    result[:, sizes == 0] = np.nan
+
+    return _quantile_frame(result, q, col, groups)
+
+
+class QuantileSketch:
+    """
+    Mergeable KLL-style quantile sketch for streams that do not fit in memory.
+
+    Values are kept in levels of at most `k` items; an item at level h stands
+    for 2**h values. When a level overflows it is sorted and every other item
+    (random offset) is promoted to the next level. The rank error of
+    quantile() is bounded by about log2(n / k) / k of the n values seen and
+    is usually far smaller; k=4096 keeps it well under 1% at 42M values.
+    Exact minimum and maximum are tracked for the 0 and 1 quantiles.
+    """
+
+    def __init__(self, k=4096, seed=None):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.n += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for h, level in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self._compress()
+        return self
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > self.k:
+                level = np.sort(level)
+                # an odd item out stays at this level
+                npairs = len(level) // 2
+                offset = self._rng.integers(2)
+                promoted = level[offset : 2 * npairs : 2]
+                self.levels[h] = level[2 * npairs :]
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def quantile(self, q):
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        if not self.n:
+            return np.full(q.shape, np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(len(level), 2.0**h) for h, level in enumerate(self.levels)]
+        )
+        order = np.argsort(items, kind="stable")
+        items, cum_weights = items[order], np.cumsum(weights[order])
+        ix = np.searchsorted(cum_weights, q * cum_weights[-1], side="left")
+        result = items[np.clip(ix, 0, len(items) - 1)]
+        result[q <= 0] = self.min
+        result[q >= 1] = self.max
+        return result
+
+
+@profiled
+def sketch_quantile_table(chunks, col, q=NTILES, by=None, k=4096, seed=None):
+    """
+    Approximate quantile_table over an iterable of frames (e.g. the chunks
+    from iter_land_area), keeping one QuantileSketch per group of `by`.
+    """
+    # one generator shared by all sketches so their compactions are independent
+    rng = np.random.default_rng(seed)
+    sketches = {}
+    categories = None
+    for chunk in chunks:
+        if by is None:
+            sketches.setdefault(col, QuantileSketch(k, rng)).update(
+                chunk[col].to_numpy(dtype=float, na_value=np.nan)
+            )
+            continue
+        if isinstance(chunk[by].dtype, pd.CategoricalDtype):
+            categories = chunk[by].cat.categories
+        codes, groups = group_codes(chunk, by)
+        values = chunk[col].to_numpy(dtype=float, na_value=np.nan)
+        for code, group in enumerate(groups):
+            sketches.setdefault(group, QuantileSketch(k, rng)).update(
+                values[codes == code]
+            )
+
+    q = list(q)
+    if by is None:
+        groups = None
+        sketch = sketches.get(col, QuantileSketch(k))
+        result = sketch.quantile(q)[:, None]
+    else:
+        # same column order as quantile_table: category order, else sorted
+        if categories is not None:
+            groups = [g for g in categories if g in sketches]
+        else:
+            groups = sorted(sketches)
+        result = np.empty((len(q), len(groups)))
+        for ix, group in enumerate(groups):
+            result[:, ix] = sketches[group].quantile(q)
+
+    return _quantile_frame(result, q, col, groups)
+
+
 def pandas_to_tex(df, texfile, index=False, **kwargs):
     if texfile.split(".")[-1] != ".tex":
         texfile += ".tex"